@@ -1,30 +1,62 @@
 from fastapi import WebSocket
-from typing import Dict, Set
+from typing import Dict, Optional, Set, Tuple, Union
 import json
 import logging
-from datetime import datetime
+import sys
+import time
 import asyncio
 
 logger = logging.getLogger(__name__)
 
+GLOBAL_TOPIC = "global"
+HEARTBEAT_TIMEOUT_SECONDS = 60
+
+
+class Connection:
+    """Bookkeeping for one client, kept small for 100k+ connections.
+
+    Topics are interned so every subscriber of a topic shares one string,
+    timestamps are monotonic floats (last_heartbeat is 0.0 until the first
+    heartbeat) and the auth token is not retained after the handshake.
+    """
+
+    __slots__ = ("client_id", "websocket", "topics", "connected_at", "last_heartbeat")
+
+    def __init__(self, client_id: str, websocket: WebSocket, topics: Tuple[str, ...]):
+        self.client_id = client_id
+        self.websocket = websocket
+        self.topics = topics
+        self.connected_at = time.monotonic()
+        self.last_heartbeat = 0.0
+
 
 class WebSocketManager:
     def __init__(self):
-        # Topic-based connection management
-        self.topics: Dict[str, Set[WebSocket]] = {
-            "global": set(),  # All connected clients
-            "company": {},  # company_id -> Set[WebSocket]
-            "user": {},  # (company_id, user_id) -> Set[WebSocket]
-        }
+        # Topic-based connection management: "company/{company_id}" and
+        # "company/{company_id}/user/{user_id}" -> subscribed connections.
+        # Every client receives "global" broadcasts, those iterate connections.
+        self.topics: Dict[str, Set[Connection]] = {}
 
         # Connection tracking
-        self.connections: Dict[str, Dict] = {}  # client_id -> connection info
+        self.connections: Dict[str, Connection] = {}  # client_id -> connection
+
+        # Cleanup task, started from the application lifespan
+        self.cleanup_task: Optional[asyncio.Task] = None
 
-        # Heartbeat tracking
-        self.last_heartbeat: Dict[str, datetime] = {}
+    def start(self):
+        """Start background tasks, must be called with a running event loop"""
+        if self.cleanup_task is None or self.cleanup_task.done():
+            self.cleanup_task = asyncio.create_task(self._cleanup_dead_connections())
 
-        # Start cleanup task
-        self.cleanup_task = asyncio.create_task(self._cleanup_dead_connections())
+    async def stop(self):
+        """Cancel background tasks and wait for them to finish"""
+        if self.cleanup_task is not None:
+            self.cleanup_task.cancel()
+            try:
+                await self.cleanup_task
+            except asyncio.CancelledError:
+                pass
+            self.cleanup_task = None
 
     async def connect(
         self, websocket: WebSocket, client_id: str, token: str, topics: list[str]
@@ -36,20 +68,21 @@ class WebSocketManager:
                 if not self._validate_topic_format(topic):
                     raise ValueError(f"Invalid topic format: {topic}")
 
-            # Store connection info
-            self.connections[client_id] = {
-                "websocket": websocket,
-                "topics": set(topics),
-                "token": token,
-                "last_activity": datetime.now(),
-            }
+            # Replace a previous connection of the same client
+            if client_id in self.connections:
+                await self.disconnect(client_id)
 
-            # Subscribe to topics
-            for topic in topics:
-                await self._subscribe_to_topic(websocket, topic)
+            # Store connection info, the token is only needed for the handshake
+            connection = Connection(
+                client_id,
+                websocket,
+                tuple(sys.intern(topic) for topic in set(topics) if topic != GLOBAL_TOPIC),
+            )
+            self.connections[client_id] = connection
 
-            # Add to global connections
-            self.topics["global"].add(websocket)
+            # Subscribe to topics
+            for topic in connection.topics:
+                self._subscribe_to_topic(connection, topic)
 
             logger.info(
                 f"Client {client_id} connected and subscribed to topics: {topics}"
@@ -61,61 +94,54 @@ class WebSocketManager:
 
     async def disconnect(self, client_id: str):
         """Handle WebSocket disconnection"""
-        if client_id in self.connections:
-            connection = self.connections[client_id]
-
+        connection = self.connections.pop(client_id, None)
+        if connection is not None:
             # Unsubscribe from all topics
-            for topic in connection["topics"]:
-                await self._unsubscribe_from_topic(connection["websocket"], topic)
-
-            # Remove from global connections
-            self.topics["global"].discard(connection["websocket"])
-
-            # Cleanup connection info
-            del self.connections[client_id]
-            if client_id in self.last_heartbeat:
-                del self.last_heartbeat[client_id]
+            for topic in connection.topics:
+                self._unsubscribe_from_topic(connection, topic)
 
             logger.info(f"Client {client_id} disconnected")
 
-    async def broadcast(self, message: dict, topic: str = "global"):
+    async def broadcast(self, message: Union[dict, str], topic: str = GLOBAL_TOPIC):
         """Broadcast message to all clients in a topic"""
         try:
-            if topic not in self.topics:
+            if topic == GLOBAL_TOPIC:
+                subscribers = list(self.connections.values())
+            elif topic in self.topics:
+                subscribers = list(self.topics[topic])
+            else:
                 logger.warning(f"Topic {topic} not found")
                 return
 
-            message_json = json.dumps(message)
-            websockets = self.topics[topic]
+            message_json = message if isinstance(message, str) else json.dumps(message)
 
-            for websocket in websockets:
+            for connection in subscribers:
                 try:
-                    await websocket.send_text(message_json)
+                    await connection.websocket.send_text(message_json)
                 except Exception as e:
                     logger.error(f"Error sending message to client: {str(e)}")
                     # Remove dead connection
-                    await self._remove_dead_connection(websocket)
+                    await self.disconnect(connection.client_id)
 
         except Exception as e:
             logger.error(f"Error in broadcast: {str(e)}")
 
-    async def send_to_client(self, client_id: str, message: dict):
+    async def send_to_client(self, client_id: str, message: Union[dict, str]):
         """Send message to specific client"""
-        if client_id in self.connections:
+        connection = self.connections.get(client_id)
+        if connection is not None:
             try:
-                message_json = json.dumps(message)
-                await self.connections[client_id]["websocket"].send_text(message_json)
+                message_json = message if isinstance(message, str) else json.dumps(message)
+                await connection.websocket.send_text(message_json)
             except Exception as e:
                 logger.error(f"Error sending message to client {client_id}: {str(e)}")
-                await self._remove_dead_connection(
-                    self.connections[client_id]["websocket"]
-                )
+                await self.disconnect(client_id)
 
     async def handle_heartbeat(self, client_id: str):
         """Handle client heartbeat"""
-        self.last_heartbeat[client_id] = datetime.now()
-        if client_id in self.connections:
-            self.connections[client_id]["last_activity"] = datetime.now()
+        connection = self.connections.get(client_id)
+        if connection is not None:
+            connection.last_heartbeat = time.monotonic()
 
     def _validate_topic_format(self, topic: str) -> bool:
         """Validate topic format"""
@@ -136,67 +162,35 @@ class WebSocketManager:
 
         return False
 
-    async def _subscribe_to_topic(self, websocket: WebSocket, topic: str):
-        """Subscribe websocket to a topic"""
-        if topic == "global":
-            self.topics["global"].add(websocket)
-            return
-
-        parts = topic.split("/")
-        if len(parts) == 2:  # company/{company_id}
-            company_id = parts[1]
-            if company_id not in self.topics["company"]:
-                self.topics["company"][company_id] = set()
-            self.topics["company"][company_id].add(websocket)
-        elif len(parts) == 4:  # company/{company_id}/user/{user_id}
-            company_id = parts[1]
-            user_id = parts[3]
-            key = f"{company_id}:{user_id}"
-            if key not in self.topics["user"]:
-                self.topics["user"][key] = set()
-            self.topics["user"][key].add(websocket)
-
-    async def _unsubscribe_from_topic(self, websocket: WebSocket, topic: str):
-        """Unsubscribe websocket from a topic"""
-        if topic == "global":
-            self.topics["global"].discard(websocket)
-            return
-
-        parts = topic.split("/")
-        if len(parts) == 2:  # company/{company_id}
-            company_id = parts[1]
-            if company_id in self.topics["company"]:
-                self.topics["company"][company_id].discard(websocket)
-        elif len(parts) == 4:  # company/{company_id}/user/{user_id}
-            company_id = parts[1]
-            user_id = parts[3]
-            key = f"{company_id}:{user_id}"
-            if key in self.topics["user"]:
-                self.topics["user"][key].discard(websocket)
-
-    async def _remove_dead_connection(self, websocket: WebSocket):
-        """Remove dead connection from all topics"""
-        # Find client_id for this websocket
-        client_id = None
-        for cid, conn in self.connections.items():
-            if conn["websocket"] == websocket:
-                client_id = cid
-                break
-
-        if client_id:
-            await self.disconnect(client_id)
+    def _subscribe_to_topic(self, connection: Connection, topic: str):
+        """Subscribe a connection to a company or company/user topic"""
+        subscribers = self.topics.get(topic)
+        if subscribers is None:
+            subscribers = self.topics[topic] = set()
+        subscribers.add(connection)
+
+    def _unsubscribe_from_topic(self, connection: Connection, topic: str):
+        """Unsubscribe a connection, dropping topics nobody listens to"""
+        subscribers = self.topics.get(topic)
+        if subscribers is not None:
+            subscribers.discard(connection)
+            if not subscribers:
+                del self.topics[topic]
 
     async def _cleanup_dead_connections(self):
         """Periodically cleanup dead connections"""
         while True:
             try:
-                current_time = datetime.now()
-                dead_clients = []
+                current_time = time.monotonic()
 
                 # Check for clients without heartbeat in last 60 seconds
-                for client_id, last_heartbeat in self.last_heartbeat.items():
-                    if (current_time - last_heartbeat).total_seconds() > 60:
-                        dead_clients.append(client_id)
+                dead_clients = [
+                    connection.client_id
+                    for connection in self.connections.values()
+                    if connection.last_heartbeat
+                    and current_time - connection.last_heartbeat
+                    > HEARTBEAT_TIMEOUT_SECONDS
+                ]
 
                 # Remove dead clients
                 for client_id in dead_clients:
@@ -205,19 +199,24 @@ class WebSocketManager:
                 # Sleep for 30 seconds
                 await asyncio.sleep(30)
 
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
                 logger.error(f"Error in cleanup task: {str(e)}")
                 await asyncio.sleep(30)  # Sleep before retrying
 
     def get_connection_stats(self) -> dict:
         """Get connection statistics"""
+        company_subscribers = 0
+        user_subscribers = 0
+        for topic, subscribers in self.topics.items():
+            if topic.count("/") == 1:
+                company_subscribers += len(subscribers)
+            else:
+                user_subscribers += len(subscribers)
         return {
             "total_connections": len(self.connections),
-            "global_subscribers": len(self.topics["global"]),
-            "company_subscribers": sum(
-                len(ws_set) for ws_set in self.topics["company"].values()
-            ),
-            "user_subscribers": sum(
-                len(ws_set) for ws_set in self.topics["user"].values()
-            ),
+            "global_subscribers": len(self.connections),
+            "company_subscribers": company_subscribers,
+            "user_subscribers": user_subscribers,
         }
@@ -1,4 +1,5 @@
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.websocket.manager import WebSocketManager
@@ -8,10 +9,18 @@ from app.core.logging_config import setup_logging
 setup_logging()
 logger = logging.getLogger(__name__)
 
+ws_manager = WebSocketManager()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    ws_manager.start()
+    yield
+    await ws_manager.stop()
+
 
 # Initialize FastAPI app
-app = FastAPI()
-ws_manager = WebSocketManager()
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -1,14 +1,55 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from src.api import websocket, notifications, auth, broadcast
+from src.api import websocket, notifications, auth, broadcast, admin, scheduled, sse, debug
 from src.core.config import settings
+from src.core.drain import drain_controller
+from src.core.fanout import fanout_scheduler
+from src.core.idempotency import idempotency_cache
+from src.core.passwords import password_verifier
+from src.core.recorder import RecordingMiddleware, traffic_recorder
+from src.core.redis_stream import stream_fanout
+from src.core.tracing import TracingMiddleware, tracer
+from src.core.redis_websocket import redis_websocket_manager
+from src.services.scheduler import schedule_service
 import logging
 
 # Setup logging
 logging.basicConfig(level=settings.LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info(f"Starting FastAPI application on port {settings.PORT}")
+    logger.info(f"CORS configured with allow_origins: {settings.CORS_ORIGINS}")
+    logger.info(
+        f"WebSocket endpoint available at: ws://0.0.0.0:{settings.PORT}/api/ws/notification"
+    )
+    logger.info(f"Using SECRET_KEY: {settings.SECRET_KEY}")
+    logger.info(f"Using ALGORITHM: {settings.ALGORITHM}")
+
+    if settings.WS_DRAIN_ON_SIGTERM:
+        drain_controller.install_sigterm_hook()
+    schedule_service.start()
+    stream_fanout.start()
+
+    yield
+
+    drain_controller.uninstall_sigterm_hook()
+    await schedule_service.stop()
+    await drain_controller.shutdown()
+    await stream_fanout.stop()
+    await fanout_scheduler.stop()
+    await redis_websocket_manager.close()
+    await idempotency_cache.close()
+    password_verifier.shutdown()
+    tracer.shutdown()
+    traffic_recorder.close()
+    print("Shutting down FastAPI application")
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -18,25 +59,32 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(TracingMiddleware)
+app.add_middleware(RecordingMiddleware)
 
 # Include routers
 app.include_router(auth.router, prefix="/api")
 app.include_router(websocket.router, prefix="/api")
 app.include_router(notifications.router, prefix="/api")
 app.include_router(broadcast.router, prefix="/api")
+app.include_router(admin.router, prefix="/api")
+app.include_router(scheduled.router, prefix="/api")
+app.include_router(sse.router, prefix="/api")
+app.include_router(debug.router, prefix="/api")
 
 
-@app.on_event("startup")
-async def startup_event():
-    logger.info(f"Starting FastAPI application on port {settings.PORT}")
-    logger.info(f"CORS configured with allow_origins: {settings.CORS_ORIGINS}")
-    logger.info(
-        f"WebSocket endpoint available at: ws://0.0.0.0:{settings.PORT}/api/ws/notification"
-    )
-    logger.info(f"Using SECRET_KEY: {settings.SECRET_KEY}")
-    logger.info(f"Using ALGORITHM: {settings.ALGORITHM}")
-
+if __name__ == "__main__":
+    import uvicorn
+    from src.core.compression import CompressedWebSocketProtocol
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    print("Shutting down FastAPI application")
+    # The WS_COMPRESSION_* settings need uvicorn's protocol class replaced,
+    # which the uvicorn command line cannot do
+    uvicorn.run(
+        "main:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        ws=CompressedWebSocketProtocol,
+        # Refuse oversized frames while reading them instead of buffering up
+        # to uvicorn's 16 MiB default; a character is at most 4 UTF-8 bytes
+        ws_max_size=4 * settings.WS_MAX_INBOUND_FRAME_SIZE,
+    )
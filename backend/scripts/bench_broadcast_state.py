@@ -0,0 +1,115 @@
+"""
+Broadcast read-state benchmark: memory of per-user read/deleted state of
+broadcasts stored once, and the cost of read checks and unread feeds.
+
+--users users are numbered up front, then --broadcasts broadcasts are
+created and each is read by --read-ratio of the users. Reported memory
+covers the bodies, bitmaps and per-user counters, next to what one
+Notification copy per user and broadcast would take.
+
+Run from the backend directory:
+
+    python scripts/bench_broadcast_state.py --users 100000 --broadcasts 50
+"""
+
+import argparse
+import gc
+import logging
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def timed(samples: int, operation) -> float:
+    started = time.perf_counter()
+    for _ in range(samples):
+        operation()
+    return (time.perf_counter() - started) / samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=100_000)
+    parser.add_argument("--broadcasts", type=int, default=50)
+    parser.add_argument("--read-ratio", type=float, default=0.5)
+    parser.add_argument("--samples", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    from src.services.notification import Notification, NotificationService
+
+    service = NotificationService(changelog_size=1)
+    users = [f"user-{i}" for i in range(args.users)]
+    # Synthetic users aren't in the directory, number them directly
+    for user_id in users:
+        service._assign_number(user_id)
+    readers = random.Random(1).sample(users, int(args.users * args.read_ratio))
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    broadcast_ids = []
+    for index in range(args.broadcasts):
+        broadcast = service.create_broadcast(
+            f"Broadcast {index}", "Maintenance tonight", data={"topic": "ops"}
+        )
+        broadcast_ids.append(broadcast.id)
+        for user_id in readers:
+            service._mark_broadcast_read(broadcast.id, user_id)
+    # Changelogs are per user and bounded, they don't grow with broadcasts
+    service.changelogs.clear()
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+
+    copy = Notification(
+        id="notif_1746245726.463395",
+        user_id="user-0",
+        title="Broadcast 0",
+        message="Maintenance tonight",
+        type="info",
+        data={"topic": "ops"},
+    )
+    copies_before = tracemalloc.get_traced_memory()[0]
+    copies = [copy.model_copy(deep=True) for _ in range(1000)]
+    copy_size = (tracemalloc.get_traced_memory()[0] - copies_before) / len(copies)
+    tracemalloc.stop()
+    del copies
+
+    bitmaps = service.get_broadcast_stats()["state_bytes"]
+    print(
+        f"total: {used / 2**20:.1f} MiB for {args.broadcasts} broadcasts x "
+        f"{args.users} users, including per-user counters and feed versions"
+    )
+    print(f"bitmaps: {bitmaps / args.broadcasts / 1024:.1f} KiB per broadcast")
+    print(
+        f"one copy per user would take about "
+        f"{copy_size * args.users * args.broadcasts / 2**20:.0f} MiB"
+    )
+
+    rng = random.Random(2)
+    pairs = [(rng.choice(broadcast_ids), rng.choice(users)) for _ in range(args.samples)]
+    pair = iter(pairs * 2)
+    has_read = timed(args.samples, lambda: service.has_read(*next(pair)))
+    feed_users = iter([rng.choice(users) for _ in range(args.samples)])
+    unread = timed(
+        min(args.samples, 200),
+        lambda: [
+            n for n in service.get_user_notifications(next(feed_users)) if not n.read
+        ],
+    )
+    count_users = iter([rng.choice(users) for _ in range(args.samples)])
+    unread_count = timed(
+        args.samples, lambda: service.get_unread_count(next(count_users))
+    )
+    print(f"has_read:          {has_read * 1e6:8.2f} us")
+    print(f"unread count:      {unread_count * 1e6:8.2f} us")
+    print(f"unread broadcasts: {unread * 1e6:8.2f} us (feed of {args.broadcasts})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+WebSocket compression benchmark: bytes on the wire and deflate CPU time of
+a broadcast with a large data dict sent to many sockets.
+
+Each socket negotiates permessage-deflate through the same extension
+factory the server uses; --broadcasts messages are then encoded for
+--sockets sockets. Modes: context takeover (one compressor per socket),
+no context takeover with and without sharing compressed payloads between
+sockets, and no compression.
+
+Run from the backend directory:
+
+    python scripts/bench_compression.py --sockets 10000 --level 6
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def notification(index: int, rng: random.Random) -> bytes:
+    """A broadcast frame with a data dict of the size producers send"""
+    message = {
+        "id": f"notif_{1746245726 + index}.463395",
+        "type": "notification",
+        "payload": {
+            "title": f"Deployment {index} finished",
+            "message": "All services are healthy",
+            "type": "info",
+            "data": {
+                "services": [
+                    {
+                        "name": f"service-{n}",
+                        "region": rng.choice(["eu-west-1", "us-east-1", "ap-south-1"]),
+                        "version": f"2.{rng.randint(0, 40)}.{rng.randint(0, 9)}",
+                        "healthy": True,
+                        "latency_ms": rng.randint(3, 90),
+                    }
+                    for n in range(40)
+                ]
+            },
+        },
+    }
+    return json.dumps(message).encode()
+
+
+def run_mode(args, payloads: list, context_takeover: bool, shared: bool) -> dict:
+    from websockets import frames
+    from src.core.compression import CompressionStats, SharedPerMessageDeflateFactory
+
+    stats = CompressionStats(shared_size=64 if shared else 0)
+    factory = SharedPerMessageDeflateFactory(
+        server_no_context_takeover=not context_takeover,
+        compress_settings={"level": args.level, "memLevel": args.mem_level},
+        min_size=args.min_size,
+        stats=stats,
+    )
+    extensions = [factory.process_request_params([], [])[1] for _ in range(args.sockets)]
+
+    started = time.perf_counter()
+    for payload in payloads:
+        for extension in extensions:
+            # Every socket encodes its own copy, as a str sent per socket would
+            extension.encode(frames.Frame(frames.OP_TEXT, bytes(payload)))
+    elapsed = time.perf_counter() - started
+    return {"stats": stats.get_stats(), "elapsed": elapsed}
+
+
+def report(name: str, result: dict, frames_sent: int, raw_bytes: int):
+    stats = result["stats"]
+    sent = stats["bytes_out"] + stats["bytes_skipped"]
+    print(
+        f"{name:<26} wire {sent / frames_sent:8.0f} B/frame "
+        f"({sent / raw_bytes:6.1%})  deflate cpu {stats['cpu_seconds'] * 1000:9.1f} ms  "
+        f"wall {result['elapsed'] * 1000:9.1f} ms  "
+        f"shared {stats['frames_shared']}/{frames_sent}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sockets", type=int, default=10_000)
+    parser.add_argument("--broadcasts", type=int, default=5)
+    parser.add_argument("--level", type=int, default=6)
+    parser.add_argument("--mem-level", type=int, default=8)
+    parser.add_argument("--min-size", type=int, default=256)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    rng = random.Random(1)
+    payloads = [notification(index, rng) for index in range(args.broadcasts)]
+    frames_sent = args.sockets * args.broadcasts
+    raw_bytes = sum(len(payload) for payload in payloads) * args.sockets
+    print(
+        f"{args.broadcasts} broadcasts of ~{raw_bytes // frames_sent} B "
+        f"to {args.sockets} sockets"
+    )
+    print(f"{'uncompressed':<26} wire {raw_bytes / frames_sent:8.0f} B/frame")
+    for name, context_takeover, shared in (
+        ("context takeover", True, False),
+        ("no takeover, per socket", False, False),
+        ("no takeover, shared", False, True),
+    ):
+        report(name, run_mode(args, payloads, context_takeover, shared), frames_sent, raw_bytes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Connection manager benchmark: the same workload against every
+CONNECTION_MANAGER_BACKEND.
+
+--users users connect one in-process socket each, then every user gets
+--messages personal messages through enqueue() and --messages broadcasts
+go to everyone; each phase is timed until the last frame is written.
+Finally every socket disconnects. The redis backend does a presence
+round trip per connect and disconnect, so it needs a reachable REDIS_URL.
+
+Run from the backend directory:
+
+    python scripts/bench_connection_managers.py --users 10000 --backends memory,topic
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from check_connection_managers import create_manager
+
+
+class CountingSocket:
+    """Counts frames and wakes the benchmark once all of them are written"""
+
+    pending = 0
+    done: asyncio.Event
+
+    async def send_text(self, message: str):
+        CountingSocket.pending -= 1
+        if CountingSocket.pending == 0:
+            CountingSocket.done.set()
+
+
+async def written(frames: int, deliver) -> float:
+    CountingSocket.pending = frames
+    CountingSocket.done = asyncio.Event()
+    started = time.perf_counter()
+    await deliver()
+    await CountingSocket.done.wait()
+    return time.perf_counter() - started
+
+
+async def bench(backend: str, args) -> dict:
+    manager = create_manager(backend)
+    users = [f"user-{i}" for i in range(args.users)]
+    sockets = [CountingSocket() for _ in users]
+    results = {}
+
+    started = time.perf_counter()
+    for user_id, websocket in zip(users, sockets):
+        await manager.connect(websocket, user_id)
+    results["connect"] = time.perf_counter() - started
+
+    async def personal():
+        for index in range(args.messages):
+            message = f'{{"n":{index}}}'
+            for user_id in users:
+                manager.enqueue(user_id, message)
+
+    async def broadcast():
+        for index in range(args.messages):
+            await manager.broadcast(f'{{"all":{index}}}')
+
+    frames = args.users * args.messages
+    results["enqueue"] = await written(frames, personal)
+    results["broadcast"] = await written(frames, broadcast)
+
+    started = time.perf_counter()
+    for user_id, websocket in zip(users, sockets):
+        await manager.disconnect(websocket, user_id)
+    results["disconnect"] = time.perf_counter() - started
+
+    presence = getattr(manager, "presence", None)
+    if presence is not None:
+        await presence.close()
+    return results
+
+
+def report(backend: str, results: dict, args):
+    frames = args.users * args.messages
+    print(
+        f"{backend:<8} connect {args.users / results['connect']:9.0f}/s  "
+        f"enqueue {frames / results['enqueue']:9.0f} frames/s  "
+        f"broadcast {frames / results['broadcast']:9.0f} frames/s  "
+        f"disconnect {args.users / results['disconnect']:9.0f}/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--messages", type=int, default=5)
+    parser.add_argument("--backends", default="memory,topic")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    for backend in args.backends.split(","):
+        backend = backend.strip()
+        report(backend, asyncio.run(bench(backend, args)), args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Connection memory benchmark: bytes of manager bookkeeping per idle
+connection in app.core.websocket.manager, at 10k and 100k connections.
+
+Every client subscribes to "global", its company and its own user topic,
+like the dashboard does. The sockets themselves are empty stand-ins, so
+only what the manager keeps per connection is counted. --legacy adds the
+previous layout (a dict per connection with a topic set, the token and a
+datetime, a separate heartbeat dict and a global socket set) for comparison.
+
+Run from the backend directory:
+
+    python scripts/bench_connection_memory.py --sizes 10000 100000 --legacy
+"""
+
+import argparse
+import asyncio
+import gc
+import importlib
+import logging
+import os
+import sys
+import tracemalloc
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+COMPANIES = 100
+TOKEN = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9." + "x" * 120 + "." + "y" * 43
+
+
+class IdleSocket:
+    __slots__ = ()
+
+
+def client_topics(i: int) -> list:
+    company = f"c{i % COMPANIES}"
+    return ["global", f"company/{company}", f"company/{company}/user/u{i}"]
+
+
+def measure(build, size: int) -> float:
+    sockets = [IdleSocket() for _ in range(size)]
+    client_ids = [f"client-{i}" for i in range(size)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    manager = build(sockets, client_ids)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del manager
+    return used / size
+
+
+def build_current(sockets: list, client_ids: list):
+    from app.core.websocket.manager import WebSocketManager
+
+    manager = WebSocketManager()
+
+    async def connect_all():
+        for i, (websocket, client_id) in enumerate(zip(sockets, client_ids)):
+            await manager.connect(websocket, client_id, TOKEN, client_topics(i))
+
+    asyncio.run(connect_all())
+    return manager
+
+
+def build_legacy(sockets: list, client_ids: list):
+    topics = {"global": set(), "company": {}, "user": {}}
+    connections = {}
+    last_heartbeat = {}
+    for i, (websocket, client_id) in enumerate(zip(sockets, client_ids)):
+        subscribed = client_topics(i)
+        connections[client_id] = {
+            "websocket": websocket,
+            "topics": set(subscribed),
+            # A fresh copy per connection, as decoded from the query string
+            "token": "".join(TOKEN),
+            "last_activity": datetime.now(),
+        }
+        last_heartbeat[client_id] = datetime.now()
+        topics["global"].add(websocket)
+        for topic in subscribed[1:]:
+            parts = topic.split("/")
+            if len(parts) == 2:
+                topics["company"].setdefault(parts[1], set()).add(websocket)
+            else:
+                key = f"{parts[1]}:{parts[3]}"
+                topics["user"].setdefault(key, set()).add(websocket)
+    return topics, connections, last_heartbeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--legacy", action="store_true", help="also measure the previous layout")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    # Import outside the traced window, module code is not per-connection
+    importlib.import_module("app.core.websocket.manager")
+
+    layouts = [("slots record", build_current)]
+    if args.legacy:
+        layouts.append(("legacy dict", build_legacy))
+
+    for size in args.sizes:
+        for name, build in layouts:
+            per_connection = measure(build, size)
+            print(
+                f"{name:<14} {size:>8} connections  "
+                f"{per_connection:7.0f} bytes/connection  "
+                f"{per_connection * size / 2**20:8.1f} MiB total"
+            )
+
+
+if __name__ == "__main__":
+    main()
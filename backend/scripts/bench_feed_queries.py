@@ -0,0 +1,91 @@
+"""
+Feed query benchmark: "since id" and time-range lookups in the sorted id
+indexes, against filtering the whole feed, and id generation throughput.
+
+One user gets --notifications notifications and there are --broadcasts
+broadcasts, interleaved. Queries ask for the newest --tail items, by
+after_id and by since/until.
+
+Run from the backend directory:
+
+    python scripts/bench_feed_queries.py --notifications 10000
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+def timed(samples: int, operation) -> float:
+    started = time.perf_counter()
+    for _ in range(samples):
+        operation()
+    return (time.perf_counter() - started) / samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--notifications", type=int, default=10_000)
+    parser.add_argument("--broadcasts", type=int, default=100)
+    parser.add_argument("--tail", type=int, default=20)
+    parser.add_argument("--samples", type=int, default=200)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    from src.core.ids import IdGenerator
+    from src.services.notification import NotificationService
+
+    generator = IdGenerator(node=0)
+    count = 1_000_000
+    started = time.perf_counter()
+    for _ in range(count):
+        generator.next_id("notif_")
+    elapsed = time.perf_counter() - started
+    print(
+        f"id generation: {count / elapsed:,.0f} ids/s, "
+        f"{generator.get_stats()['borrowed_ms']} ms borrowed"
+    )
+
+    service = NotificationService()
+    every = max(1, args.notifications // max(1, args.broadcasts))
+    for index in range(args.notifications):
+        service.create_notification("user1", f"Notification {index}", "body")
+        if index % every == 0:
+            service.create_broadcast(f"Broadcast {index}", "body")
+    feed = service.get_user_notifications("user1")
+    after = feed[-args.tail - 1]
+    since = datetime.fromisoformat(feed[-args.tail].created_at)
+
+    def scan_after_id():
+        notifications = service.get_user_notifications("user1")
+        position = next(i for i, n in enumerate(notifications) if n.id == after.id)
+        return notifications[position + 1 :]
+
+    def scan_since():
+        return [
+            n
+            for n in service.get_user_notifications("user1")
+            if datetime.fromisoformat(n.created_at) >= since
+        ]
+
+    print(f"feed of {len(feed)} items, asking for the newest {args.tail}")
+    results = {
+        "after_id, index seek": lambda: service.find_notifications(
+            "user1", after_id=after.id
+        ),
+        "after_id, feed scan": scan_after_id,
+        "since, index seek": lambda: service.find_notifications("user1", since=since),
+        "since, feed scan": scan_since,
+    }
+    for name, operation in results.items():
+        print(f"{name:<22} {timed(args.samples, operation) * 1e6:10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
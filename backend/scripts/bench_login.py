@@ -0,0 +1,192 @@
+"""
+Login burst benchmark: login throughput and WebSocket fan-out latency,
+first with no logins and then while a burst of concurrent logins runs.
+
+Fan-out latency is measured from sending POST /api/notifications/send to
+the message arriving on every connected socket. With password checks off
+the event loop it should stay flat during the burst.
+
+Run from the backend directory:
+
+    python scripts/bench_login.py --duration 10 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+SOCKET_USERS = ["admin", "user1", "user2"]
+LOGIN = {"username": "admin", "password": "wkwkwk"}
+
+
+class Probes:
+    """Send times of fan-out probes and their arrival on each socket"""
+
+    def __init__(self, sockets: int):
+        self.sockets = sockets
+        self.sent_at = {}
+        self.arrivals = {}
+        self.latencies = []
+
+    def arrived(self, probe_id: str):
+        if probe_id not in self.sent_at:
+            return
+        self.arrivals[probe_id] = self.arrivals.get(probe_id, 0) + 1
+        if self.arrivals[probe_id] == self.sockets:
+            self.latencies.append(time.perf_counter() - self.sent_at.pop(probe_id))
+
+
+async def receive(ws, probes: Probes):
+    async for raw in ws:
+        message = json.loads(raw)
+        if message.get("type") == "notification":
+            probes.arrived(message["payload"]["title"])
+
+
+async def send_probes(client, base_url: str, probes: Probes, stop: asyncio.Event, interval: float):
+    sequence = 0
+    while not stop.is_set():
+        probe_id = f"probe-{sequence}"
+        sequence += 1
+        probes.sent_at[probe_id] = time.perf_counter()
+        await client.post(
+            f"{base_url}/notifications/send",
+            json={"title": probe_id, "message": "bench", "priority": "normal", "topic": "bench"},
+        )
+        await asyncio.sleep(interval)
+
+
+async def login_loop(client, base_url: str, stop: asyncio.Event, counts: dict):
+    while not stop.is_set():
+        response = await client.post(f"{base_url}/auth/login", json=LOGIN)
+        if response.status_code == 200:
+            counts["ok"] += 1
+        elif response.status_code == 503:
+            counts["rejected"] += 1
+            await asyncio.sleep(float(response.headers.get("retry-after", 1)))
+        else:
+            counts["failed"] += 1
+
+
+async def run_phase(client, base_url, sockets, args, logins: int) -> tuple:
+    probes = Probes(len(sockets))
+    receivers = [asyncio.create_task(receive(ws, probes)) for ws in sockets]
+    stop = asyncio.Event()
+    counts = {"ok": 0, "rejected": 0, "failed": 0}
+    tasks = [asyncio.create_task(send_probes(client, base_url, probes, stop, args.interval))]
+    tasks += [
+        asyncio.create_task(login_loop(client, base_url, stop, counts))
+        for _ in range(logins)
+    ]
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*tasks)
+    # Give the last probes time to arrive
+    await asyncio.sleep(0.5)
+    for receiver in receivers:
+        receiver.cancel()
+    await asyncio.gather(*receivers, return_exceptions=True)
+    return probes.latencies, counts
+
+
+async def wait_until_ready(client, base_url: str, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            await client.get(f"{base_url}/docs")
+            return
+        except Exception:
+            await asyncio.sleep(0.05)
+    raise TimeoutError("Server did not start in time")
+
+
+async def bench(args):
+    import httpx
+    import websockets
+    from src.api.auth import create_access_token
+
+    base_url = f"http://127.0.0.1:{args.port}/api"
+    async with httpx.AsyncClient(timeout=30) as client:
+        await wait_until_ready(client, base_url, args.timeout)
+        sockets = []
+        for username in SOCKET_USERS:
+            token = create_access_token(data={"sub": username})
+            sockets.append(
+                await websockets.connect(
+                    f"ws://127.0.0.1:{args.port}/api/ws/notification?token={token}",
+                    origin="http://localhost",
+                )
+            )
+        try:
+            baseline, _ = await run_phase(client, base_url, sockets, args, 0)
+            burst, counts = await run_phase(client, base_url, sockets, args, args.concurrency)
+        finally:
+            for ws in sockets:
+                await ws.close()
+
+    report("fan-out, idle", baseline)
+    report("fan-out, login burst", burst)
+    print(
+        f"logins: {counts['ok'] / args.duration:.1f}/s ok, "
+        f"{counts['rejected']} rejected (503), {counts['failed']} failed"
+    )
+
+
+def report(name: str, samples: list):
+    if not samples:
+        print(f"{name:<22} no samples")
+        return
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(
+        f"{name:<22} p50 {statistics.median(samples) * 1000:7.1f} ms  "
+        f"p99 {p99 * 1000:7.1f} ms  max {samples[-1] * 1000:7.1f} ms  (n={len(samples)})"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent login loops")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between probes")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    env = dict(os.environ, LOG_LEVEL="WARNING")
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--port",
+            str(args.port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        asyncio.run(bench(args))
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Startup benchmark: import time of the application module and time from
+process spawn to the first accepted WebSocket on /api/ws/notification.
+
+Run from the backend directory:
+
+    python scripts/bench_startup.py --runs 5
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import main; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def measure_import_time() -> float:
+    output = subprocess.check_output(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=BACKEND_DIR,
+        stderr=subprocess.DEVNULL,
+    )
+    return float(output.decode().strip().splitlines()[-1])
+
+
+async def wait_for_first_socket(url: str, origin: str, timeout: float) -> float:
+    import websockets
+
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            async with websockets.connect(url, origin=origin, open_timeout=1) as ws:
+                await ws.send('{"type":"ping"}')
+                await asyncio.wait_for(ws.recv(), timeout=1)
+                return time.perf_counter()
+        except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException):
+            await asyncio.sleep(0.01)
+    raise TimeoutError("Server did not accept a WebSocket in time")
+
+
+def measure_first_socket(port: int, timeout: float) -> float:
+    from src.api.auth import create_access_token
+
+    token = create_access_token(data={"sub": "admin"})
+    url = f"ws://127.0.0.1:{port}/api/ws/notification?token={token}"
+    env = dict(os.environ, LOG_LEVEL="WARNING")
+
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        accepted_at = asyncio.run(
+            wait_for_first_socket(url, "http://localhost", timeout)
+        )
+        return accepted_at - start
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+def report(name: str, samples: list):
+    print(
+        f"{name:<22} median {statistics.median(samples) * 1000:8.1f} ms  "
+        f"min {min(samples) * 1000:8.1f} ms  max {max(samples) * 1000:8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    import_times = [measure_import_time() for _ in range(args.runs)]
+    first_socket_times = [
+        measure_first_socket(args.port, args.timeout) for _ in range(args.runs)
+    ]
+
+    report("import main", import_times)
+    report("spawn -> first socket", first_socket_times)
+
+
+if __name__ == "__main__":
+    main()
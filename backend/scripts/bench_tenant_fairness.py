@@ -0,0 +1,101 @@
+"""
+Tenant fairness benchmark: fan-out latency of a small company while a
+large company floods the scheduler with broadcasts.
+
+A large tenant submits --big-broadcasts messages to --big-users sockets
+at once; meanwhile the small tenant sends a message to --small-users
+sockets every --interval seconds. Latency is from submit until the
+message is on every recipient's connection queue. "shared" runs every
+job as one tenant (plain round-robin over jobs), "per-company" accounts
+jobs to their company.
+
+Run from the backend directory:
+
+    python scripts/bench_tenant_fairness.py --big-users 20000 --big-broadcasts 20
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+class IdleSocket:
+    """Accepts every write immediately"""
+
+    async def send_text(self, message: str):
+        pass
+
+
+async def run_mode(args, big_users: list, small_users: list, per_company: bool) -> list:
+    from src.core.fanout import FanoutScheduler
+
+    scheduler = FanoutScheduler()
+    big_tenant = "big_company" if per_company else None
+    small_tenant = "small_company" if per_company else None
+
+    for index in range(args.big_broadcasts):
+        scheduler.submit(big_users, f"big-{index}", tenant=big_tenant)
+
+    latencies = []
+    while scheduler._pending():
+        started = time.perf_counter()
+        await scheduler.deliver(small_users, "small", tenant=small_tenant)
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(args.interval)
+    await scheduler.stop()
+    return latencies
+
+
+async def bench(args):
+    from src.core.websocket import websocket_manager
+
+    big_users = [f"big-{i}" for i in range(args.big_users)]
+    small_users = [f"small-{i}" for i in range(args.small_users)]
+    sockets = {}
+    for user_id in big_users + small_users:
+        sockets[user_id] = IdleSocket()
+        await websocket_manager.connect(sockets[user_id], user_id)
+
+    try:
+        for name, per_company in (("shared", False), ("per-company", True)):
+            report(name, await run_mode(args, big_users, small_users, per_company))
+            # Let the socket writers drain before the next run
+            await asyncio.sleep(0.5)
+    finally:
+        for user_id, websocket in sockets.items():
+            websocket_manager.disconnect(websocket, user_id)
+
+
+def report(name: str, samples: list):
+    if not samples:
+        print(f"{name:<12} no samples")
+        return
+    samples = sorted(samples)
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    print(
+        f"{name:<12} small tenant p50 {statistics.median(samples) * 1000:7.1f} ms  "
+        f"p99 {p99 * 1000:7.1f} ms  max {samples[-1] * 1000:7.1f} ms  (n={len(samples)})"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--big-users", type=int, default=20000)
+    parser.add_argument("--big-broadcasts", type=int, default=20)
+    parser.add_argument("--small-users", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.005, help="seconds between small sends")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    asyncio.run(bench(args))
+
+
+if __name__ == "__main__":
+    main()
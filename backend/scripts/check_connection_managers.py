@@ -0,0 +1,401 @@
+"""
+Connection manager conformance: runs the same checks against every
+CONNECTION_MANAGER_BACKEND, so the backends stay interchangeable.
+
+Each check gets a fresh manager and in-process fake sockets. The redis
+backend needs a reachable REDIS_URL for its presence index; without one
+its checks are reported as skipped, not passed.
+
+Run from the backend directory:
+
+    python scripts/check_connection_managers.py --backends memory,redis,topic
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import uuid
+from typing import Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+class FakeSocket:
+    """Keeps every frame written to it"""
+
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.frames = []
+
+    async def send_text(self, message: str):
+        await asyncio.sleep(0)
+        if self.fail:
+            raise ConnectionResetError("socket closed by peer")
+        self.frames.append(message)
+
+
+def create_manager(backend: str):
+    """A manager with its own state, unlike the global connection_manager"""
+    from src.core import connection_manager
+    from src.core.websocket import WebSocketManager
+
+    if backend == "memory":
+        return connection_manager.InMemoryConnectionManager(WebSocketManager())
+    if backend == "redis":
+        from src.core.redis_websocket import RedisWebSocketManager
+
+        return connection_manager.RedisConnectionManager(
+            WebSocketManager(), RedisWebSocketManager()
+        )
+    if backend == "topic":
+        from app.core.websocket.manager import WebSocketManager as TopicManager
+
+        return connection_manager.TopicConnectionManager(TopicManager())
+    raise ValueError(f"Unknown backend {backend!r}")
+
+
+async def eventually(condition, timeout: float = 1.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.001)
+    return True
+
+
+async def settle():
+    """Give queued writes a chance to happen"""
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+async def check_protocol(manager):
+    from src.core.connection_manager import ConnectionManager
+
+    assert isinstance(manager, ConnectionManager), "does not implement ConnectionManager"
+
+
+async def check_connect(manager):
+    version = manager.version
+    await manager.connect(FakeSocket(), "alice")
+    assert manager.is_connected("alice"), "alice not connected"
+    assert not manager.is_connected("bob"), "bob connected without a socket"
+    assert manager.connected_users() == ["alice"], manager.connected_users()
+    assert manager.connection_count() == 1, manager.connection_count()
+    assert manager.version != version, "version unchanged by a new user"
+
+
+async def check_personal_message(manager):
+    alice, bob = FakeSocket(), FakeSocket()
+    await manager.connect(alice, "alice")
+    await manager.connect(bob, "bob")
+    await manager.send_personal_message('{"n":1}', "alice")
+    assert await eventually(lambda: alice.frames == ['{"n":1}']), alice.frames
+    await settle()
+    assert bob.frames == [], "bob received alice's message"
+
+
+async def check_enqueue(manager):
+    alice, bob = FakeSocket(), FakeSocket()
+    await manager.connect(alice, "alice")
+    await manager.connect(bob, "bob")
+    manager.enqueue("alice", '{"n":1}')
+    manager.enqueue("nobody", '{"n":2}')
+    assert await eventually(lambda: alice.frames == ['{"n":1}']), alice.frames
+    await settle()
+    assert bob.frames == [], "bob received alice's message"
+
+
+async def check_order(manager):
+    alice = FakeSocket()
+    await manager.connect(alice, "alice")
+    expected = [f'{{"n":{n}}}' for n in range(100)]
+    for message in expected:
+        manager.enqueue("alice", message)
+    assert await eventually(lambda: len(alice.frames) == 100), len(alice.frames)
+    assert alice.frames == expected, "messages of one lane out of order"
+
+
+async def check_lanes(manager):
+    from src.core.priority import HIGH, LOW
+
+    alice = FakeSocket()
+    await manager.connect(alice, "alice")
+    # Queued before the writer runs, so the lanes decide the order
+    for n in range(3):
+        manager.enqueue("alice", f"chatter {n}", lane=LOW)
+    manager.enqueue("alice", "status v1", collapse_key="status", lane=LOW)
+    manager.enqueue("alice", "status v2", collapse_key="status", lane=HIGH)
+    assert await eventually(lambda: len(alice.frames) == 4), alice.frames
+    expected = ["status v2", "chatter 0", "chatter 1", "chatter 2"]
+    assert alice.frames == expected, "collapsed update kept its old lane"
+
+
+async def check_broadcast(manager):
+    alice, bob = FakeSocket(), FakeSocket()
+    await manager.connect(alice, "alice")
+    await manager.connect(bob, "bob")
+    await manager.broadcast('{"all":1}')
+    assert await eventually(
+        lambda: alice.frames == ['{"all":1}'] and bob.frames == ['{"all":1}']
+    ), (alice.frames, bob.frames)
+
+
+async def check_multiple_sockets(manager):
+    phone, laptop = FakeSocket(), FakeSocket()
+    await manager.connect(phone, "alice")
+    version = manager.version
+    await manager.connect(laptop, "alice")
+    assert manager.version == version, "version changed by a second socket"
+    assert manager.connection_count() == 2, manager.connection_count()
+    assert sorted(user for user, _ in manager.connections()) == ["alice", "alice"]
+    manager.enqueue("alice", '{"n":1}')
+    assert await eventually(
+        lambda: phone.frames == ['{"n":1}'] and laptop.frames == ['{"n":1}']
+    ), (phone.frames, laptop.frames)
+
+    await manager.disconnect(phone, "alice")
+    assert manager.is_connected("alice"), "alice lost with a socket left"
+    assert manager.version == version, "version changed with a socket left"
+    manager.enqueue("alice", '{"n":2}')
+    assert await eventually(lambda: len(laptop.frames) == 2), laptop.frames
+    assert phone.frames == ['{"n":1}'], "disconnected socket still written to"
+
+
+async def check_disconnect(manager):
+    alice = FakeSocket()
+    await manager.connect(alice, "alice")
+    version = manager.version
+    await manager.disconnect(alice, "alice")
+    assert not manager.is_connected("alice"), "alice still connected"
+    assert manager.connection_count() == 0, manager.connection_count()
+    assert manager.connections() == [], manager.connections()
+    assert manager.version != version, "version unchanged by a user leaving"
+    manager.enqueue("alice", '{"n":1}')
+    await manager.broadcast('{"all":1}')
+    await settle()
+    assert alice.frames == [], "disconnected socket still written to"
+
+
+async def check_double_disconnect(manager):
+    alice = FakeSocket()
+    await manager.connect(alice, "alice")
+    await manager.disconnect(alice, "alice")
+    version = manager.version
+    await manager.disconnect(alice, "alice")
+    await manager.disconnect(FakeSocket(), "nobody")
+    assert manager.version == version, "version changed by a no-op disconnect"
+
+
+async def check_failing_socket(manager):
+    broken, bob = FakeSocket(fail=True), FakeSocket()
+    await manager.connect(broken, "alice")
+    await manager.connect(bob, "bob")
+    await manager.broadcast('{"all":1}')
+    assert await eventually(lambda: bob.frames == ['{"all":1}']), bob.frames
+    assert await eventually(
+        lambda: not manager.is_connected("alice")
+    ), "socket kept after a failed write"
+    assert manager.connected_users() == ["bob"], manager.connected_users()
+    from src.core.subscriptions import subscription_index
+
+    assert (
+        broken not in subscription_index.owners
+    ), "subscriptions kept after a failed write"
+    await manager.disconnect(broken, "alice")
+    failed = manager.get_connection_report("slowest", 10)["recently_failed"]
+    assert [(c["user_id"], c["send_errors"]) for c in failed] == [("alice", 1)], failed
+
+
+async def check_evict_oldest(manager):
+    oldest, middle, newest = FakeSocket(), FakeSocket(), FakeSocket()
+    for websocket in (oldest, middle, newest):
+        await manager.connect(websocket, "alice")
+        await asyncio.sleep(0.001)
+    assert await manager.evict_oldest("alice", 3) == [], "evicted within the limit"
+    evicted = await manager.evict_oldest("alice", 1)
+    assert evicted == [oldest, middle], "not the oldest sockets evicted"
+    assert manager.connection_count() == 1, manager.connection_count()
+    assert manager.is_connected("alice"), "alice lost with a socket left"
+    manager.enqueue("alice", '{"n":1}')
+    assert await eventually(lambda: newest.frames == ['{"n":1}']), newest.frames
+    assert oldest.frames == [] and middle.frames == [], "evicted socket written to"
+
+
+async def check_stats(manager):
+    alice, bob = FakeSocket(), FakeSocket()
+    await manager.connect(alice, "alice")
+    await manager.connect(bob, "bob")
+    for _ in range(3):
+        manager.record_received(bob, 10)
+    manager.record_received(alice, 10)
+    manager.record_received(FakeSocket(), 10)
+    manager.enqueue("alice", '{"n":1}')
+    assert await eventually(lambda: alice.frames == ['{"n":1}']), alice.frames
+    await settle()
+
+    noisiest = manager.get_connection_report("noisiest", 10)
+    assert noisiest["total_connections"] == 2, noisiest
+    top = noisiest["connections"][0]
+    assert (top["user_id"], top["messages_received"], top["bytes_received"]) == (
+        "bob",
+        3,
+        30,
+    ), top
+    # Ranked by receive rate, bob's three frames beat alice's one
+    assert [c["user_id"] for c in noisiest["connections"]] == ["bob", "alice"], noisiest
+    assert top["received_per_second"] > 0, top
+    slowest = manager.get_connection_report("slowest", 10)
+    assert [c["user_id"] for c in slowest["connections"]] == ["alice"], slowest
+    assert slowest["connections"][0]["messages_sent"] == 1, slowest
+    assert "queued" in manager.get_queue_stats(), manager.get_queue_stats()
+
+    await manager.disconnect(bob, "bob")
+    noisiest = manager.get_connection_report("noisiest", 10)
+    assert noisiest["total_connections"] == 1, "stats kept after disconnect"
+    assert [c["user_id"] for c in noisiest["connections"]] == ["alice"], noisiest
+    assert noisiest["recently_failed"] == [], "disconnect reported as a failure"
+
+
+def event_id(frame: bytes) -> int:
+    return int(frame.split(b"\n", 1)[0].split(b":", 1)[1])
+
+
+async def check_sse_resume(manager):
+    from src.core.sse import SSEConnection, sse_hub
+
+    # The hub is shared by every manager, so the user is one of its own
+    user_id = f"sse-{uuid.uuid4().hex}"
+    stream = SSEConnection(sse_hub, user_id)
+    sse_hub.subscribe(user_id, None)
+    await manager.connect(stream, user_id)
+    frames = []
+
+    async def read():
+        async for frame in stream.stream([]):
+            frames.append(frame)
+
+    reader = asyncio.get_running_loop().create_task(read())
+    try:
+        # One at a time: the topic backend does not order enqueue() against
+        # the awaited sends
+        manager.enqueue(user_id, '{"n":1}')
+        assert await eventually(lambda: len(frames) == 1), frames
+        await manager.send_personal_message('{"n":2}', user_id)
+        assert await eventually(lambda: len(frames) == 2), frames
+        await manager.broadcast('{"n":3}')
+        assert await eventually(lambda: len(frames) == 3), frames
+        await stream.close()
+        await manager.disconnect(stream, user_id)
+        sse_hub.unsubscribe(user_id)
+
+        # Published while the stream is away
+        manager.enqueue(user_id, '{"n":4}')
+        missed = sse_hub.subscribe(user_id, event_id(frames[0]))
+        assert missed[:2] == frames[1:], f"resume replays {missed}, got {frames}"
+        assert len(missed) == 3 and b'{"n":4}' in missed[2], missed
+        ids = [event_id(frame) for frame in frames + missed[2:]]
+        assert ids == sorted(set(ids)), f"event ids not increasing: {ids}"
+    finally:
+        reader.cancel()
+        sse_hub.unsubscribe(user_id)
+        sse_hub._forget(user_id)
+
+
+async def check_presence(manager):
+    alice = FakeSocket()
+    await manager.connect(alice, "alice")
+    assert await manager.presence.is_online("alice"), "alice not in the presence index"
+    await manager.disconnect(alice, "alice")
+    assert not await manager.presence.is_online("alice"), "alice still present"
+
+
+CHECKS = [
+    check_protocol,
+    check_connect,
+    check_personal_message,
+    check_enqueue,
+    check_order,
+    check_lanes,
+    check_broadcast,
+    check_multiple_sockets,
+    check_disconnect,
+    check_double_disconnect,
+    check_failing_socket,
+    check_evict_oldest,
+    check_stats,
+    check_sse_resume,
+]
+
+# Checks of what only one backend does
+BACKEND_CHECKS = {"redis": [check_presence]}
+
+
+async def presence_error(backend: str) -> Optional[str]:
+    """Why the redis backend can't be checked, None if it can"""
+    if backend != "redis":
+        return None
+    from src.core.redis_websocket import RedisWebSocketManager
+
+    presence = RedisWebSocketManager()
+    try:
+        await asyncio.wait_for(presence.redis_client.ping(), timeout=2)
+        return None
+    except Exception as e:
+        return f"presence index at {presence.redis_url} unreachable: {e!r}"
+    finally:
+        await presence.close()
+
+
+async def run_backend(backend: str) -> Tuple[int, int]:
+    """Run the checks of one backend, return (failures, skipped)"""
+    checks = CHECKS + BACKEND_CHECKS.get(backend, [])
+    print(backend)
+    error = await presence_error(backend)
+    if error is not None:
+        print(f"  SKIP {len(checks)} checks: {error}")
+        return 0, len(checks)
+    failures = 0
+    for check in checks:
+        manager = create_manager(backend)
+        try:
+            await check(manager)
+            print(f"  PASS {check.__name__}")
+        except Exception as e:
+            failures += 1
+            print(f"  FAIL {check.__name__}: {e!r}")
+        finally:
+            for user_id, websocket in manager.connections():
+                await manager.disconnect(websocket, user_id)
+            presence = getattr(manager, "presence", None)
+            if presence is not None:
+                await presence.close()
+    return failures, 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backends", default="memory,redis,topic")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    failures = skipped = 0
+    for backend in args.backends.split(","):
+        backend_failures, backend_skipped = asyncio.run(run_backend(backend.strip()))
+        failures += backend_failures
+        skipped += backend_skipped
+    if failures:
+        print(f"{failures} failed, {skipped} skipped")
+    elif skipped:
+        print(f"checks passed, {skipped} skipped")
+    else:
+        print("all checks passed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+Cross-node stream checks: runs the Redis stream delivery path (XADD,
+XREADGROUP, XACK, XTRIM, stale group cleanup) against a real Redis.
+
+Each check uses its own stream key, deleted afterwards, and delivers to
+fake sockets through the local fan-out scheduler and connection manager.
+Without a reachable REDIS_URL the checks are reported as skipped.
+
+Run from the backend directory, e.g. against a local redis-server:
+
+    python scripts/check_redis_stream.py --redis-url redis://localhost:6379
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+import uuid
+from typing import Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+
+class FakeSocket:
+    """Keeps every frame written to it"""
+
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, message: str):
+        await asyncio.sleep(0)
+        self.frames.append(message)
+
+
+async def eventually(condition, timeout: float = 3.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+class Context:
+    """A stream key of its own and nodes reading it"""
+
+    def __init__(self, redis_url: str):
+        self.redis_url = redis_url
+        self.stream_key = f"check:stream:{uuid.uuid4().hex}"
+        self.nodes = []
+
+    def node(self, node_id: str, **options):
+        from src.core.redis_stream import RedisStreamFanout
+
+        options.setdefault("block_ms", 50)
+        options.setdefault("trim_interval", 3600.0)
+        node = RedisStreamFanout(
+            enabled=True,
+            redis_url=self.redis_url,
+            stream_key=self.stream_key,
+            node_id=node_id,
+            **options,
+        )
+        self.nodes.append(node)
+        return node
+
+    async def pending(self, node) -> int:
+        summary = await node.redis_client.xpending(self.stream_key, node.group)
+        return summary["pending"]
+
+    async def groups(self, node) -> list:
+        groups = await node.redis_client.xinfo_groups(self.stream_key)
+        return sorted(group["name"] for group in groups)
+
+    async def close(self):
+        if self.nodes:
+            await self.nodes[0].redis_client.delete(self.stream_key)
+        for node in self.nodes:
+            await node.stop()
+
+
+async def check_node_id_required(ctx: Context):
+    from src.core.redis_stream import RedisStreamFanout
+
+    for node_id in (None, ""):
+        try:
+            RedisStreamFanout(enabled=True, redis_url=ctx.redis_url, node_id=node_id)
+        except ValueError:
+            continue
+        raise AssertionError(f"enabled without a stable NODE_ID ({node_id!r})")
+    RedisStreamFanout(enabled=False, node_id=None)
+
+
+async def check_publish_consume(ctx: Context, alice: FakeSocket):
+    producer, consumer = ctx.node("producer"), ctx.node("consumer")
+    # Created before publishing, a new group starts at the tail
+    await consumer._ensure_group()
+    consumer.start()
+    for n in range(3):
+        await producer.dispatch(["alice"], f'{{"n":{n}}}')
+    assert await eventually(lambda: len(alice.frames) == 3), alice.frames
+    assert alice.frames == ['{"n":0}', '{"n":1}', '{"n":2}'], alice.frames
+    assert await eventually(lambda: consumer.delivered == 3), consumer.get_stats()
+    assert await ctx.pending(consumer) == 0, "delivered entries not acknowledged"
+    assert producer.published == 3 and consumer.errors == 0, consumer.get_stats()
+
+
+async def check_restart_delivers_missed(ctx: Context, alice: FakeSocket):
+    producer, before = ctx.node("producer"), ctx.node("restarted")
+    await before._ensure_group()
+    await before.stop()
+    # Published while the node is down
+    await producer.dispatch(["alice"], '{"n":1}')
+    await producer.dispatch(["alice"], '{"n":2}')
+
+    after = ctx.node("restarted")
+    after.start()
+    assert await eventually(lambda: len(alice.frames) == 2), alice.frames
+    assert await ctx.pending(after) == 0, "delivered entries not acknowledged"
+
+
+async def check_redeliver_unacked(ctx: Context, alice: FakeSocket):
+    producer, crashed = ctx.node("producer"), ctx.node("crashed")
+    await crashed._ensure_group()
+    await producer.dispatch(["alice"], '{"n":1}')
+    await producer.dispatch(["alice"], '{"n":2}')
+    # Read but never acknowledged, as by a node that died mid-batch
+    await crashed.redis_client.xreadgroup(
+        crashed.group, crashed.node_id, {ctx.stream_key: ">"}, count=10
+    )
+    assert await ctx.pending(crashed) == 2
+    await crashed.stop()
+
+    restarted = ctx.node("crashed")
+    restarted.start()
+    assert await eventually(lambda: len(alice.frames) == 2), alice.frames
+    assert restarted.redelivered == 2, restarted.get_stats()
+    assert await ctx.pending(restarted) == 0, "redelivered entries not acknowledged"
+
+
+async def check_trim(ctx: Context, alice: FakeSocket):
+    node = ctx.node("trimmer", retention_seconds=3600.0)
+    redis_client = node.redis_client
+    # Entries from 1970, several stream nodes' worth so ~ can drop whole ones
+    for n in range(1, 301):
+        await redis_client.xadd(ctx.stream_key, {"message": "old"}, id=f"{n}-1")
+    for n in range(5):
+        await node.dispatch(["alice"], f'{{"n":{n}}}')
+    await node._trim()
+    entries = await redis_client.xrange(ctx.stream_key)
+    old = [entry_id for entry_id, fields in entries if fields["message"] == "old"]
+    recent = [fields["message"] for _, fields in entries if fields["message"] != "old"]
+    assert len(old) <= 100, f"{len(old)} expired entries left"
+    assert recent == [f'{{"n":{n}}}' for n in range(5)], recent
+
+
+async def check_stale_groups(ctx: Context, alice: FakeSocket):
+    live = ctx.node("live", retention_seconds=0.3)
+    redis_client = live.redis_client
+    await redis_client.xadd(ctx.stream_key, {"message": "x"})
+    for name in ("node:gone", "node:never-read", "analytics"):
+        await redis_client.xgroup_create(ctx.stream_key, name, id="0")
+    # Reads once, leaving a pending entry, and never comes back
+    await redis_client.xreadgroup("node:gone", "gone", {ctx.stream_key: ">"})
+    live.start()
+    await asyncio.sleep(0.5)
+    await live._destroy_stale_groups()
+    groups = await ctx.groups(live)
+    assert groups == ["analytics", "node:live", "node:never-read"], groups
+    assert live.groups_destroyed == 1, live.get_stats()
+
+
+CHECKS = [
+    check_publish_consume,
+    check_restart_delivers_missed,
+    check_redeliver_unacked,
+    check_trim,
+    check_stale_groups,
+]
+
+
+async def redis_error(redis_url: str) -> Optional[str]:
+    import redis.asyncio
+
+    client = redis.asyncio.Redis.from_url(redis_url)
+    try:
+        await asyncio.wait_for(client.ping(), timeout=2)
+        return None
+    except Exception as e:
+        return f"{redis_url} unreachable: {e!r}"
+    finally:
+        await client.aclose()
+
+
+async def run(redis_url: str) -> Tuple[int, int]:
+    """Run the checks, return (failures, skipped)"""
+    from src.core.connection_manager import connection_manager
+    from src.core.fanout import fanout_scheduler
+
+    failures = 0
+    try:
+        await check_node_id_required(Context(redis_url))
+        print("  PASS check_node_id_required")
+    except Exception as e:
+        failures += 1
+        print(f"  FAIL check_node_id_required: {e!r}")
+
+    error = await redis_error(redis_url)
+    if error is not None:
+        print(f"  SKIP {len(CHECKS)} checks: {error}")
+        return failures, len(CHECKS)
+
+    for check in CHECKS:
+        ctx, alice = Context(redis_url), FakeSocket()
+        await connection_manager.connect(alice, "alice")
+        try:
+            await check(ctx, alice)
+            print(f"  PASS {check.__name__}")
+        except Exception as e:
+            failures += 1
+            print(f"  FAIL {check.__name__}: {e!r}")
+        finally:
+            await connection_manager.disconnect(alice, "alice")
+            await ctx.close()
+    await fanout_scheduler.stop()
+    return failures, 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--redis-url", default=None, help="defaults to REDIS_URL")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    from src.core.config import settings
+
+    failures, skipped = asyncio.run(run(args.redis_url or settings.REDIS_URL))
+    if failures:
+        print(f"{failures} failed, {skipped} skipped")
+    elif skipped:
+        print(f"checks passed, {skipped} skipped")
+    else:
+        print("all checks passed")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Traffic replay: re-drive a capture recorded with RECORD_TRAFFIC_PATH
+against a local instance and report delivery latency distributions.
+
+Socket connects and disconnects are replayed as simulated WebSocket
+clients of the recorded users. Ingress requests are re-sent with their
+recorded path, query, body and Idempotency-Key, at the recorded pace
+divided by --speed. A delivery is matched to its request through the
+trace id the server puts in both the X-Trace-Id header and the frame;
+its latency is from sending the request to the frame arriving.
+
+Company and role broadcasts reach the users of the local directory
+(src/config/users.py), not the recorded ones.
+
+Run from the backend directory:
+
+    python scripts/replay_traffic.py capture.ndjson --speed 4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# The replay opens every recorded socket from one address, far above the
+# per-IP and per-user handshake limits meant for real clients
+SERVER_ENV = {
+    "LOG_LEVEL": "WARNING",
+    "TRACING_ENABLED": "true",
+    "TRACE_SAMPLE_RATE": "1.0",
+    "WS_MAX_CONCURRENT_HANDSHAKES": "100000",
+    "WS_HANDSHAKE_IP_RATE": "1000000",
+    "WS_HANDSHAKE_IP_BURST": "1000000",
+    "WS_HANDSHAKE_USER_RATE": "1000000",
+    "WS_HANDSHAKE_USER_BURST": "1000000",
+    "WS_MAX_SOCKETS_PER_USER": "1000",
+    "WS_INBOUND_RATE": "1000000",
+    "WS_INBOUND_BURST": "1000000",
+}
+
+
+def load_capture(path: str) -> list:
+    events = []
+    with open(path) as capture:
+        for line in capture:
+            line = line.strip()
+            if not line:
+                continue
+            event = json.loads(line)
+            if event.get("kind") in ("request", "connect", "disconnect"):
+                events.append(event)
+    events.sort(key=lambda event: event["t"])
+    return events
+
+
+def endpoint_group(path: str) -> str:
+    """/api/broadcast/company/acme -> /api/broadcast/company"""
+    return "/".join(path.split("/")[:4])
+
+
+class Replay:
+    def __init__(self, args):
+        self.args = args
+        self.http_url = f"http://127.0.0.1:{args.port}"
+        self.ws_url = f"ws://127.0.0.1:{args.port}/api/ws/notification"
+        self.tokens = {}
+        self.sockets = {}
+        self.readers = []
+        # trace_id -> (sent_at, endpoint group)
+        self.requests = {}
+        # trace_id -> arrival times of its frames
+        self.arrivals = {}
+        self.response_times = []
+        self.status_mismatches = 0
+        self.failed_connects = 0
+        self.max_lag = 0.0
+
+    async def connect(self, conn: int, user_id: str):
+        import websockets
+
+        try:
+            websocket = await websockets.connect(
+                f"{self.ws_url}?token={self.tokens[user_id]}", origin="http://localhost"
+            )
+        except Exception:
+            self.failed_connects += 1
+            return
+        self.sockets[conn] = websocket
+        self.readers.append(asyncio.create_task(self.read(websocket)))
+
+    async def read(self, websocket):
+        try:
+            async for raw in websocket:
+                arrived = time.perf_counter()
+                try:
+                    trace_id = json.loads(raw).get("trace_id")
+                except (ValueError, AttributeError):
+                    continue
+                if trace_id:
+                    self.arrivals.setdefault(trace_id, []).append(arrived)
+        except Exception:
+            pass
+
+    async def disconnect(self, conn: int):
+        websocket = self.sockets.pop(conn, None)
+        if websocket is not None:
+            await websocket.close()
+
+    async def request(self, client, event: dict):
+        url = self.http_url + event["path"]
+        if event.get("query"):
+            url += "?" + event["query"]
+        headers = dict(event.get("headers") or {})
+        if "body" in event:
+            content = json.dumps(event["body"]) if event["body"] is not None else None
+            headers["content-type"] = "application/json"
+        else:
+            content = event.get("body_text")
+        sent_at = time.perf_counter()
+        response = await client.request(
+            event.get("method", "POST"), url, content=content, headers=headers
+        )
+        self.response_times.append(time.perf_counter() - sent_at)
+        if response.status_code != event.get("status", response.status_code):
+            self.status_mismatches += 1
+        trace_id = response.headers.get("x-trace-id")
+        if trace_id:
+            self.requests[trace_id] = (sent_at, endpoint_group(event["path"]))
+
+    async def run(self, events: list):
+        import httpx
+        from src.api.auth import create_access_token
+
+        # Everything slow happens before the clock starts
+        for event in events:
+            if event["kind"] == "connect" and event["user"] not in self.tokens:
+                self.tokens[event["user"]] = create_access_token(
+                    data={"sub": event["user"]}
+                )
+
+        async with httpx.AsyncClient(timeout=60) as client:
+            await wait_until_ready(client, self.http_url, self.args.timeout)
+            tasks = []
+            started = time.perf_counter()
+            for event in events:
+                due = started + event["t"] / self.args.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.max_lag = max(self.max_lag, -delay)
+                if event["kind"] == "connect":
+                    # Later events of the socket need it open
+                    await self.connect(event["conn"], event["user"])
+                elif event["kind"] == "disconnect":
+                    tasks.append(asyncio.create_task(self.disconnect(event["conn"])))
+                else:
+                    tasks.append(asyncio.create_task(self.request(client, event)))
+            await asyncio.gather(*tasks)
+            # Let the last deliveries arrive
+            await asyncio.sleep(self.args.settle)
+
+        for websocket in list(self.sockets.values()):
+            await websocket.close()
+        for reader in self.readers:
+            reader.cancel()
+        await asyncio.gather(*self.readers, return_exceptions=True)
+
+    def report(self):
+        by_group = {}
+        last_delivery = []
+        for trace_id, (sent_at, group) in self.requests.items():
+            arrivals = self.arrivals.get(trace_id)
+            if not arrivals:
+                continue
+            latencies = [arrived - sent_at for arrived in arrivals]
+            by_group.setdefault(group, []).extend(latencies)
+            last_delivery.append(max(latencies))
+
+        print(
+            f"requests: {len(self.response_times)} sent, "
+            f"{self.status_mismatches} with a different status than recorded; "
+            f"sockets: {len(self.readers)} opened, {self.failed_connects} failed; "
+            f"max schedule lag {self.max_lag * 1000:.1f} ms"
+        )
+        report("http response", self.response_times)
+        report("delivery, all", [lat for lats in by_group.values() for lat in lats])
+        report("delivery, last socket", last_delivery)
+        for group in sorted(by_group):
+            report(f"delivery {group}", by_group[group])
+
+
+async def wait_until_ready(client, base_url: str, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            await client.get(f"{base_url}/docs")
+            return
+        except Exception:
+            await asyncio.sleep(0.05)
+    raise TimeoutError("Server did not start in time")
+
+
+def report(name: str, samples: list):
+    if not samples:
+        print(f"{name:<36} no samples")
+        return
+    samples = sorted(samples)
+
+    def percentile(p: float) -> float:
+        return samples[min(len(samples) - 1, int(len(samples) * p))] * 1000
+
+    print(
+        f"{name:<36} p50 {statistics.median(samples) * 1000:7.1f} ms  "
+        f"p95 {percentile(0.95):7.1f} ms  p99 {percentile(0.99):7.1f} ms  "
+        f"max {samples[-1] * 1000:7.1f} ms  (n={len(samples)})"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("capture", help="NDJSON file written by RECORD_TRAFFIC_PATH")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 = recorded pace")
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds to wait for the last deliveries")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    args = parser.parse_args()
+
+    events = load_capture(args.capture)
+    env = dict(os.environ, **SERVER_ENV)
+    env.pop("RECORD_TRAFFIC_PATH", None)
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--port",
+            str(args.port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        replay = Replay(args)
+        asyncio.run(replay.run(events))
+        replay.report()
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+
+if __name__ == "__main__":
+    main()
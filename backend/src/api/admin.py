@@ -0,0 +1,74 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from pydantic import BaseModel
+from typing import Optional
+from src.api.auth import require_admin
+from src.core.compression import compression_stats
+from src.core.config import settings
+from src.core.connection_manager import connection_manager
+from src.core.drain import drain_controller
+from src.core.fanout import fanout_scheduler
+from src.core.idempotency import idempotency_cache
+from src.core.passwords import password_verifier
+from src.core.recorder import traffic_recorder
+from src.core.redis_stream import stream_fanout
+from src.core.sse import sse_hub
+from src.core.subscriptions import subscription_index
+from src.services.audience import audience_resolver
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+class DrainRequest(BaseModel):
+    window_seconds: Optional[float] = None
+    target_endpoint: Optional[str] = None
+
+
+@router.get("/admin/drain")
+async def get_drain_status():
+    return drain_controller.get_status()
+
+
+@router.post("/admin/drain")
+async def start_drain(request: DrainRequest):
+    if not drain_controller.start(
+        window_seconds=request.window_seconds,
+        target_endpoint=request.target_endpoint,
+    ):
+        raise HTTPException(status_code=409, detail="Drain already in progress")
+    logger.info(f"Drain started: {request.dict()}")
+    return drain_controller.get_status()
+
+
+@router.delete("/admin/drain")
+async def stop_drain():
+    if not drain_controller.stop():
+        raise HTTPException(status_code=409, detail="Drain cannot be stopped")
+    logger.info("Drain stopped, accepting new connections")
+    return drain_controller.get_status()
+
+
+@router.get("/admin/delivery-metrics")
+async def get_delivery_metrics():
+    return {
+        "fanout": fanout_scheduler.get_stats(),
+        "connections": connection_manager.get_queue_stats(),
+        "sse": sse_hub.get_stats(),
+        "stream": stream_fanout.get_stats(),
+        "audiences": audience_resolver.get_stats(),
+        "password_verifier": password_verifier.get_stats(),
+        "idempotency": idempotency_cache.get_stats(),
+        "recorder": traffic_recorder.get_stats(),
+        "compression": compression_stats.get_stats(),
+        "subscriptions": subscription_index.get_stats(),
+    }
+
+
+@router.get("/admin/connections")
+async def get_connections(
+    sort: str = Query("slowest", pattern="^(slowest|noisiest)$"),
+    limit: int = Query(20, ge=1, le=settings.WS_STATS_TOP_K),
+):
+    """Slowest consumers (send latency EWMA) or noisiest clients (frame rate)"""
+    return connection_manager.get_connection_report(sort, limit)
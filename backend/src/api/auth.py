@@ -6,20 +6,12 @@ from jose import JWTError, jwt
 from pydantic import BaseModel
 from src.core.config import settings
 from src.config.users import get_user_by_username  # import dari config baru
+from src.core.passwords import VerifierBusy, password_verifier
+import math
 
 router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
 
-# This is a simple user store for demonstration
-# In a real application, you would use a database
-USERS = {
-    "admin": {
-        "username": "admin",
-        "password": "wkwkwk",  # In production, use hashed passwords
-        "disabled": False,
-    }
-}
-
 
 class Token(BaseModel):
     access_token: str
@@ -69,10 +61,31 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     return token_data
 
 
+async def require_admin(token_data: TokenData = Depends(get_current_user)):
+    user = get_user_by_username(token_data.username)
+    if not user or user.disabled or user.role != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    return user
+
+
 @router.post("/auth/login")
 async def login(login_data: LoginRequest):
     user = get_user_by_username(login_data.username)
-    if not user or user.password != login_data.password:
+    try:
+        # bcrypt is slow, it runs in the verifier's thread pool
+        valid = await password_verifier.verify(
+            login_data.password, user.hashed_password if user else None
+        )
+    except VerifierBusy as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent logins",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    if not valid:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
 
     # Set token expiration to 5 years
@@ -1,7 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException, Request
 from pydantic import BaseModel, Field
 from typing import Optional
+from src.core.idempotency import run_idempotent
+from src.core.ids import id_generator
+from src.services.audience import AudienceSelector, audience_resolver
 from src.services.broadcast import broadcast_service
+from src.services.scheduler import schedule_service
+from src.api.scheduled import get_send_at, scheduled_response
+from src.core.tracing import mark_handler_start
 from datetime import datetime
 
 router = APIRouter()
@@ -12,42 +18,164 @@ class NotificationPayload(BaseModel):
     title: str
     message: str
     type: str = "info"
+    priority: Optional[str] = None
     created_at: str = Field(default_factory=lambda: datetime.now().isoformat())
     read: bool = False
     data: Optional[dict] = None
+    collapse_key: Optional[str] = None
 
 
 class BroadcastMessage(BaseModel):
-    id: str = Field(default_factory=lambda: f"notif_{datetime.now().timestamp()}")
+    id: str = Field(default_factory=lambda: id_generator.next_id("notif_"))
     type: str = "notification"
     payload: NotificationPayload
+    send_at: Optional[datetime] = None
+    delay_seconds: Optional[float] = None
 
+    def to_message(self) -> dict:
+        """The message as delivered to clients, without scheduling fields"""
+        return self.dict(exclude={"send_at", "delay_seconds"})
 
-@router.post("/broadcast/company/{company}")
-async def broadcast_to_company(company: str, message: BroadcastMessage):
-    success = await broadcast_service.broadcast_to_company(
-        company=company, message=message.dict()
-    )
+    def idempotency_key(self, header: Optional[str]) -> Optional[str]:
+        """The Idempotency-Key header, else an id the producer set itself"""
+        if header:
+            return header
+        return self.id if "id" in self.model_fields_set else None
+
+
+async def _broadcast_to_company(payload: dict):
+    return await broadcast_service.broadcast_to_company(**payload)
+
+
+async def _broadcast_to_role(payload: dict):
+    return await broadcast_service.broadcast_to_role(**payload)
+
+
+async def _broadcast_to_company_role(payload: dict):
+    return await broadcast_service.broadcast_to_company_role(**payload)
+
+
+async def _broadcast_to_audience(payload: dict):
+    return await broadcast_service.broadcast_to_audience(**payload)
+
+
+BROADCAST_HANDLERS = {
+    "broadcast_audience": _broadcast_to_audience,
+    "broadcast_company": _broadcast_to_company,
+    "broadcast_role": _broadcast_to_role,
+    "broadcast_company_role": _broadcast_to_company_role,
+}
+for kind, handler in BROADCAST_HANDLERS.items():
+    schedule_service.register(kind, handler)
+
+
+async def _deliver(kind: str, payload: dict, message: BroadcastMessage, target: str):
+    due = get_send_at(message.send_at, message.delay_seconds)
+    if due is not None:
+        return scheduled_response(schedule_service.schedule(kind, payload, due))
+    success = await BROADCAST_HANDLERS[kind](payload)
     if not success:
         raise HTTPException(status_code=500, detail="Failed to broadcast message")
-    return {"status": "success", "message": "Message broadcasted to company"}
+    return {"status": "success", "message": f"Message broadcasted to {target}"}
+
+
+@router.post("/broadcast/company/{company}")
+async def broadcast_to_company(
+    company: str,
+    message: BroadcastMessage,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+):
+    mark_handler_start()
+    payload = {"company": company, "message": message.to_message()}
+    return await run_idempotent(
+        request,
+        message.idempotency_key(idempotency_key),
+        lambda: _deliver("broadcast_company", payload, message, "company"),
+    )
 
 
 @router.post("/broadcast/role/{role}")
-async def broadcast_to_role(role: str, message: BroadcastMessage):
-    success = await broadcast_service.broadcast_to_role(
-        role=role, message=message.dict()
+async def broadcast_to_role(
+    role: str,
+    message: BroadcastMessage,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+):
+    mark_handler_start()
+    payload = {"role": role, "message": message.to_message()}
+    return await run_idempotent(
+        request,
+        message.idempotency_key(idempotency_key),
+        lambda: _deliver("broadcast_role", payload, message, "role"),
     )
-    if not success:
-        raise HTTPException(status_code=500, detail="Failed to broadcast message")
-    return {"status": "success", "message": "Message broadcasted to role"}
 
 
 @router.post("/broadcast/company/{company}/role/{role}")
-async def broadcast_to_company_role(company: str, role: str, message: BroadcastMessage):
-    success = await broadcast_service.broadcast_to_company_role(
-        company=company, role=role, message=message.dict()
+async def broadcast_to_company_role(
+    company: str,
+    role: str,
+    message: BroadcastMessage,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+):
+    mark_handler_start()
+    payload = {"company": company, "role": role, "message": message.to_message()}
+    return await run_idempotent(
+        request,
+        message.idempotency_key(idempotency_key),
+        lambda: _deliver(
+            "broadcast_company_role", payload, message, "company and role"
+        ),
     )
-    if not success:
-        raise HTTPException(status_code=500, detail="Failed to broadcast message")
-    return {"status": "success", "message": "Message broadcasted to company and role"}
+
+
+def audience_response(audience) -> dict:
+    return {
+        "audience_id": audience.id,
+        "selector": audience.selector.dict(),
+        "size": len(audience_resolver.members(audience)),
+    }
+
+
+@router.post("/broadcast/audiences")
+async def create_audience(selector: AudienceSelector):
+    """Resolve a selector once; the returned id can be reused by later broadcasts"""
+    return audience_response(audience_resolver.register(selector))
+
+
+@router.get("/broadcast/audiences/{audience_id}")
+async def get_audience(audience_id: str):
+    audience = audience_resolver.get(audience_id)
+    if audience is None:
+        raise HTTPException(status_code=404, detail="Audience not found")
+    return audience_response(audience)
+
+
+@router.post("/broadcast/audience/{audience_id}")
+async def broadcast_to_audience(
+    audience_id: str,
+    message: BroadcastMessage,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+):
+    mark_handler_start()
+    return await run_idempotent(
+        request,
+        message.idempotency_key(idempotency_key),
+        lambda: _send_to_audience(audience_id, message),
+    )
+
+
+async def _send_to_audience(audience_id: str, message: BroadcastMessage):
+    audience = audience_resolver.get(audience_id)
+    if audience is None:
+        raise HTTPException(status_code=404, detail="Audience not found")
+    # The selector travels with the payload so a scheduled send can
+    # rebuild the audience after a restart
+    payload = {
+        "audience_id": audience_id,
+        "selector": audience.selector.dict(),
+        "message": message.to_message(),
+    }
+    return await _deliver("broadcast_audience", payload, message, "audience")
@@ -0,0 +1,22 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import Optional
+from src.api.auth import require_admin
+from src.core.tracing import ring_buffer_exporter, tracer
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+
+@router.get("/debug/traces")
+async def get_traces(
+    limit: int = Query(20, ge=1, le=1000), trace_id: Optional[str] = None
+):
+    """Per-stage latency and the most recent delivery traces"""
+    if trace_id is not None:
+        trace = ring_buffer_exporter.find(trace_id)
+        if trace is None:
+            raise HTTPException(status_code=404, detail="Trace not found")
+        return trace.to_dict()
+    return {
+        "stages": tracer.get_stats(),
+        "traces": [trace.to_dict() for trace in ring_buffer_exporter.recent(limit)],
+    }
@@ -1,7 +1,15 @@
-from fastapi import APIRouter, HTTPException
-from src.services.notification import notification_service, Notification
-from src.core.websocket import websocket_manager
-from typing import List
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from src.services.notification import notification_service, Notification, FeedDelta
+from src.config.users import get_user_by_username
+from src.core.redis_stream import stream_fanout
+from src.core.idempotency import run_idempotent
+from src.core.priority import lane_for
+from src.core.subscriptions import Route
+from src.core.tracing import current_trace_id, mark_handler_start, tracer
+from src.api.scheduled import get_send_at, scheduled_response
+from src.services.scheduler import schedule_service
+from typing import List, Optional, Union
+from datetime import datetime
 import json
 import logging
 from pydantic import BaseModel
@@ -15,47 +23,205 @@ class NotificationRequest(BaseModel):
     message: str
     priority: str
     topic: str
+    type: Optional[str] = None  # notification type, defaults to the priority
+    collapse_key: Optional[str] = None
+    send_at: Optional[datetime] = None
+    delay_seconds: Optional[float] = None
+
+
+class MarkReadRequest(BaseModel):
+    ids: Optional[List[str]] = None
+    until: Optional[datetime] = None
+
+
+class BulkDeleteRequest(BaseModel):
+    ids: List[str]
+
+
+def tenant_of(user_id: str) -> Optional[str]:
+    user = get_user_by_username(user_id)
+    return user.company if user is not None else None
+
+
+async def deliver_notification(payload: dict) -> Notification:
+    """Store a notification for one user and push it to their sockets"""
+    with tracer.span("store"):
+        notification = notification_service.create_notification(**payload)
+
+    with tracer.span("serialize"):
+        message = {"type": "new_notification", "data": notification.dict()}
+        trace_id = current_trace_id()
+        if trace_id is not None:
+            message["trace_id"] = trace_id
+        message_str = json.dumps(message)
+
+    # Send notification through WebSocket
+    with tracer.span("dispatch"):
+        await stream_fanout.dispatch(
+            [notification.user_id],
+            message_str,
+            lane_for(notification.type),
+            notification.collapse_key,
+            tenant_of(notification.user_id),
+        )
+    return notification
 
 
 @router.post("/notifications", response_model=Notification)
 async def create_notification(
-    user_id: str, title: str, message: str, type: str = "info", data: dict = None
+    user_id: str,
+    title: str,
+    message: str,
+    request: Request,
+    type: str = "info",
+    data: dict = None,
+    collapse_key: Optional[str] = None,
+    send_at: Optional[datetime] = None,
+    delay_seconds: Optional[float] = None,
+    idempotency_key: Optional[str] = Header(None),
 ):
-    try:
-        notification = notification_service.create_notification(
-            user_id=user_id, title=title, message=message, type=type, data=data
-        )
+    mark_handler_start()
+    due = get_send_at(send_at, delay_seconds)
+    payload = {
+        "user_id": user_id,
+        "title": title,
+        "message": message,
+        "type": type,
+        "data": data,
+        "collapse_key": collapse_key,
+    }
 
-        # Send notification through WebSocket
-        await websocket_manager.send_personal_message(
-            json.dumps({"type": "new_notification", "data": notification.dict()}),
-            user_id,
-        )
+    async def create():
+        try:
+            if due is not None:
+                return scheduled_response(
+                    schedule_service.schedule("notification", payload, due)
+                )
+            return await deliver_notification(payload)
+        except Exception as e:
+            logger.error(f"Error creating notification: {e}")
+            raise HTTPException(
+                status_code=500, detail="Failed to create notification"
+            )
+
+    return await run_idempotent(request, idempotency_key, create)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(
+        tag.removeprefix("W/") == etag for tag in candidates
+    )
 
-        return notification
-    except Exception as e:
-        logger.error(f"Error creating notification: {e}")
-        raise HTTPException(status_code=500, detail="Failed to create notification")
 
+@router.get(
+    "/notifications/{user_id}", response_model=Union[List[Notification], FeedDelta]
+)
+async def get_notifications(
+    user_id: str,
+    request: Request,
+    response: Response,
+    since_version: Optional[int] = None,
+    after_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1),
+):
+    # Answer revalidation from the version alone, before building the feed
+    etag = f'"{notification_service.get_feed_version(user_id)}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
 
-@router.get("/notifications/{user_id}", response_model=List[Notification])
-async def get_notifications(user_id: str):
     try:
+        if since_version is not None:
+            return notification_service.get_feed_changes(user_id, since_version)
+        if any(bound is not None for bound in (after_id, since, until, limit)):
+            return notification_service.find_notifications(
+                user_id, after_id, since, until, limit
+            )
         return notification_service.get_user_notifications(user_id)
     except Exception as e:
         logger.error(f"Error getting notifications: {e}")
         raise HTTPException(status_code=500, detail="Failed to get notifications")
 
 
+@router.get("/notifications/{user_id}/unread-count")
+async def get_unread_count(user_id: str):
+    return {
+        "user_id": user_id,
+        "unread_count": notification_service.get_unread_count(user_id),
+    }
+
+
+@router.put("/notifications/{user_id}/mark-all-read")
+async def mark_all_notifications_as_read(user_id: str):
+    try:
+        updated = notification_service.mark_all_as_read(user_id)
+        return {
+            "updated": updated,
+            "unread_count": notification_service.get_unread_count(user_id),
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error marking all notifications as read: {e}")
+        raise HTTPException(
+            status_code=500, detail="Failed to mark notifications as read"
+        )
+
+
+@router.put("/notifications/{user_id}/mark-read")
+async def mark_notifications_as_read(user_id: str, request: MarkReadRequest):
+    if (request.ids is None) == (request.until is None):
+        raise HTTPException(
+            status_code=400, detail="Provide exactly one of 'ids' or 'until'"
+        )
+    try:
+        if request.ids is not None:
+            updated = notification_service.mark_many_as_read(user_id, request.ids)
+        else:
+            updated = notification_service.mark_read_until(user_id, request.until)
+        return {
+            "updated": updated,
+            "unread_count": notification_service.get_unread_count(user_id),
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error marking notifications as read: {e}")
+        raise HTTPException(
+            status_code=500, detail="Failed to mark notifications as read"
+        )
+
+
+@router.post("/notifications/{user_id}/bulk-delete")
+async def delete_notifications(user_id: str, request: BulkDeleteRequest):
+    try:
+        deleted = notification_service.delete_many(user_id, request.ids)
+        return {
+            "deleted": deleted,
+            "unread_count": notification_service.get_unread_count(user_id),
+        }
+    except Exception as e:
+        logger.error(f"Error deleting notifications: {e}")
+        raise HTTPException(status_code=500, detail="Failed to delete notifications")
+
+
 @router.put("/notifications/{notification_id}/read", response_model=Notification)
-async def mark_notification_as_read(notification_id: str):
+async def mark_notification_as_read(notification_id: str, user_id: Optional[str] = None):
     try:
-        notification = notification_service.mark_as_read(notification_id)
+        notification = notification_service.mark_as_read(notification_id, user_id)
         if not notification:
             raise HTTPException(status_code=404, detail="Notification not found")
         return notification
     except HTTPException:
         raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Error marking notification as read: {e}")
         raise HTTPException(
@@ -64,9 +230,9 @@ async def mark_notification_as_read(notification_id: str):
 
 
 @router.delete("/notifications/{notification_id}")
-async def delete_notification(notification_id: str):
+async def delete_notification(notification_id: str, user_id: Optional[str] = None):
     try:
-        if not notification_service.delete_notification(notification_id):
+        if not notification_service.delete_notification(notification_id, user_id):
             raise HTTPException(status_code=404, detail="Notification not found")
         return {"message": "Notification deleted successfully"}
     except HTTPException:
@@ -76,49 +242,92 @@ async def delete_notification(notification_id: str):
         raise HTTPException(status_code=500, detail="Failed to delete notification")
 
 
-@router.post("/notifications/send")
-async def send_notification(notification: NotificationRequest):
-    try:
-        logger.info(f"Creating notification: {notification.dict()}")
+async def deliver_notification_to_all(payload: dict):
+    """Store a notification for all users and fan it out to every connected user"""
+    notification = NotificationRequest(**payload)
 
-        # Create notification
-        new_notification = notification_service.create_notification(
-            user_id="all",  # Send to all users
+    # Create notification
+    with tracer.span("store"):
+        # Stored once, read state is tracked per user
+        new_notification = notification_service.create_broadcast(
             title=notification.title,
             message=notification.message,
-            type=notification.priority,
+            type=notification.type or notification.priority,
             data={"topic": notification.topic},
+            collapse_key=notification.collapse_key,
         )
 
-        logger.info(f"Notification created: {new_notification.dict()}")
+    logger.info(f"Notification created: {new_notification.dict()}")
 
-        # Broadcast to all connected clients
-        message = {
+    # Broadcast to all connected clients
+    message = {
+        "id": str(new_notification.id),
+        "type": "notification",
+        "payload": {
             "id": str(new_notification.id),
-            "type": "notification",
-            "payload": {
-                "id": str(new_notification.id),
-                "title": new_notification.title,
-                "message": new_notification.message,
-                "type": new_notification.type,
-                "created_at": new_notification.created_at,
-                "read": new_notification.read,
-                "data": new_notification.data,
-            },
-        }
-        logger.info(f"Broadcasting message: {message}")
+            "title": new_notification.title,
+            "message": new_notification.message,
+            "type": new_notification.type,
+            "created_at": new_notification.created_at,
+            "read": new_notification.read,
+            "data": new_notification.data,
+            "collapse_key": new_notification.collapse_key,
+        },
+    }
+    trace_id = current_trace_id()
+    if trace_id is not None:
+        message["trace_id"] = trace_id
+    logger.info(f"Broadcasting message: {message}")
 
-        # Convert message to JSON string
+    # Convert message to JSON string
+    with tracer.span("serialize"):
         message_str = json.dumps(message)
-        logger.debug(f"Broadcasting message string: {message_str}")
-
-        # Use the WebSocketManager to broadcast the message
-        await websocket_manager.broadcast(message_str)
-        logger.info("Message broadcasted successfully")
+    logger.debug(f"Broadcasting message string: {message_str}")
 
-        return {"message": "Notification sent successfully"}
-    except Exception as e:
-        logger.error(f"Error sending notification: {str(e)}", exc_info=True)
-        raise HTTPException(
-            status_code=500, detail=f"Failed to send notification: {str(e)}"
+    # Fan out in the lane of its priority to users whose subscriptions match
+    with tracer.span("dispatch"):
+        await stream_fanout.dispatch(
+            None,
+            message_str,
+            lane=lane_for(notification.priority),
+            collapse_key=new_notification.collapse_key,
+            route=Route(
+                notification.topic, new_notification.type, notification.priority
+            ),
         )
+    logger.info("Message broadcasted successfully")
+
+
+@router.post("/notifications/send")
+async def send_notification(
+    notification: NotificationRequest,
+    request: Request,
+    idempotency_key: Optional[str] = Header(None),
+):
+    mark_handler_start()
+    due = get_send_at(notification.send_at, notification.delay_seconds)
+
+    async def send():
+        try:
+            logger.info(f"Creating notification: {notification.dict()}")
+
+            payload = notification.dict(exclude={"send_at", "delay_seconds"})
+            if due is not None:
+                return scheduled_response(
+                    schedule_service.schedule("notification_send", payload, due)
+                )
+
+            await deliver_notification_to_all(payload)
+
+            return {"message": "Notification sent successfully"}
+        except Exception as e:
+            logger.error(f"Error sending notification: {str(e)}", exc_info=True)
+            raise HTTPException(
+                status_code=500, detail=f"Failed to send notification: {str(e)}"
+            )
+
+    return await run_idempotent(request, idempotency_key, send)
+
+
+schedule_service.register("notification", deliver_notification)
+schedule_service.register("notification_send", deliver_notification_to_all)
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
+from datetime import datetime
+from typing import List, Optional
+from src.services.scheduler import ScheduledItem, resolve_send_at, schedule_service
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+def get_send_at(
+    send_at: Optional[datetime], delay_seconds: Optional[float]
+) -> Optional[float]:
+    """Validate scheduling parameters of a request, None means deliver now"""
+    try:
+        return resolve_send_at(send_at, delay_seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def scheduled_response(item: ScheduledItem) -> JSONResponse:
+    return JSONResponse(
+        status_code=202,
+        content={
+            "status": "scheduled",
+            "schedule_id": item.id,
+            "send_at": datetime.fromtimestamp(item.send_at).astimezone().isoformat(),
+        },
+    )
+
+
+@router.get("/scheduled", response_model=List[ScheduledItem])
+async def list_scheduled():
+    return schedule_service.list_items()
+
+
+@router.get("/scheduled/{schedule_id}", response_model=ScheduledItem)
+async def get_scheduled(schedule_id: str):
+    item = schedule_service.get(schedule_id)
+    if not item:
+        raise HTTPException(status_code=404, detail="Scheduled item not found")
+    return item
+
+
+@router.delete("/scheduled/{schedule_id}")
+async def cancel_scheduled(schedule_id: str):
+    if not schedule_service.cancel(schedule_id):
+        raise HTTPException(status_code=404, detail="Scheduled item not found")
+    return {"message": "Scheduled item cancelled"}
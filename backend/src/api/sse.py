@@ -0,0 +1,92 @@
+from fastapi import APIRouter, Header, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from src.api.websocket import (
+    evict_excess_connections,
+    get_current_user,
+    validate_origin,
+)
+from src.core.admission import AdmissionRejected, admission_controller, get_client_ip
+from src.core.drain import drain_controller
+from src.core.sse import SSEConnection, sse_hub
+from src.core.connection_manager import connection_manager
+from src.core.config import settings
+from typing import Optional
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        logger.warning(f"Ignoring invalid Last-Event-ID: {value}")
+        return None
+
+
+@router.get("/sse/notification")
+async def sse_endpoint(
+    request: Request,
+    token: str = Query(...),
+    last_event_id: Optional[str] = Query(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+):
+    """Receive-only notification stream for clients that can't use WebSockets"""
+    # Same origin policy as the WebSocket handshake
+    origin = request.headers.get("origin")
+    if not validate_origin(origin):
+        logger.warning(f"Rejected SSE subscription from unauthorized origin: {origin}")
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Origin not allowed"
+        )
+
+    try:
+        if drain_controller.draining:
+            raise AdmissionRejected("draining", drain_controller.reconnect_delay())
+        admission_controller.begin_handshake(get_client_ip(request))
+        try:
+            username = await get_current_user(token)
+            admission_controller.admit_user(username)
+        finally:
+            admission_controller.end_handshake()
+    except AdmissionRejected as e:
+        logger.warning(
+            f"Rejected SSE subscription ({e.reason}), retry after {e.retry_after}s"
+        )
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=e.reason,
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+
+    # The EventSource header wins; the query parameter serves polyfills
+    resume_from = parse_last_event_id(last_event_id_header or last_event_id)
+    connection = SSEConnection(sse_hub, username)
+
+    async def event_stream():
+        # Registered here rather than in the handler, so a client gone before
+        # the body is iterated leaves nothing behind. No await between
+        # subscribe and connect, so nothing sent in between is missed.
+        backlog = sse_hub.subscribe(username, resume_from)
+        try:
+            await connection_manager.connect(connection, username)
+            logger.info(
+                f"SSE stream opened for {username}, replaying {len(backlog)} events"
+            )
+            await evict_excess_connections(username)
+            # Reconnect delay for EventSource, in milliseconds
+            yield f"retry: {int(settings.WS_RETRY_AFTER_SECONDS * 1000)}\n\n".encode()
+            async for frame in connection.stream(backlog):
+                yield frame
+        finally:
+            await connection_manager.disconnect(connection, username)
+            sse_hub.unsubscribe(username)
+            logger.info(f"SSE stream closed for {username}")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -6,7 +6,11 @@ from fastapi import (
     Query,
     status,
 )
-from src.core.websocket import websocket_manager
+from src.core.connection_manager import connection_manager
+from src.core.admission import AdmissionRejected, admission_controller, get_client_ip
+from src.core.drain import drain_controller
+from src.core.inbound import CLOSE, DROP, InboundLimiter, classify_frame
+from src.core.subscriptions import SubscriptionError, parse_filter, subscription_index
 import json
 import logging
 from jose import JWTError, jwt
@@ -77,8 +81,61 @@ async def get_current_user(token: str):
         raise credentials_exception
 
 
+async def reject_handshake(websocket: WebSocket, rejection: AdmissionRejected):
+    """Accept just long enough to tell the client when to come back, then close"""
+    await websocket.accept()
+    await websocket.send_json(
+        {
+            "type": "retry_later",
+            "payload": {
+                "reason": rejection.reason,
+                "retry_after": rejection.retry_after,
+            },
+        }
+    )
+    await websocket.close(
+        code=status.WS_1013_TRY_AGAIN_LATER,
+        reason=f"{rejection.reason}; retry_after={rejection.retry_after}",
+    )
+
+
+async def evict_excess_connections(username: str):
+    """Close the oldest sockets of a user above WS_MAX_SOCKETS_PER_USER"""
+    evicted = await connection_manager.evict_oldest(
+        username, admission_controller.max_sockets_per_user
+    )
+    for connection in evicted:
+        logger.info(f"Evicting oldest connection of {username}")
+        try:
+            await connection.close(
+                code=status.WS_1008_POLICY_VIOLATION,
+                reason="max_sockets_per_user",
+            )
+        except Exception as e:
+            logger.error(f"Error closing evicted connection of {username}: {e}")
+
+
+def handle_subscription(websocket: WebSocket, message_type: str, message: dict) -> dict:
+    """Apply a subscribe/unsubscribe frame and build the reply"""
+    payload = message.get("payload")
+    try:
+        if message_type == "subscribe":
+            subscription_index.subscribe(websocket, parse_filter(payload))
+        elif isinstance(payload, dict) and payload.get("all") is True:
+            subscription_index.clear(websocket)
+        else:
+            subscription_index.unsubscribe(websocket, parse_filter(payload))
+    except SubscriptionError as e:
+        return {"type": "subscription_error", "payload": {"reason": str(e)}}
+    return {
+        "type": f"{message_type}d",
+        "payload": {"filters": subscription_index.describe(websocket)},
+    }
+
+
 @router.websocket("/ws/notification")
 async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
+    handshake_in_progress = False
     try:
         # Validate origin
         origin = websocket.headers.get("origin")
@@ -89,56 +146,101 @@ async def websocket_endpoint(websocket: WebSocket, token: str = Query(...)):
             await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
             return
 
+        # Admission control runs before the JWT is decoded
+        if drain_controller.draining:
+            raise AdmissionRejected("draining", drain_controller.reconnect_delay())
+        admission_controller.begin_handshake(get_client_ip(websocket))
+        handshake_in_progress = True
+
         logger.info(f"WebSocket connection attempt with token: {token}")
 
         # Authenticate user
         username = await get_current_user(token)
         logger.info(f"User {username} authenticated successfully")
+        admission_controller.admit_user(username)
 
         # Accept the connection
         await websocket.accept()
         logger.info(f"WebSocket connection accepted for user {username}")
 
         # Connect to the manager
-        await websocket_manager.connect(websocket, username)
+        await connection_manager.connect(websocket, username)
         logger.info(f"User {username} connected to WebSocketManager")
 
+        admission_controller.end_handshake()
+        handshake_in_progress = False
+        await evict_excess_connections(username)
+
+        limiter = InboundLimiter()
+        # Built once per connection, the username does not change
+        auth_success_frame = json.dumps(
+            {"type": "auth_success", "payload": {"user_id": username}}
+        )
+
         try:
             while True:
                 data = await websocket.receive_text()
-                logger.debug(f"Received message from {username}: {data}")
+                connection_manager.record_received(websocket, len(data))
+
+                verdict = limiter.check(len(data))
+                if verdict == DROP:
+                    continue
+                if verdict == CLOSE:
+                    logger.warning(
+                        f"Closing connection of {username}: inbound frame limits exceeded"
+                    )
+                    await connection_manager.disconnect(websocket, username)
+                    await websocket.close(
+                        code=status.WS_1008_POLICY_VIOLATION,
+                        reason="inbound_limit_exceeded",
+                    )
+                    return
+
+                message_type = classify_frame(data)
+                if message_type is None:
+                    try:
+                        message = json.loads(data)
+                    except json.JSONDecodeError as e:
+                        logger.error(f"Invalid JSON received from {username}: {e}")
+                        continue
+                    if not isinstance(message, dict):
+                        continue
+                    message_type = message.get("type")
 
                 try:
-                    message = json.loads(data)
-                    logger.debug(f"Parsed message: {message}")
-
                     # Handle different message types
-                    if message.get("type") == "ping":
-                        logger.debug(f"Sending pong to {username}")
-                        await websocket.send_json(
-                            {"type": "pong", "timestamp": datetime.now().isoformat()}
+                    if message_type == "ping":
+                        await websocket.send_text(
+                            f'{{"type":"pong","timestamp":"{datetime.now().isoformat()}"}}'
                         )
-                    elif message.get("type") == "auth":
-                        logger.debug(f"Sending auth success to {username}")
+                    elif message_type == "auth":
+                        await websocket.send_text(auth_success_frame)
+                    elif message_type in ("subscribe", "unsubscribe"):
                         await websocket.send_json(
-                            {"type": "auth_success", "payload": {"user_id": username}}
+                            handle_subscription(websocket, message_type, message)
                         )
-                except json.JSONDecodeError as e:
-                    logger.error(f"Invalid JSON received from {username}: {e}")
                 except Exception as e:
                     logger.error(f"Error processing message from {username}: {e}")
 
         except WebSocketDisconnect:
             logger.info(f"User {username} disconnected")
-            websocket_manager.disconnect(websocket, username)
+            await connection_manager.disconnect(websocket, username)
         except Exception as e:
             logger.error(f"Error in websocket connection for {username}: {str(e)}")
-            websocket_manager.disconnect(websocket, username)
+            await connection_manager.disconnect(websocket, username)
             await websocket.close()
 
+    except AdmissionRejected as e:
+        logger.warning(
+            f"Rejected WebSocket handshake ({e.reason}), retry after {e.retry_after}s"
+        )
+        await reject_handshake(websocket, e)
     except HTTPException as e:
         logger.error(f"Authentication failed: {str(e)}")
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+    finally:
+        if handshake_in_progress:
+            admission_controller.end_handshake()
@@ -1,10 +1,13 @@
 from typing import List
+from passlib.context import CryptContext
 from pydantic import BaseModel
 
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
 
 class User(BaseModel):
     username: str
-    password: str
+    hashed_password: str
     company: str
     role: str
     disabled: bool = False
@@ -14,21 +17,21 @@ class User(BaseModel):
 USERS: List[User] = [
     User(
         username="admin",
-        password="wkwkwk",
+        hashed_password="$2b$12$GXo0qpwrn9/biQZYKvmz6ehNkC2ECm878n39o6Lt.03mj8s3IVy52",
         company="company_a",
         role="admin",
         disabled=False,
     ),
     User(
         username="user1",
-        password="wkwkwk",
+        hashed_password="$2b$12$I2Vi9jA8/n3iyTBCANIpy.hwt3l6D3Q0oB5ko/M6WKOnytFR7RzlG",
         company="company_a",
         role="user",
         disabled=False,
     ),
     User(
         username="user2",
-        password="password2",
+        hashed_password="$2b$12$pVWpOFYVnVa7Hn5e5NhBSOMkkK60sAVDzcLWBaaSFhUEDFDDenBcG",
         company="company_b",
         role="user",
         disabled=False,
@@ -36,6 +39,45 @@ USERS: List[User] = [
 ]
 
 
+# Checked when the username is unknown, so both cases take as long
+DUMMY_PASSWORD_HASH = "$2b$12$K452GNHM2xFfnlwiXp/J8.caUoFKbsivotOOkIJwYWkxxumUk66qK"
+
+
+def hash_password(password: str) -> str:
+    """Slow (bcrypt), call it off the event loop"""
+    return pwd_context.hash(password)
+
+
+def verify_password(password: str, hashed_password: str) -> bool:
+    """Slow (bcrypt), call it off the event loop"""
+    return pwd_context.verify(password, hashed_password)
+
+
+# Bumped on every change to USERS so cached audiences can be invalidated
+_directory_version = 0
+
+
+def get_directory_version() -> int:
+    return _directory_version
+
+
+def add_user(user: User):
+    global _directory_version
+    remove_user(user.username)
+    USERS.append(user)
+    _directory_version += 1
+
+
+def remove_user(username: str) -> bool:
+    global _directory_version
+    for index, user in enumerate(USERS):
+        if user.username == username:
+            del USERS[index]
+            _directory_version += 1
+            return True
+    return False
+
+
 # Helper functions
 def get_user_by_username(username: str) -> User | None:
     return next((user for user in USERS if user.username == username), None)
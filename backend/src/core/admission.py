@@ -0,0 +1,174 @@
+from collections import OrderedDict
+from typing import Dict, Optional
+from fastapi.requests import HTTPConnection
+import logging
+import random
+import time
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a WebSocket handshake is refused by admission control"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def consume(self, now: float, tokens: float = 1.0) -> float:
+        """Take tokens from the bucket, return 0 on success or seconds to wait"""
+        self._refill(now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        if self.rate <= 0:
+            return float("inf")
+        return (tokens - self.tokens) / self.rate
+
+    def is_full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_concurrent_handshakes: int,
+        ip_rate: float,
+        ip_burst: int,
+        user_rate: float,
+        user_burst: int,
+        max_sockets_per_user: int,
+        retry_after: float,
+        max_tracked_keys: int = 10000,
+    ):
+        self.max_concurrent_handshakes = max_concurrent_handshakes
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_sockets_per_user = max_sockets_per_user
+        self.retry_after = retry_after
+        self.max_tracked_keys = max_tracked_keys
+
+        self.in_flight_handshakes = 0
+        # Least recently used first, capped at max_tracked_keys
+        self.ip_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.user_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.rejections: Dict[str, int] = {}
+
+    def _jittered(self, delay: float) -> float:
+        """Spread retries over [delay, 2 * delay] so rejected clients don't return together"""
+        delay = max(delay, self.retry_after)
+        return round(delay + random.uniform(0, delay), 2)
+
+    def _reject(self, reason: str, delay: float):
+        self.rejections[reason] = self.rejections.get(reason, 0) + 1
+        raise AdmissionRejected(reason, self._jittered(delay))
+
+    def _take(
+        self,
+        buckets: "OrderedDict[str, TokenBucket]",
+        key: str,
+        rate: float,
+        burst: int,
+        now: float,
+    ) -> float:
+        bucket = buckets.get(key)
+        if bucket is None:
+            self._prune(buckets, now)
+            bucket = buckets[key] = TokenBucket(rate, burst, now)
+        else:
+            buckets.move_to_end(key)
+        return bucket.consume(now)
+
+    def _prune(self, buckets: "OrderedDict[str, TokenBucket]", now: float):
+        """Make room for a new key in O(1) amortized.
+
+        Buckets that have refilled completely carry no state and are dropped
+        from the least recently used end. If the dict is still full, the
+        least recently used bucket goes, which at worst hands that key a
+        fresh burst.
+        """
+        while buckets and next(iter(buckets.values())).is_full(now):
+            buckets.popitem(last=False)
+        while len(buckets) >= self.max_tracked_keys:
+            buckets.popitem(last=False)
+
+    def begin_handshake(self, client_ip: Optional[str]):
+        """Reserve a handshake slot, checked before any token decoding happens"""
+        if self.in_flight_handshakes >= self.max_concurrent_handshakes:
+            self._reject("handshake_limit", self.retry_after)
+
+        if client_ip:
+            wait = self._take(
+                self.ip_buckets, client_ip, self.ip_rate, self.ip_burst, time.monotonic()
+            )
+            if wait:
+                self._reject("ip_rate_limit", wait)
+
+        self.in_flight_handshakes += 1
+
+    def end_handshake(self):
+        self.in_flight_handshakes = max(0, self.in_flight_handshakes - 1)
+
+    def admit_user(self, username: str):
+        """Apply the per-user handshake rate once the token has been validated"""
+        wait = self._take(
+            self.user_buckets,
+            username,
+            self.user_rate,
+            self.user_burst,
+            time.monotonic(),
+        )
+        if wait:
+            self._reject("user_rate_limit", wait)
+
+    def get_stats(self) -> dict:
+        return {
+            "in_flight_handshakes": self.in_flight_handshakes,
+            "tracked_ips": len(self.ip_buckets),
+            "tracked_users": len(self.user_buckets),
+            "rejections": dict(self.rejections),
+        }
+
+
+def get_client_ip(websocket: HTTPConnection) -> Optional[str]:
+    if settings.WS_TRUST_PROXY_HEADERS:
+        forwarded = websocket.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+        real_ip = websocket.headers.get("x-real-ip")
+        if real_ip:
+            return real_ip
+    return websocket.client.host if websocket.client else None
+
+
+# Create a global instance
+admission_controller = AdmissionController(
+    max_concurrent_handshakes=settings.WS_MAX_CONCURRENT_HANDSHAKES,
+    ip_rate=settings.WS_HANDSHAKE_IP_RATE,
+    ip_burst=settings.WS_HANDSHAKE_IP_BURST,
+    user_rate=settings.WS_HANDSHAKE_USER_RATE,
+    user_burst=settings.WS_HANDSHAKE_USER_BURST,
+    max_sockets_per_user=settings.WS_MAX_SOCKETS_PER_USER,
+    retry_after=settings.WS_RETRY_AFTER_SECONDS,
+)
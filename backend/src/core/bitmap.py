@@ -0,0 +1,82 @@
+from typing import Iterator, Optional, Set
+
+
+class Bitmap:
+    """Set of small non-negative ints, e.g. dense user numbers.
+
+    Starts as a plain set and switches to a bytearray with one bit per
+    number once that is the smaller of the two, roaring-style: a handful
+    of members costs a few bytes each, 100k members cost 12.5 KB.
+    """
+
+    __slots__ = ("sparse", "bits", "count", "high")
+
+    # Approximate size of one set member in bits (int object plus hash slot)
+    MEMBER_BITS = 512
+
+    def __init__(self):
+        self.sparse: Optional[Set[int]] = set()
+        self.bits: Optional[bytearray] = None
+        self.count = 0
+        self.high = -1
+
+    def __contains__(self, number: int) -> bool:
+        if self.bits is None:
+            return number in self.sparse
+        byte = number >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << (number & 7)))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[int]:
+        if self.bits is None:
+            yield from self.sparse
+            return
+        for byte_index, byte in enumerate(self.bits):
+            while byte:
+                low = byte & -byte
+                yield (byte_index << 3) + low.bit_length() - 1
+                byte ^= low
+
+    def add(self, number: int) -> bool:
+        """Add a number, False if it was already a member"""
+        if number in self:
+            return False
+        self.count += 1
+        if number > self.high:
+            self.high = number
+        if self.bits is None:
+            self.sparse.add(number)
+            if self.count * self.MEMBER_BITS > self.high + 1:
+                self._densify()
+            return True
+        byte = number >> 3
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(byte + 1 - len(self.bits)))
+        self.bits[byte] |= 1 << (number & 7)
+        return True
+
+    def discard(self, number: int) -> bool:
+        """Remove a number, False if it was not a member"""
+        if number not in self:
+            return False
+        self.count -= 1
+        if self.bits is None:
+            self.sparse.discard(number)
+        else:
+            self.bits[number >> 3] &= ~(1 << (number & 7)) & 0xFF
+        return True
+
+    def _densify(self):
+        bits = bytearray((self.high >> 3) + 1)
+        for number in self.sparse:
+            bits[number >> 3] |= 1 << (number & 7)
+        self.bits = bits
+        self.sparse = None
+
+    def nbytes(self) -> int:
+        """Approximate payload size, for stats"""
+        if self.bits is None:
+            return self.count * self.MEMBER_BITS // 8
+        return len(self.bits)
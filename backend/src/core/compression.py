@@ -0,0 +1,162 @@
+from collections import OrderedDict
+from typing import Optional, Tuple
+import logging
+import time
+from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+from websockets import frames
+from websockets.extensions.permessage_deflate import (
+    PerMessageDeflate,
+    ServerPerMessageDeflateFactory,
+)
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CompressionStats:
+    """Deflate work across all sockets, CPU time measured on the event loop thread"""
+
+    def __init__(self, shared_size: int = settings.WS_COMPRESSION_SHARED_CACHE_SIZE):
+        self.frames_compressed = 0
+        self.frames_shared = 0
+        self.frames_skipped = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.bytes_skipped = 0
+        self.cpu_ns = 0
+        # (window bits, payload) -> compressed payload, for messages sent
+        # without context takeover, whose output depends on nothing else
+        self.shared: "OrderedDict[Tuple[int, bytes], bytes]" = OrderedDict()
+        self.shared_size = shared_size
+
+    def lookup(self, key: Tuple[int, bytes]) -> Optional[bytes]:
+        data = self.shared.get(key)
+        if data is not None:
+            self.shared.move_to_end(key)
+        return data
+
+    def store(self, key: Tuple[int, bytes], data: bytes):
+        self.shared[key] = data
+        if len(self.shared) > self.shared_size:
+            self.shared.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": settings.WS_COMPRESSION_ENABLED,
+            "frames_compressed": self.frames_compressed,
+            "frames_shared": self.frames_shared,
+            "frames_skipped": self.frames_skipped,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "bytes_skipped": self.bytes_skipped,
+            "ratio": round(self.bytes_out / self.bytes_in, 4) if self.bytes_in else None,
+            "cpu_seconds": round(self.cpu_ns / 1e9, 6),
+        }
+
+
+class SharedPerMessageDeflate(PerMessageDeflate):
+    """permessage-deflate that leaves small messages uncompressed and, without
+    context takeover, compresses a payload once for every socket sending it.
+    """
+
+    def __init__(self, *args, min_size: int = 0, stats: CompressionStats, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.min_size = min_size
+        self.stats = stats
+        # Whether the first frame of the message being sent was compressed
+        self.encode_cont_data = False
+
+    def encode(self, frame: frames.Frame) -> frames.Frame:
+        if frame.opcode in frames.CTRL_OPCODES:
+            return frame
+        if frame.opcode is frames.OP_CONT:
+            if not self.encode_cont_data:
+                return frame
+            return self._compress(frame)
+
+        # RSV1 unset tells the client this message is not compressed
+        if frame.fin and len(frame.data) < self.min_size:
+            self.encode_cont_data = False
+            self.stats.frames_skipped += 1
+            self.stats.bytes_skipped += len(frame.data)
+            return frame
+        self.encode_cont_data = True
+
+        if not (frame.fin and self.local_no_context_takeover):
+            return self._compress(frame)
+
+        key = (self.local_max_window_bits, bytes(frame.data))
+        data = self.stats.lookup(key)
+        if data is None:
+            encoded = self._compress(frame)
+            self.stats.store(key, bytes(encoded.data))
+            return encoded
+        self.stats.frames_shared += 1
+        self.stats.bytes_in += len(frame.data)
+        self.stats.bytes_out += len(data)
+        return frames.Frame(frame.opcode, data, True, True, frame.rsv2, frame.rsv3)
+
+    def _compress(self, frame: frames.Frame) -> frames.Frame:
+        started = time.thread_time_ns()
+        encoded = super().encode(frame)
+        self.stats.cpu_ns += time.thread_time_ns() - started
+        self.stats.frames_compressed += 1
+        self.stats.bytes_in += len(frame.data)
+        self.stats.bytes_out += len(encoded.data)
+        return encoded
+
+
+class SharedPerMessageDeflateFactory(ServerPerMessageDeflateFactory):
+    """Negotiates like the websockets factory, builds SharedPerMessageDeflate"""
+
+    def __init__(self, *args, min_size: int = 0, stats: CompressionStats, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.min_size = min_size
+        self.stats = stats
+
+    def process_request_params(self, params, accepted_extensions):
+        response_params, extension = super().process_request_params(
+            params, accepted_extensions
+        )
+        return response_params, SharedPerMessageDeflate(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings,
+            min_size=self.min_size,
+            stats=self.stats,
+        )
+
+
+def create_deflate_factory(stats: CompressionStats) -> SharedPerMessageDeflateFactory:
+    return SharedPerMessageDeflateFactory(
+        server_no_context_takeover=not settings.WS_COMPRESSION_CONTEXT_TAKEOVER,
+        server_max_window_bits=settings.WS_COMPRESSION_WINDOW_BITS,
+        compress_settings={
+            "level": settings.WS_COMPRESSION_LEVEL,
+            "memLevel": settings.WS_COMPRESSION_MEM_LEVEL,
+        },
+        min_size=settings.WS_COMPRESSION_MIN_SIZE,
+        stats=stats,
+    )
+
+
+class CompressedWebSocketProtocol(WebSocketProtocol):
+    """uvicorn's websockets protocol with the WS_COMPRESSION_* settings.
+
+    uvicorn only offers permessage-deflate with fixed parameters, pass this
+    class as ws= to uvicorn.run to configure it (see main.py).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if settings.WS_COMPRESSION_ENABLED and self.config.ws_per_message_deflate:
+            self.available_extensions = [deflate_factory]
+        else:
+            self.available_extensions = []
+
+
+# Create a global instance
+compression_stats = CompressionStats()
+deflate_factory = create_deflate_factory(compression_stats)
@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings
+from typing import Dict, List, Optional
 import os
 from dotenv import load_dotenv
 
@@ -21,8 +22,134 @@ class Settings(BaseSettings):
 
     FRONTEND_URL: str = "http://localhost:80"
     LOG_LEVEL: str = "INFO"
+    HOST: str = "0.0.0.0"
     PORT: int = 8000
 
+    # Password checks run in a thread pool, logins beyond max pending get 503
+    AUTH_HASH_WORKERS: int = 2
+    AUTH_MAX_PENDING_VERIFICATIONS: int = 32
+
+    # Redis
+    REDIS_URL: str = "redis://localhost:6379"
+    REDIS_MAX_CONNECTIONS: int = 50
+
+    # Identifies this backend node and must stay the same across restarts.
+    # The app refuses to start with REDIS_STREAM_ENABLED and no NODE_ID;
+    # presence and node number hashing use the hostname when it is unset
+    NODE_ID: Optional[str] = None
+    # 0-1023, part of every generated id and unique per node. Required with
+    # REDIS_STREAM_ENABLED or the redis connection manager; a single node
+    # falls back to a hash of NODE_ID, with a warning
+    ID_NODE_NUMBER: Optional[int] = None
+
+    # Presence index in Redis, refreshed by each node's heartbeat
+    PRESENCE_HEARTBEAT_SECONDS: float = 10.0
+    PRESENCE_TTL_SECONDS: float = 30.0  # users not refreshed for this long are offline
+
+    # Connection manager behind the endpoints and fan-out: "memory" (send
+    # queues), "redis" (memory plus the presence index) or "topic"
+    CONNECTION_MANAGER_BACKEND: str = "memory"
+
+    # Cross-node delivery through a Redis stream, one consumer group per node
+    REDIS_STREAM_ENABLED: bool = False
+    REDIS_STREAM_KEY: str = "notifications:fanout"
+    REDIS_STREAM_BATCH_SIZE: int = 100  # entries per XREADGROUP
+    REDIS_STREAM_BLOCK_MS: int = 1000
+    REDIS_STREAM_MAXLEN: int = 100000  # approximate, applied on XADD
+    REDIS_STREAM_RETENTION_SECONDS: float = 3600.0  # older entries are trimmed
+    REDIS_STREAM_TRIM_INTERVAL_SECONDS: float = 60.0
+
+    # WebSocket admission control
+    WS_MAX_CONCURRENT_HANDSHAKES: int = 100
+    WS_HANDSHAKE_IP_RATE: float = 5.0  # handshakes per second per IP
+    WS_HANDSHAKE_IP_BURST: int = 20
+    WS_HANDSHAKE_USER_RATE: float = 1.0  # handshakes per second per user
+    WS_HANDSHAKE_USER_BURST: int = 5
+    WS_MAX_SOCKETS_PER_USER: int = 5
+    WS_RETRY_AFTER_SECONDS: float = 2.0
+    WS_TRUST_PROXY_HEADERS: bool = False
+
+    # permessage-deflate on /ws/notification, applied when started with python main.py
+    WS_COMPRESSION_ENABLED: bool = True
+    WS_COMPRESSION_LEVEL: int = 6  # zlib level, 1 fastest to 9 smallest
+    WS_COMPRESSION_MEM_LEVEL: int = 8  # zlib memLevel, lower saves memory per socket
+    WS_COMPRESSION_WINDOW_BITS: Optional[int] = None  # 8-15, None lets the client pick
+    # Off resets the compressor per message, so a broadcast is compressed once
+    WS_COMPRESSION_CONTEXT_TAKEOVER: bool = False
+    WS_COMPRESSION_MIN_SIZE: int = 256  # smaller messages are sent uncompressed
+    WS_COMPRESSION_SHARED_CACHE_SIZE: int = 64  # compressed payloads kept for sharing
+
+    # subscribe/unsubscribe filters a connection can send
+    WS_MAX_SUBSCRIPTIONS: int = 20  # filters per connection
+    WS_SUBSCRIPTION_MAX_VALUES: int = 10  # types or priorities per filter
+    WS_SUBSCRIPTION_MAX_TOPIC: int = 100  # characters
+
+    # Outbound messages buffered per connection before the oldest is dropped
+    WS_SEND_QUEUE_SIZE: int = 1000
+    # A lower priority lane waiting longer than this is served before higher ones
+    WS_LANE_MAX_WAIT_SECONDS: float = 0.5
+    # Connections tracked as candidates for the slowest/noisiest report
+    WS_STATS_TOP_K: int = 100
+    # Inbound frame rate behind the noisiest report, decayed with this half-life
+    WS_RECEIVE_RATE_HALF_LIFE_SECONDS: float = 60.0
+    # Connections dropped after a failed write stay in the report this long
+    WS_FAILED_CONNECTIONS_TTL_SECONDS: float = 300.0
+    # Recipients handled per fan-out step before yielding to the event loop
+    FANOUT_CHUNK_SIZE: int = 500
+    # Relative fan-out share of a company when several are pending, 1.0 if unset
+    FANOUT_TENANT_WEIGHTS: Dict[str, float] = {}
+
+    # Broadcast audiences (selector -> recipients) kept resolved
+    AUDIENCE_CACHE_SIZE: int = 1024
+
+    # Idempotency-Key dedupe of broadcast and notification requests
+    IDEMPOTENCY_TTL_SECONDS: float = 86400.0
+    IDEMPOTENCY_CACHE_SIZE: int = 10000  # keys kept on each node
+    IDEMPOTENCY_REDIS_ENABLED: bool = False  # share keys between nodes
+    IDEMPOTENCY_REDIS_PREFIX: str = "idempotency:"
+
+    # Delivery tracing, inspect with GET /api/debug/traces
+    TRACING_ENABLED: bool = True
+    # Share of requests traced; tracing adds work per recipient on the fan-out
+    # path, scripts/replay_traffic.py traces everything
+    TRACE_SAMPLE_RATE: float = 0.01
+    TRACE_BUFFER_SIZE: int = 200  # finished traces kept in memory
+    TRACE_EXPORT_PATH: Optional[str] = None  # OTLP/JSON lines file
+    TRACE_PATH_PREFIXES: List[str] = ["/api/broadcast", "/api/notifications"]
+
+    # Traffic capture for scripts/replay_traffic.py, off unless a path is set
+    RECORD_TRAFFIC_PATH: Optional[str] = None  # NDJSON file
+    RECORD_PATH_PREFIXES: List[str] = ["/api/broadcast", "/api/notifications"]
+
+    # Changes kept per user for ?since_version= delta sync
+    FEED_CHANGELOG_SIZE: int = 500
+
+    # Scheduled notifications
+    SCHEDULER_RELEASE_RATE: float = 50.0  # due items released per second
+    SCHEDULER_RELEASE_BURST: int = 10
+    SCHEDULER_STORE_PATH: Optional[str] = None  # JSON file, enables persistence
+    SCHEDULER_PERSIST_DELAY_SECONDS: float = 0.5  # changes batched into one write
+
+    # Server-Sent Events
+    # Messages being fanned out, kept as encoded frames
+    SSE_ENCODE_CACHE_SIZE: int = 256
+    SSE_REPLAY_BUFFER_SIZE: int = 100  # events per user kept for Last-Event-ID
+    SSE_RESUME_TTL_SECONDS: float = 300.0  # how long a closed stream can resume
+    SSE_KEEPALIVE_SECONDS: float = 15.0
+
+    # WebSocket inbound frame limits
+    WS_MAX_INBOUND_FRAME_SIZE: int = 4096  # characters per text frame
+    WS_INBOUND_RATE: float = 5.0  # frames per second per connection
+    WS_INBOUND_BURST: int = 20
+    WS_INBOUND_MAX_VIOLATIONS: int = 10  # dropped frames before the socket is closed
+    WS_INBOUND_VIOLATION_WINDOW: float = 60.0
+
+    # Graceful drain for rolling deploys
+    WS_DRAIN_ON_SIGTERM: bool = True
+    WS_DRAIN_WINDOW_SECONDS: float = 20.0
+    WS_DRAIN_RECONNECT_JITTER_SECONDS: float = 10.0
+    WS_DRAIN_TARGET_ENDPOINT: Optional[str] = None
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
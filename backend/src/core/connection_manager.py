@@ -0,0 +1,431 @@
+from typing import Any, Dict, List, Optional, Protocol, Tuple, runtime_checkable
+import asyncio
+import logging
+from src.core.config import settings
+from src.core.metrics import LatencyStats, TopK
+from src.core.priority import LANES, NORMAL
+from src.core.sse import SSEConnection, SSEEvent, sse_hub
+from src.core.subscriptions import Route, subscription_index
+from src.core.tracing import Trace, current_trace
+from src.core.websocket import (
+    ConnectionQueue,
+    ConnectionStats,
+    RecentFailures,
+    connection_report,
+    describe_stats,
+    record_received,
+    websocket_manager,
+)
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("memory", "redis", "topic")
+
+
+@runtime_checkable
+class ConnectionManager(Protocol):
+    """What the endpoints and the delivery pipeline need from a manager.
+
+    Messages are serialized strings. version changes whenever a user gets
+    their first or loses their last connection on this node.
+    """
+
+    version: int
+
+    async def connect(self, websocket: Any, user_id: str) -> None: ...
+
+    async def disconnect(self, websocket: Any, user_id: str) -> None: ...
+
+    def enqueue(
+        self,
+        user_id: str,
+        message: str,
+        collapse_key: Optional[str] = None,
+        lane: str = NORMAL,
+        trace: Optional[Trace] = None,
+        route: Optional[Route] = None,
+    ) -> None:
+        """Hand a message to the user's sockets without waiting for the write.
+
+        A routed message only goes to sockets whose subscriptions match it.
+        """
+
+    async def send_personal_message(self, message: str, user_id: str) -> None: ...
+
+    async def broadcast(self, message: str) -> None: ...
+
+    def is_connected(self, user_id: str) -> bool: ...
+
+    def connected_users(self) -> List[str]: ...
+
+    def connections(self) -> List[Tuple[str, Any]]:
+        """Snapshot of (user_id, socket) pairs"""
+
+    def connection_count(self) -> int: ...
+
+    async def evict_oldest(self, user_id: str, max_sockets: int) -> List[Any]:
+        """Disconnect the oldest sockets of a user above max_sockets and return them"""
+
+    def record_received(self, websocket: Any, size: int) -> None:
+        """Count an inbound frame of a socket"""
+
+    def get_queue_stats(self) -> dict: ...
+
+    def get_connection_report(self, sort: str, limit: int) -> dict:
+        """Slowest ("slowest") or noisiest ("noisiest") connections"""
+
+
+class InMemoryConnectionManager:
+    """Per-connection send queues with lanes and collapse keys (src/core/websocket)"""
+
+    name = "memory"
+
+    def __init__(self, manager=websocket_manager):
+        self.manager = manager
+        manager.on_write_error = self.disconnect
+
+    @property
+    def version(self) -> int:
+        return self.manager.version
+
+    async def connect(self, websocket: Any, user_id: str):
+        await self.manager.connect(websocket, user_id)
+        subscription_index.add(websocket, user_id)
+
+    async def disconnect(self, websocket: Any, user_id: str):
+        self.manager.disconnect(websocket, user_id)
+        subscription_index.remove(websocket)
+
+    def enqueue(
+        self,
+        user_id: str,
+        message: str,
+        collapse_key: Optional[str] = None,
+        lane: str = NORMAL,
+        trace: Optional[Trace] = None,
+        route: Optional[Route] = None,
+    ):
+        self.manager.enqueue(user_id, message, collapse_key, lane, trace, route)
+
+    async def send_personal_message(self, message: str, user_id: str):
+        await self.manager.send_personal_message(message, user_id)
+
+    async def broadcast(self, message: str):
+        await self.manager.broadcast(message)
+
+    def is_connected(self, user_id: str) -> bool:
+        return user_id in self.manager.active_connections
+
+    def connected_users(self) -> List[str]:
+        return list(self.manager.active_connections)
+
+    def connections(self) -> List[Tuple[str, Any]]:
+        return [
+            (user_id, websocket)
+            for user_id, sockets in self.manager.active_connections.items()
+            for websocket in list(sockets)
+        ]
+
+    def connection_count(self) -> int:
+        return sum(len(sockets) for sockets in self.manager.active_connections.values())
+
+    async def evict_oldest(self, user_id: str, max_sockets: int) -> List[Any]:
+        evicted = self.manager.evict_oldest(user_id, max_sockets)
+        for websocket in evicted:
+            subscription_index.remove(websocket)
+        return evicted
+
+    def record_received(self, websocket: Any, size: int):
+        self.manager.record_received(websocket, size)
+
+    def get_queue_stats(self) -> dict:
+        return self.manager.get_queue_stats()
+
+    def get_connection_report(self, sort: str, limit: int) -> dict:
+        return self.manager.get_connection_report(sort, limit)
+
+
+class RedisConnectionManager(InMemoryConnectionManager):
+    """In-memory delivery plus the cluster presence index in Redis.
+
+    Presence errors are logged and never fail a handshake or a delivery.
+    """
+
+    name = "redis"
+
+    def __init__(self, manager=websocket_manager, presence=None):
+        super().__init__(manager)
+        if presence is None:
+            from src.core.redis_websocket import redis_websocket_manager
+
+            presence = redis_websocket_manager
+        self.presence = presence
+
+    async def connect(self, websocket: Any, user_id: str):
+        await super().connect(websocket, user_id)
+        try:
+            await self.presence.connect(websocket, user_id)
+        except Exception as e:
+            logger.error(f"Presence of {user_id} not recorded: {e}")
+
+    async def disconnect(self, websocket: Any, user_id: str):
+        await super().disconnect(websocket, user_id)
+        await self.presence.disconnect(websocket, user_id)
+
+    async def evict_oldest(self, user_id: str, max_sockets: int) -> List[Any]:
+        evicted = await super().evict_oldest(user_id, max_sockets)
+        for websocket in evicted:
+            await self.presence.disconnect(websocket, user_id)
+        return evicted
+
+
+class TopicConnectionManager:
+    """Topic subscriptions (app/core/websocket/manager), one client per socket.
+
+    Each socket subscribes to its company and company/user topic; a user's
+    messages go to the sockets of their user topic. The topic manager only
+    keeps the registrations: writes go through a bounded ConnectionQueue per
+    socket like the memory backend, so lanes, collapse keys and per-socket
+    order hold here too. Messages are recorded in the SSE hub and SSE
+    streams are written the recorded event.
+    """
+
+    name = "topic"
+
+    def __init__(self, manager=None):
+        if manager is None:
+            from app.core.websocket.manager import WebSocketManager
+
+            manager = WebSocketManager()
+        self.manager = manager
+        self.version = 0
+        # user_id -> client id -> socket, for each socket of the user
+        self.clients: Dict[str, Dict[str, Any]] = {}
+        self.user_topics: Dict[str, str] = {}
+        self.stats: Dict[Any, ConnectionStats] = {}
+        self.slowest = TopK(settings.WS_STATS_TOP_K)
+        self.noisiest = TopK(settings.WS_STATS_TOP_K)
+        self.failures = RecentFailures()
+        self.queues: Dict[Any, ConnectionQueue] = {}
+        self.writers: Dict[Any, asyncio.Task] = {}
+        self.lane_latency: Dict[str, LatencyStats] = {
+            lane: LatencyStats() for lane in LANES
+        }
+
+    @staticmethod
+    def client_id(websocket: Any, user_id: str) -> str:
+        return f"{user_id}#{id(websocket):x}"
+
+    def _user_topic(self, user_id: str) -> str:
+        topic = self.user_topics.get(user_id)
+        if topic is None:
+            from src.config.users import get_user_by_username
+
+            user = get_user_by_username(user_id)
+            company = user.company if user is not None else "unknown"
+            topic = f"company/{company}/user/{user_id}"
+        return topic
+
+    async def connect(self, websocket: Any, user_id: str):
+        topic = self._user_topic(user_id)
+        company_topic = "/".join(topic.split("/")[:2])
+        client_id = self.client_id(websocket, user_id)
+        await self.manager.connect(
+            websocket, client_id, "", ["global", company_topic, topic]
+        )
+        if user_id not in self.clients:
+            self.clients[user_id] = {}
+            self.user_topics[user_id] = topic
+            self.version += 1
+        self.clients[user_id][client_id] = websocket
+        stats = self.stats[websocket] = ConnectionStats(user_id)
+        queue = self.queues[websocket] = ConnectionQueue(
+            websocket,
+            settings.WS_SEND_QUEUE_SIZE,
+            settings.WS_LANE_MAX_WAIT_SECONDS,
+            self.lane_latency,
+            stats,
+            self.slowest,
+        )
+        self.writers[websocket] = asyncio.create_task(self._write(queue, user_id))
+        subscription_index.add(websocket, user_id)
+
+    async def _write(self, queue: ConnectionQueue, user_id: str):
+        try:
+            await queue.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending message to user {user_id}: {e}")
+            stats = self.stats.get(queue.websocket)
+            if stats is not None:
+                self.failures.add(describe_stats(queue.websocket, stats, queue.size), e)
+            await self.disconnect(queue.websocket, user_id)
+
+    async def disconnect(self, websocket: Any, user_id: str):
+        client_id = self.client_id(websocket, user_id)
+        self._forget(user_id, client_id)
+        await self.manager.disconnect(client_id)
+
+    def _forget(self, user_id: str, client_id: str):
+        clients = self.clients.get(user_id)
+        if clients is None:
+            return
+        websocket = clients.pop(client_id, None)
+        if websocket is not None:
+            self.stats.pop(websocket, None)
+            self.slowest.discard(websocket)
+            self.noisiest.discard(websocket)
+            subscription_index.remove(websocket)
+            writer = self.writers.pop(websocket, None)
+            if writer is not None and writer is not asyncio.current_task():
+                writer.cancel()
+            queue = self.queues.pop(websocket, None)
+            if queue is not None:
+                queue.discard()
+        if not clients:
+            del self.clients[user_id]
+            del self.user_topics[user_id]
+            self.version += 1
+
+    def _put(
+        self,
+        websocket: Any,
+        message: str,
+        event: Optional[SSEEvent],
+        collapse_key: Optional[str],
+        lane: str,
+        trace: Optional[Trace],
+    ):
+        queue = self.queues.get(websocket)
+        if queue is None:
+            return
+        if event is not None and isinstance(websocket, SSEConnection):
+            # SSE streams get the recorded event
+            queue.put(event, collapse_key, lane, trace)
+        else:
+            queue.put(message, collapse_key, lane, trace)
+
+    def enqueue(
+        self,
+        user_id: str,
+        message: str,
+        collapse_key: Optional[str] = None,
+        lane: str = NORMAL,
+        trace: Optional[Trace] = None,
+        route: Optional[Route] = None,
+    ):
+        # Recorded right away, so resume order is the order of the calls
+        event = self._record(user_id, message)
+        topic = self.user_topics.get(user_id)
+        if topic is None:
+            return
+        sockets = [
+            connection.websocket
+            for connection in self.manager.topics.get(topic, ())
+        ]
+        if route is not None and subscription_index.has_filters(user_id):
+            sockets = [
+                websocket
+                for websocket in sockets
+                if subscription_index.accepts(websocket, route)
+            ]
+        for websocket in sockets:
+            self._put(websocket, message, event, collapse_key, lane, trace)
+
+    @staticmethod
+    def _record(user_id: str, message: str) -> Optional[SSEEvent]:
+        """The event for the user's SSE streams, kept for Last-Event-ID resume"""
+        if sse_hub.is_tracked(user_id):
+            return sse_hub.record(user_id, message)
+        return None
+
+    async def send_personal_message(self, message: str, user_id: str):
+        self.enqueue(user_id, message, trace=current_trace())
+
+    async def broadcast(self, message: str):
+        events = sse_hub.record_all(message)
+        trace = current_trace()
+        for user_id, clients in self.clients.items():
+            event = events.get(user_id)
+            for websocket in clients.values():
+                self._put(websocket, message, event, None, NORMAL, trace)
+
+    def is_connected(self, user_id: str) -> bool:
+        return user_id in self.clients
+
+    def connected_users(self) -> List[str]:
+        return list(self.clients)
+
+    def connections(self) -> List[Tuple[str, Any]]:
+        return [
+            (user_id, websocket)
+            for user_id, clients in self.clients.items()
+            for client_id, websocket in list(clients.items())
+            if client_id in self.manager.connections
+        ]
+
+    def connection_count(self) -> int:
+        return len(self.manager.connections)
+
+    async def evict_oldest(self, user_id: str, max_sockets: int) -> List[Any]:
+        clients = self.clients.get(user_id)
+        if not clients or len(clients) <= max_sockets:
+            return []
+        by_age = sorted(
+            clients.values(),
+            key=lambda ws: self.stats[ws].connected_since if ws in self.stats else 0.0,
+        )
+        evicted = by_age[: len(clients) - max_sockets]
+        for websocket in evicted:
+            await self.disconnect(websocket, user_id)
+        return evicted
+
+    def record_received(self, websocket: Any, size: int):
+        stats = self.stats.get(websocket)
+        if stats is not None:
+            record_received(stats, size, self.noisiest, websocket)
+
+    def get_queue_stats(self) -> dict:
+        return {
+            "queued": sum(queue.size for queue in self.queues.values()),
+            "collapsed": sum(queue.collapsed for queue in self.queues.values()),
+            "dropped": sum(queue.dropped for queue in self.queues.values()),
+            "lane_latency": {
+                lane: stats.to_dict() for lane, stats in self.lane_latency.items()
+            },
+        }
+
+    def describe_connection(self, websocket: Any) -> Optional[dict]:
+        stats = self.stats.get(websocket)
+        if stats is None:
+            return None
+        queue = self.queues.get(websocket)
+        return describe_stats(websocket, stats, queue.size if queue is not None else 0)
+
+    def get_connection_report(self, sort: str, limit: int) -> dict:
+        ranking = self.slowest if sort == "slowest" else self.noisiest
+        return connection_report(
+            ranking,
+            len(self.stats),
+            sort,
+            limit,
+            self.describe_connection,
+            self.failures,
+        )
+
+
+def create_connection_manager(backend: str) -> ConnectionManager:
+    if backend == "memory":
+        return InMemoryConnectionManager()
+    if backend == "redis":
+        return RedisConnectionManager()
+    if backend == "topic":
+        return TopicConnectionManager()
+    raise ValueError(
+        f"Unknown CONNECTION_MANAGER_BACKEND {backend!r}, expected one of {BACKENDS}"
+    )
+
+
+# Create a global instance
+connection_manager = create_connection_manager(settings.CONNECTION_MANAGER_BACKEND)
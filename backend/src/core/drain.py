@@ -0,0 +1,176 @@
+from typing import Callable, List, Optional
+from fastapi import WebSocket, status
+import asyncio
+import json
+import logging
+import random
+import signal
+import threading
+from src.core.config import settings
+from src.core.connection_manager import connection_manager
+
+logger = logging.getLogger(__name__)
+
+
+class DrainController:
+    def __init__(
+        self,
+        window_seconds: float = settings.WS_DRAIN_WINDOW_SECONDS,
+        reconnect_jitter_seconds: float = settings.WS_DRAIN_RECONNECT_JITTER_SECONDS,
+        target_endpoint: Optional[str] = settings.WS_DRAIN_TARGET_ENDPOINT,
+    ):
+        self.window_seconds = window_seconds
+        self.reconnect_jitter_seconds = reconnect_jitter_seconds
+        self.target_endpoint = target_endpoint
+
+        self.draining = False
+        self.total = 0
+        self.closed = 0
+        self.drain_task: Optional[asyncio.Task] = None
+        self._on_complete: List[Callable[[], None]] = []
+        self._previous_sigterm_handler = None
+        self._sigterm_received = False
+
+    def start(
+        self,
+        window_seconds: Optional[float] = None,
+        target_endpoint: Optional[str] = None,
+    ) -> bool:
+        """Stop admitting handshakes and start closing sockets over the window"""
+        if self.draining:
+            return False
+
+        self.draining = True
+        window = self.window_seconds if window_seconds is None else window_seconds
+        target = target_endpoint or self.target_endpoint
+        self.drain_task = asyncio.create_task(self._drain(window, target))
+        return True
+
+    def stop(self) -> bool:
+        """Cancel an ongoing drain and accept handshakes again"""
+        if not self.draining or self._sigterm_received:
+            return False
+        if self.drain_task and not self.drain_task.done():
+            self.drain_task.cancel()
+        self.draining = False
+        return True
+
+    async def shutdown(self):
+        """Cancel a drain still running when the application stops"""
+        if self.drain_task is not None and not self.drain_task.done():
+            self.drain_task.cancel()
+            try:
+                await self.drain_task
+            except asyncio.CancelledError:
+                pass
+
+    def reconnect_delay(self) -> float:
+        """Randomized delay (seconds) a drained client should wait before reconnecting"""
+        return round(random.uniform(0, self.reconnect_jitter_seconds), 2)
+
+    def when_drained(self, callback: Callable[[], None]):
+        if self.drain_task is None or self.drain_task.done():
+            callback()
+        else:
+            self._on_complete.append(callback)
+
+    async def _drain(self, window: float, target_endpoint: Optional[str]):
+        snapshot = connection_manager.connections()
+        self.total = len(snapshot)
+        self.closed = 0
+        logger.info(
+            f"Draining {self.total} connections over {window}s"
+            + (f", redirecting to {target_endpoint}" if target_endpoint else "")
+        )
+
+        # Spread closes evenly across the window so clients don't land on the
+        # remaining pods all at once
+        interval = window / self.total if self.total else 0
+        try:
+            for index, (user_id, websocket) in enumerate(snapshot):
+                if index and interval:
+                    await asyncio.sleep(interval)
+                await self._close(websocket, user_id, target_endpoint)
+                self.closed += 1
+            logger.info(f"Drain complete, closed {self.closed} connections")
+        except asyncio.CancelledError:
+            logger.info(
+                f"Drain cancelled after {self.closed}/{self.total} connections"
+            )
+            raise
+        finally:
+            callbacks, self._on_complete = self._on_complete, []
+            for callback in callbacks:
+                callback()
+
+    async def _close(
+        self, websocket: WebSocket, user_id: str, target_endpoint: Optional[str]
+    ):
+        payload = {"delay_ms": int(self.reconnect_delay() * 1000)}
+        if target_endpoint:
+            payload["endpoint"] = target_endpoint
+
+        await connection_manager.disconnect(websocket, user_id)
+        try:
+            await websocket.send_text(
+                json.dumps({"type": "reconnect", "payload": payload})
+            )
+            await websocket.close(code=status.WS_1012_SERVICE_RESTART, reason="draining")
+        except Exception as e:
+            logger.debug(f"Error closing drained connection of {user_id}: {e}")
+
+    def get_status(self) -> dict:
+        return {
+            "draining": self.draining,
+            "total": self.total,
+            "closed": self.closed,
+            "remaining": connection_manager.connection_count(),
+        }
+
+    def install_sigterm_hook(self):
+        """Drain before handing SIGTERM over to the server's own handler.
+
+        Must be called from the lifespan, once the server has installed its
+        signal handlers, so the previous handler can be chained.
+        """
+        # Signals can only be handled from the main thread
+        if threading.current_thread() is not threading.main_thread():
+            logger.warning("Not in the main thread, SIGTERM drain hook not installed")
+            return
+
+        loop = asyncio.get_running_loop()
+        self._previous_sigterm_handler = signal.getsignal(signal.SIGTERM)
+
+        def forward_sigterm():
+            previous = self._previous_sigterm_handler
+            if callable(previous):
+                previous(signal.SIGTERM, None)
+            else:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.raise_signal(signal.SIGTERM)
+
+        def begin_shutdown():
+            if not self.draining:
+                self.start()
+            self.when_drained(forward_sigterm)
+
+        def handle_sigterm(signum, frame):
+            if self._sigterm_received:
+                # A second SIGTERM skips the remaining drain window
+                if self.drain_task:
+                    loop.call_soon_threadsafe(self.drain_task.cancel)
+                return
+            self._sigterm_received = True
+            logger.info("SIGTERM received, draining connections before shutdown")
+            loop.call_soon_threadsafe(begin_shutdown)
+
+        signal.signal(signal.SIGTERM, handle_sigterm)
+
+    def uninstall_sigterm_hook(self):
+        if self._previous_sigterm_handler is not None:
+            signal.signal(signal.SIGTERM, self._previous_sigterm_handler)
+            self._previous_sigterm_handler = None
+
+
+# Create a global instance
+drain_controller = DrainController()
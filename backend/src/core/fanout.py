@@ -0,0 +1,272 @@
+from collections import deque
+from typing import Deque, Dict, List, Optional
+import asyncio
+import logging
+import time
+from src.core.config import settings
+from src.core.metrics import LatencyStats
+from src.core.priority import LANES, NORMAL
+from src.core.subscriptions import Route
+from src.core.tracing import Trace, current_trace
+from src.core.connection_manager import connection_manager
+
+logger = logging.getLogger(__name__)
+
+# Jobs that don't belong to a single company, e.g. messages to everyone
+SHARED_TENANT = "*"
+
+
+class FanoutJob:
+    __slots__ = (
+        "recipients",
+        "message",
+        "collapse_key",
+        "lane",
+        "tenant",
+        "route",
+        "position",
+        "submitted_at",
+        "done",
+        "trace",
+    )
+
+    def __init__(
+        self,
+        recipients: List[str],
+        message: str,
+        collapse_key: Optional[str],
+        lane: str,
+        tenant: Optional[str] = None,
+        route: Optional[Route] = None,
+    ):
+        self.recipients = recipients
+        self.message = message
+        self.collapse_key = collapse_key
+        self.lane = lane
+        self.tenant = tenant or SHARED_TENANT
+        self.route = route
+        self.position = 0
+        self.submitted_at = time.monotonic()
+        self.done: Optional[asyncio.Future] = None
+        self.trace: Optional[Trace] = current_trace()
+        if self.trace is not None:
+            self.trace.acquire()
+
+
+class LaneQueue:
+    """Pending jobs of one lane, one FIFO per tenant.
+
+    ring holds the tenants with pending jobs, the one being served first;
+    deficits is what each tenant may still send in its current turn.
+    """
+
+    __slots__ = ("tenants", "ring", "deficits")
+
+    def __init__(self):
+        self.tenants: Dict[str, Deque[FanoutJob]] = {}
+        self.ring: Deque[str] = deque()
+        self.deficits: Dict[str, int] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.ring)
+
+    def __len__(self) -> int:
+        return sum(len(jobs) for jobs in self.tenants.values())
+
+    def push(self, job: FanoutJob):
+        jobs = self.tenants.get(job.tenant)
+        if jobs is None:
+            jobs = self.tenants[job.tenant] = deque()
+            self.deficits[job.tenant] = 0
+            self.ring.append(job.tenant)
+        jobs.append(job)
+
+    def oldest(self) -> float:
+        return min(jobs[0].submitted_at for jobs in self.tenants.values())
+
+
+class FanoutScheduler:
+    """Spreads messages over recipients' connection queues in chunks.
+
+    Jobs wait in one lane per priority and are served highest lane first,
+    a chunk at a time, yielding to the event loop between chunks. A lower
+    lane whose oldest job has waited longer than max_wait is served first.
+
+    Within a lane, tenants (companies) take turns by deficit round-robin:
+    each turn a tenant may enqueue chunk_size * weight recipients, however
+    many jobs or recipients it has pending, so a large company's broadcasts
+    can't hold back a small company's. A tenant's own jobs are interleaved
+    round-robin.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = settings.FANOUT_CHUNK_SIZE,
+        max_wait: float = settings.WS_LANE_MAX_WAIT_SECONDS,
+        tenant_weights: Optional[Dict[str, float]] = None,
+    ):
+        self.chunk_size = chunk_size
+        self.max_wait = max_wait
+        self.tenant_weights = (
+            settings.FANOUT_TENANT_WEIGHTS if tenant_weights is None else tenant_weights
+        )
+        self.lanes: Dict[str, LaneQueue] = {lane: LaneQueue() for lane in LANES}
+        self.ready = asyncio.Event()
+        self.worker: Optional[asyncio.Task] = None
+        # Submit-to-fully-enqueued latency per lane and per tenant
+        self.latency: Dict[str, LatencyStats] = {lane: LatencyStats() for lane in LANES}
+        self.tenant_latency: Dict[str, LatencyStats] = {}
+
+    def submit(
+        self,
+        recipients: List[str],
+        message: str,
+        lane: str = NORMAL,
+        collapse_key: Optional[str] = None,
+        tenant: Optional[str] = None,
+        route: Optional[Route] = None,
+    ) -> int:
+        """Schedule delivery of a serialized message to the given users"""
+        if recipients:
+            self._push(
+                FanoutJob(recipients, message, collapse_key, lane, tenant, route)
+            )
+        return len(recipients)
+
+    async def deliver(
+        self,
+        recipients: List[str],
+        message: str,
+        lane: str = NORMAL,
+        collapse_key: Optional[str] = None,
+        tenant: Optional[str] = None,
+        route: Optional[Route] = None,
+    ) -> int:
+        """Like submit, but return once the message is on every recipient's queue"""
+        if recipients:
+            job = FanoutJob(recipients, message, collapse_key, lane, tenant, route)
+            job.done = asyncio.get_running_loop().create_future()
+            self._push(job)
+            await job.done
+        return len(recipients)
+
+    def _push(self, job: FanoutJob):
+        self.lanes[job.lane].push(job)
+        self.ready.set()
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run())
+
+    def _quantum(self, tenant: str) -> int:
+        return max(1, int(self.chunk_size * self.tenant_weights.get(tenant, 1.0)))
+
+    def _next_lane(self, now: float) -> LaneQueue:
+        chosen = None
+        chosen_oldest = 0.0
+        for lane in LANES:
+            queue = self.lanes[lane]
+            if not queue:
+                continue
+            oldest = queue.oldest()
+            if chosen is None:
+                chosen, chosen_oldest = queue, oldest
+            elif now - oldest > self.max_wait and oldest < chosen_oldest:
+                chosen, chosen_oldest = queue, oldest
+        return chosen
+
+    def _pending(self) -> bool:
+        return any(self.lanes.values())
+
+    async def _run(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while self._pending():
+                queue = self._next_lane(time.monotonic())
+                tenant = queue.ring[0]
+                jobs = queue.tenants[tenant]
+                if queue.deficits[tenant] <= 0:
+                    # A new turn of this tenant
+                    queue.deficits[tenant] += self._quantum(tenant)
+                job = jobs.popleft()
+                start = job.position
+                end = min(
+                    start + min(self.chunk_size, queue.deficits[tenant]),
+                    len(job.recipients),
+                )
+                try:
+                    for user_id in job.recipients[start:end]:
+                        connection_manager.enqueue(
+                            user_id,
+                            job.message,
+                            job.collapse_key,
+                            job.lane,
+                            job.trace,
+                            job.route,
+                        )
+                except Exception as e:
+                    logger.error(f"Error fanning out message: {e}")
+                job.position = end
+                queue.deficits[tenant] -= end - start
+
+                if job.position < len(job.recipients):
+                    jobs.append(job)
+                else:
+                    self._complete(job)
+
+                if not jobs:
+                    # Unused allowance is not carried over to a later turn
+                    del queue.tenants[tenant]
+                    del queue.deficits[tenant]
+                    queue.ring.popleft()
+                elif queue.deficits[tenant] <= 0:
+                    queue.ring.rotate(-1)
+
+                # Let handshakes, receive loops and socket writers run
+                await asyncio.sleep(0)
+
+    def _complete(self, job: FanoutJob):
+        waited = time.monotonic() - job.submitted_at
+        self.latency[job.lane].record(waited)
+        tenant_stats = self.tenant_latency.get(job.tenant)
+        if tenant_stats is None:
+            tenant_stats = self.tenant_latency[job.tenant] = LatencyStats()
+        tenant_stats.record(waited)
+        if job.trace is not None:
+            end_ns = time.time_ns()
+            job.trace.add_span(
+                "fanout",
+                end_ns - int(waited * 1e9),
+                end_ns,
+                recipients=len(job.recipients),
+                tenant=job.tenant,
+            )
+            job.trace.release()
+        if job.done is not None and not job.done.done():
+            job.done.set_result(None)
+
+    async def stop(self):
+        if self.worker is not None and not self.worker.done():
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+        self.worker = None
+
+    def get_stats(self) -> dict:
+        return {
+            "pending_jobs": {lane: len(queue) for lane, queue in self.lanes.items()},
+            "pending_tenants": {
+                lane: list(queue.ring) for lane, queue in self.lanes.items()
+            },
+            "lane_latency": {
+                lane: stats.to_dict() for lane, stats in self.latency.items()
+            },
+            "tenant_latency": {
+                tenant: stats.to_dict() for tenant, stats in self.tenant_latency.items()
+            },
+        }
+
+
+# Create a global instance
+fanout_scheduler = FanoutScheduler()
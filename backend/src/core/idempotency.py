@@ -0,0 +1,248 @@
+from collections import OrderedDict
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response
+from typing import Any, Awaitable, Callable, Optional, Tuple, TYPE_CHECKING
+import hashlib
+import json
+import logging
+import time
+from src.core.config import settings
+
+if TYPE_CHECKING:
+    import redis.asyncio
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyConflict(Exception):
+    """The first request with this key has not finished yet"""
+
+
+class IdempotencyMismatch(Exception):
+    """The key was first used with a different request"""
+
+
+async def request_fingerprint(request: Request) -> str:
+    """Hash of the query string and body, JSON bodies compared by content"""
+    body = await request.body()
+    try:
+        canonical = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":"))
+        body = canonical.encode()
+    except ValueError:
+        pass
+    digest = hashlib.sha256(request.url.query.encode())
+    digest.update(b"\0")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class IdempotencyCache:
+    """Responses of ingestion requests by Idempotency-Key, for ttl_seconds.
+
+    begin() claims a key, together with the fingerprint of the request,
+    before any work is done. A retry of a finished request gets the stored
+    response back, a retry racing the first one gets IdempotencyConflict,
+    a different request reusing the key gets IdempotencyMismatch, and
+    abort() frees the key when the first one failed so it can be retried.
+    Locally at most max_size keys are kept, oldest first out. With Redis
+    enabled the claim is a SET NX shared by all nodes; Redis errors fall
+    back to the local cache.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = settings.IDEMPOTENCY_TTL_SECONDS,
+        max_size: int = settings.IDEMPOTENCY_CACHE_SIZE,
+        redis_enabled: bool = settings.IDEMPOTENCY_REDIS_ENABLED,
+        redis_url: str = settings.REDIS_URL,
+        key_prefix: str = settings.IDEMPOTENCY_REDIS_PREFIX,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.redis_enabled = redis_enabled
+        self.redis_url = redis_url
+        self.key_prefix = key_prefix
+        self._redis_client: Optional["redis.asyncio.Redis"] = None
+        # key -> (expires_at, fingerprint, response or None while in flight),
+        # oldest first
+        self.entries: "OrderedDict[str, Tuple[float, str, Optional[dict]]]" = (
+            OrderedDict()
+        )
+        self.hits = 0
+        self.conflicts = 0
+        self.mismatches = 0
+        self.misses = 0
+        self.redis_errors = 0
+
+    @property
+    def redis_client(self) -> "redis.asyncio.Redis":
+        if self._redis_client is None:
+            import redis.asyncio
+
+            self._redis_client = redis.asyncio.Redis.from_url(
+                self.redis_url,
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
+                decode_responses=True,
+            )
+        return self._redis_client
+
+    async def close(self):
+        if self._redis_client is not None:
+            await self._redis_client.aclose()
+            self._redis_client = None
+
+    def _expire(self, now: float):
+        # Every entry lives ttl_seconds from its claim, so the oldest expire first
+        while self.entries:
+            key, (expires_at, _, _) = next(iter(self.entries.items()))
+            if expires_at > now:
+                break
+            del self.entries[key]
+
+    def _check(
+        self,
+        key: str,
+        fingerprint: str,
+        stored: str,
+        response: Optional[dict],
+    ) -> dict:
+        """The response to replay for a key that is already taken"""
+        if stored != fingerprint:
+            self.mismatches += 1
+            raise IdempotencyMismatch(key)
+        if response is None:
+            self.conflicts += 1
+            raise IdempotencyConflict(key)
+        self.hits += 1
+        return response
+
+    async def begin(self, key: str, fingerprint: str) -> Optional[dict]:
+        """Claim a key, returns the stored response if it was already used"""
+        now = time.monotonic()
+        self._expire(now)
+        entry = self.entries.get(key)
+        if entry is not None:
+            return self._check(key, fingerprint, entry[1], entry[2])
+
+        if self.redis_enabled:
+            try:
+                claimed = await self.redis_client.set(
+                    self.key_prefix + key,
+                    json.dumps({"fingerprint": fingerprint, "response": None}),
+                    nx=True,
+                    ex=max(1, int(self.ttl_seconds)),
+                )
+                if not claimed:
+                    value = await self.redis_client.get(self.key_prefix + key)
+                    if value is not None:
+                        stored = json.loads(value)
+                        response = self._check(
+                            key, fingerprint, stored["fingerprint"], stored["response"]
+                        )
+                        expires_at = now + self.ttl_seconds
+                        self.entries[key] = (expires_at, fingerprint, response)
+                        return response
+            except (IdempotencyConflict, IdempotencyMismatch):
+                raise
+            except Exception as e:
+                self.redis_errors += 1
+                logger.error(f"Error claiming idempotency key {key} in Redis: {e}")
+
+        self.misses += 1
+        self.entries[key] = (now + self.ttl_seconds, fingerprint, None)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return None
+
+    async def complete(self, key: str, fingerprint: str, response: dict):
+        """Store the response of a claimed key for its retries"""
+        # The local entry may have been pushed out by newer keys meanwhile,
+        # the Redis claim must be completed regardless
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries[key] = (entry[0], fingerprint, response)
+        if self.redis_enabled:
+            try:
+                await self.redis_client.set(
+                    self.key_prefix + key,
+                    json.dumps({"fingerprint": fingerprint, "response": response}),
+                    xx=True,
+                    keepttl=True,
+                )
+            except Exception as e:
+                self.redis_errors += 1
+                logger.error(f"Error storing idempotency key {key} in Redis: {e}")
+
+    async def abort(self, key: str):
+        """Release a claimed key after its request failed"""
+        self.entries.pop(key, None)
+        if self.redis_enabled:
+            try:
+                await self.redis_client.delete(self.key_prefix + key)
+            except Exception as e:
+                self.redis_errors += 1
+                logger.error(f"Error releasing idempotency key {key} in Redis: {e}")
+
+    def get_stats(self) -> dict:
+        return {
+            "keys": len(self.entries),
+            "hits": self.hits,
+            "conflicts": self.conflicts,
+            "mismatches": self.mismatches,
+            "misses": self.misses,
+            "redis_enabled": self.redis_enabled,
+            "redis_errors": self.redis_errors,
+        }
+
+
+async def run_idempotent(
+    request: Request, key: Optional[str], handler: Callable[[], Awaitable[Any]]
+) -> Any:
+    """Run an ingestion handler at most once per key within the TTL.
+
+    Keys are scoped to the request path. Duplicates are answered with the
+    first response and an Idempotent-Replayed header, without calling the
+    handler again; a different query string or body with the same key is
+    rejected with 422.
+    """
+    if not key:
+        return await handler()
+
+    key = f"{request.url.path}:{key}"
+    try:
+        fingerprint = await request_fingerprint(request)
+        stored = await idempotency_cache.begin(key, fingerprint)
+    except IdempotencyMismatch:
+        raise HTTPException(
+            status_code=422,
+            detail="This idempotency key was already used with a different request",
+        )
+    except IdempotencyConflict:
+        raise HTTPException(
+            status_code=409,
+            detail="A request with this idempotency key is still in progress",
+        )
+    if stored is not None:
+        return JSONResponse(
+            status_code=stored["status_code"],
+            content=stored["content"],
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    try:
+        result = await handler()
+    except BaseException:
+        await idempotency_cache.abort(key)
+        raise
+
+    if isinstance(result, Response):
+        stored = {"status_code": result.status_code, "content": json.loads(result.body)}
+    else:
+        stored = {"status_code": 200, "content": jsonable_encoder(result)}
+    await idempotency_cache.complete(key, fingerprint, stored)
+    return result
+
+
+# Create a global instance
+idempotency_cache = IdempotencyCache()
@@ -0,0 +1,78 @@
+from typing import Optional
+import logging
+import time
+from src.core.admission import TokenBucket
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ACCEPT = "accept"
+DROP = "drop"
+CLOSE = "close"
+
+# Frames the frontend sends most often, serialized by JSON.stringify with
+# "type" as the first key. Matching the prefix avoids a full json.loads.
+_FAST_PATH_PREFIXES = {
+    "ping": '{"type":"ping"',
+    "auth": '{"type":"auth"',
+    "heartbeat": '{"type":"heartbeat"',
+}
+
+
+def classify_frame(data: str) -> Optional[str]:
+    """Return the message type of a well-known frame, or None if it needs parsing"""
+    if not data.startswith('{"type":"'):
+        return None
+    for message_type, prefix in _FAST_PATH_PREFIXES.items():
+        if data.startswith(prefix):
+            next_char = data[len(prefix) : len(prefix) + 1]
+            if next_char in ("}", ","):
+                return message_type
+    return None
+
+
+class InboundLimiter:
+    """Per-connection inbound frame policy: size cap, rate limit, escalating penalties"""
+
+    __slots__ = (
+        "max_frame_size",
+        "bucket",
+        "max_violations",
+        "window",
+        "violations",
+        "last_violation_at",
+    )
+
+    def __init__(
+        self,
+        max_frame_size: int = settings.WS_MAX_INBOUND_FRAME_SIZE,
+        rate: float = settings.WS_INBOUND_RATE,
+        burst: int = settings.WS_INBOUND_BURST,
+        max_violations: int = settings.WS_INBOUND_MAX_VIOLATIONS,
+        violation_window: float = settings.WS_INBOUND_VIOLATION_WINDOW,
+    ):
+        self.max_frame_size = max_frame_size
+        self.bucket = TokenBucket(rate, burst, time.monotonic())
+        self.max_violations = max_violations
+        self.window = violation_window
+        self.violations = 0
+        self.last_violation_at = 0.0
+
+    def check(self, size: int) -> str:
+        """Decide whether a frame of the given size is processed, dropped or closes the socket"""
+        now = time.monotonic()
+        if size > self.max_frame_size:
+            return self._violation(now)
+        if self.bucket.consume(now):
+            return self._violation(now)
+        return ACCEPT
+
+    def _violation(self, now: float) -> str:
+        # Forget old offences once the client has behaved for a full window
+        if now - self.last_violation_at > self.window:
+            self.violations = 0
+        self.violations += 1
+        self.last_violation_at = now
+        if self.violations >= self.max_violations:
+            return CLOSE
+        return DROP
@@ -0,0 +1,111 @@
+import math
+
+
+class LatencyStats:
+    """Running latency aggregate: count, mean, max and an exponentially weighted mean"""
+
+    __slots__ = ("alpha", "count", "total", "max", "ewma")
+
+    def __init__(self, alpha: float = 0.1):
+        self.alpha = alpha
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.ewma = 0.0
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if self.count == 1:
+            self.ewma = seconds
+        else:
+            self.ewma += self.alpha * (seconds - self.ewma)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "ewma_ms": round(self.ewma * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class RateStats:
+    """Events per second, decayed exponentially with a half-life.
+
+    score() is log2 of the decayed count plus the time in half-lives, which
+    orders counters the same way whenever they were last updated, so a
+    TopK of scores stays correct for counters that have gone quiet.
+    """
+
+    __slots__ = ("half_life", "value", "updated_at")
+
+    def __init__(self, half_life: float):
+        self.half_life = half_life
+        self.value = 0.0
+        self.updated_at = 0.0
+
+    def _decayed(self, now: float) -> float:
+        return self.value * 2 ** ((self.updated_at - now) / self.half_life)
+
+    def record(self, now: float, count: float = 1.0):
+        self.value = self._decayed(now) + count
+        self.updated_at = now
+
+    def rate(self, now: float) -> float:
+        # A steady rate r decays to r * half_life / ln 2
+        return self._decayed(now) * math.log(2) / self.half_life
+
+    def score(self) -> float:
+        if self.value <= 0:
+            return float("-inf")
+        return math.log2(self.value) + self.updated_at / self.half_life
+
+
+class TopK:
+    """Keys with the k largest values, maintained as values are updated.
+
+    Updates for keys outside the set that don't beat its current minimum are
+    O(1); the minimum is rescanned (O(k)) only when it changes. Values that
+    drop are kept until displaced, so the ranking is approximate.
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        self.values: dict = {}
+        self.min_key = None
+        self.min_value = 0.0
+
+    def update(self, key, value: float):
+        if key in self.values:
+            self.values[key] = value
+            if key == self.min_key or value < self.min_value:
+                self._rescan()
+            return
+        if len(self.values) < self.k:
+            self.values[key] = value
+            if self.min_key is None or value < self.min_value:
+                self.min_key, self.min_value = key, value
+            return
+        if value <= self.min_value:
+            return
+        del self.values[self.min_key]
+        self.values[key] = value
+        self._rescan()
+
+    def discard(self, key):
+        if self.values.pop(key, None) is not None and key == self.min_key:
+            self._rescan()
+
+    def _rescan(self):
+        if self.values:
+            self.min_key = min(self.values, key=self.values.__getitem__)
+            self.min_value = self.values[self.min_key]
+        else:
+            self.min_key, self.min_value = None, 0.0
+
+    def top(self, n: int) -> list:
+        """The n largest (key, value) pairs, largest first"""
+        return sorted(self.values.items(), key=lambda item: item[1], reverse=True)[:n]
@@ -0,0 +1,86 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import asyncio
+import logging
+import time
+from src.config.users import DUMMY_PASSWORD_HASH, verify_password
+from src.core.config import settings
+from src.core.metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+
+class VerifierBusy(Exception):
+    """Raised when too many password checks are already waiting"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("password verifier busy")
+        self.retry_after = retry_after
+
+
+class PasswordVerifier:
+    """Runs bcrypt checks in a small thread pool, off the event loop.
+
+    bcrypt releases the GIL while hashing, so a login burst only occupies
+    the pool threads and sockets keep being served. At most max_pending
+    checks may be running or queued; beyond that logins are refused
+    instead of queueing without bound.
+    """
+
+    def __init__(
+        self,
+        workers: int = settings.AUTH_HASH_WORKERS,
+        max_pending: int = settings.AUTH_MAX_PENDING_VERIFICATIONS,
+        retry_after: float = settings.WS_RETRY_AFTER_SECONDS,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.retry_after = retry_after
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.pending = 0
+        self.rejected = 0
+        self.latency = LatencyStats()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="password-verifier"
+            )
+        return self._executor
+
+    async def verify(self, password: str, hashed_password: Optional[str]) -> bool:
+        """Check a password, against a dummy hash when the user is unknown"""
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise VerifierBusy(self.retry_after)
+
+        self.pending += 1
+        started_at = time.monotonic()
+        try:
+            matches = await asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                verify_password,
+                password,
+                hashed_password or DUMMY_PASSWORD_HASH,
+            )
+            return matches and hashed_password is not None
+        finally:
+            self.pending -= 1
+            self.latency.record(time.monotonic() - started_at)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def get_stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "latency": self.latency.to_dict(),
+        }
+
+
+# Create a global instance
+password_verifier = PasswordVerifier()
@@ -0,0 +1,28 @@
+from typing import Optional
+
+HIGH = "high"
+NORMAL = "normal"
+LOW = "low"
+
+# Delivery lanes, highest priority first
+LANES = (HIGH, NORMAL, LOW)
+
+_PRIORITY_LANES = {
+    "critical": HIGH,
+    "urgent": HIGH,
+    "high": HIGH,
+    "error": HIGH,
+    "medium": NORMAL,
+    "normal": NORMAL,
+    "info": NORMAL,
+    "warning": NORMAL,
+    "low": LOW,
+    "debug": LOW,
+}
+
+
+def lane_for(priority: Optional[str]) -> str:
+    """Map a notification priority (or type) to a delivery lane"""
+    if not priority:
+        return NORMAL
+    return _PRIORITY_LANES.get(priority.lower(), NORMAL)
@@ -0,0 +1,191 @@
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import time
+from datetime import datetime
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Request headers worth replaying, credentials are never recorded
+RECORDED_HEADERS = {b"content-type", b"idempotency-key"}
+
+
+class TrafficRecorder:
+    """Opt-in NDJSON log of ingress traffic for scripts/replay_traffic.py.
+
+    The first line describes the capture, every further line is one event
+    with "t", seconds since the capture started:
+
+        {"t": 1.25, "kind": "request", "method": "POST", "path": ..., "body": ...}
+        {"t": 1.30, "kind": "connect", "conn": 7, "user": "user1"}
+        {"t": 9.80, "kind": "disconnect", "conn": 7, "user": "user1"}
+
+    Lines are buffered and flushed at most every flush_interval seconds.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = settings.RECORD_TRAFFIC_PATH,
+        flush_interval: float = 1.0,
+    ):
+        self.path = path
+        self.enabled = bool(path)
+        self.flush_interval = flush_interval
+        self.file = None
+        self.started = time.monotonic()
+        self.flushed_at = self.started
+        # Socket -> connection number, so disconnects pair with their connect
+        self.connection_ids: Dict[Any, int] = {}
+        self.next_connection = 0
+        self.events = 0
+        self.errors = 0
+
+    def _write(self, event: dict):
+        try:
+            if self.file is None:
+                self.file = open(self.path, "a")
+                self.file.write(
+                    json.dumps(
+                        {
+                            "kind": "capture",
+                            "started_at": datetime.now().astimezone().isoformat(),
+                            "node_id": settings.NODE_ID,
+                        }
+                    )
+                    + "\n"
+                )
+            self.file.write(json.dumps(event, separators=(",", ":")) + "\n")
+            self.events += 1
+            now = time.monotonic()
+            if now - self.flushed_at > self.flush_interval:
+                self.file.flush()
+                self.flushed_at = now
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error recording traffic to {self.path}: {e}")
+
+    def elapsed(self) -> float:
+        return round(time.monotonic() - self.started, 6)
+
+    def record_request(
+        self,
+        t: float,
+        method: str,
+        path: str,
+        query: str,
+        headers: Dict[str, str],
+        body: bytes,
+        status: int,
+        duration: float,
+    ):
+        event = {
+            "t": t,
+            "kind": "request",
+            "method": method,
+            "path": path,
+            "query": query,
+            "headers": headers,
+            "status": status,
+            "duration_ms": round(duration * 1000, 3),
+        }
+        try:
+            event["body"] = json.loads(body) if body else None
+        except ValueError:
+            event["body_text"] = body.decode(errors="replace")
+        self._write(event)
+
+    def record_connect(self, connection, user_id: str):
+        self.next_connection += 1
+        self.connection_ids[connection] = self.next_connection
+        self._write(
+            {
+                "t": self.elapsed(),
+                "kind": "connect",
+                "conn": self.next_connection,
+                "user": user_id,
+            }
+        )
+
+    def record_disconnect(self, connection, user_id: str):
+        connection_id = self.connection_ids.pop(connection, None)
+        if connection_id is not None:
+            self._write(
+                {
+                    "t": self.elapsed(),
+                    "kind": "disconnect",
+                    "conn": connection_id,
+                    "user": user_id,
+                }
+            )
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "events": self.events,
+            "errors": self.errors,
+        }
+
+
+class RecordingMiddleware:
+    """Records POST requests under the recorded path prefixes, body included"""
+
+    def __init__(self, app, prefixes: Optional[List[str]] = None):
+        self.app = app
+        self.prefixes = tuple(prefixes or settings.RECORD_PATH_PREFIXES)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not traffic_recorder.enabled
+            or scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not scope["path"].startswith(self.prefixes)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        t = traffic_recorder.elapsed()
+        started = time.monotonic()
+        chunks = []
+        status = 500
+
+        async def receive_and_keep():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunks.append(message.get("body", b""))
+            return message
+
+        async def send_and_watch(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_and_keep, send_and_watch)
+        finally:
+            headers = {
+                name.decode(): value.decode(errors="replace")
+                for name, value in scope["headers"]
+                if name in RECORDED_HEADERS
+            }
+            traffic_recorder.record_request(
+                t,
+                scope["method"],
+                scope["path"],
+                scope["query_string"].decode(errors="replace"),
+                headers,
+                b"".join(chunks),
+                status,
+                time.monotonic() - started,
+            )
+
+
+# Create a global instance
+traffic_recorder = TrafficRecorder()
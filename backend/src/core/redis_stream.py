@@ -0,0 +1,268 @@
+from typing import List, Optional, Tuple, TYPE_CHECKING
+import asyncio
+import json
+import logging
+import socket
+import time
+from src.core.config import settings
+from src.core.fanout import fanout_scheduler
+from src.core.priority import NORMAL
+from src.core.subscriptions import Route, subscription_index
+from src.core.connection_manager import connection_manager
+
+if TYPE_CHECKING:
+    import redis.asyncio
+
+logger = logging.getLogger(__name__)
+
+# Stream entries are (entry_id, fields)
+Entry = Tuple[str, Optional[dict]]
+
+
+class RedisStreamFanout:
+    """Cross-node delivery log on a Redis stream.
+
+    Producers XADD each message once. Every node reads the stream through
+    its own consumer group in batches, hands the batch to the local fan-out
+    scheduler and acknowledges it once the messages sit on the connection
+    queues, so a node that restarts picks up where it stopped (at-least-once).
+    The stream is capped by length on XADD and trimmed by age periodically.
+    The group is named after NODE_ID, which must therefore survive restarts;
+    groups of nodes idle for longer than the retention are destroyed.
+
+    When disabled, dispatch goes straight to the local fan-out scheduler.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = settings.REDIS_STREAM_ENABLED,
+        redis_url: str = settings.REDIS_URL,
+        stream_key: str = settings.REDIS_STREAM_KEY,
+        node_id: Optional[str] = settings.NODE_ID,
+        batch_size: int = settings.REDIS_STREAM_BATCH_SIZE,
+        block_ms: int = settings.REDIS_STREAM_BLOCK_MS,
+        maxlen: int = settings.REDIS_STREAM_MAXLEN,
+        retention_seconds: float = settings.REDIS_STREAM_RETENTION_SECONDS,
+        trim_interval: float = settings.REDIS_STREAM_TRIM_INTERVAL_SECONDS,
+    ):
+        if enabled and not node_id:
+            # A hostname that changes on restart would start a new group at
+            # the tail and lose what was published while the node was down
+            raise ValueError("REDIS_STREAM_ENABLED requires a stable NODE_ID")
+        self.enabled = enabled
+        self.redis_url = redis_url
+        self.stream_key = stream_key
+        self.node_id = node_id or socket.gethostname()
+        self.group = f"node:{self.node_id}"
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.maxlen = maxlen
+        self.retention_seconds = retention_seconds
+        self.trim_interval = trim_interval
+
+        self._redis_client: Optional["redis.asyncio.Redis"] = None
+        self.worker: Optional[asyncio.Task] = None
+        self.published = 0
+        self.batches = 0
+        self.delivered = 0
+        self.redelivered = 0
+        self.groups_destroyed = 0
+        self.errors = 0
+
+    @property
+    def redis_client(self) -> "redis.asyncio.Redis":
+        if self._redis_client is None:
+            import redis.asyncio
+
+            self._redis_client = redis.asyncio.Redis.from_url(
+                self.redis_url,
+                max_connections=settings.REDIS_MAX_CONNECTIONS,
+                decode_responses=True,
+            )
+        return self._redis_client
+
+    async def dispatch(
+        self,
+        recipients: Optional[List[str]],
+        message: str,
+        lane: str = NORMAL,
+        collapse_key: Optional[str] = None,
+        tenant: Optional[str] = None,
+        route: Optional[Route] = None,
+    ):
+        """Deliver a serialized message to users, None meaning everyone connected.
+
+        tenant is the company the message belongs to, for fair fan-out.
+        route is matched against the sockets' subscription filters.
+        """
+        if not self.enabled:
+            if recipients is None:
+                recipients = connection_manager.connected_users()
+            recipients = subscription_index.recipients(route, recipients)
+            fanout_scheduler.submit(
+                recipients, message, lane, collapse_key, tenant, route
+            )
+            return
+
+        fields = {
+            "recipients": "*" if recipients is None else json.dumps(recipients),
+            "message": message,
+            "lane": lane,
+            "collapse_key": collapse_key or "",
+            "tenant": tenant or "",
+            "route": json.dumps(route) if route is not None else "",
+        }
+        await self.redis_client.xadd(
+            self.stream_key, fields, maxlen=self.maxlen, approximate=True
+        )
+        self.published += 1
+
+    def start(self):
+        if self.enabled and (self.worker is None or self.worker.done()):
+            self.worker = asyncio.create_task(self._consume())
+
+    async def stop(self):
+        if self.worker is not None and not self.worker.done():
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+        self.worker = None
+        if self._redis_client is not None:
+            await self._redis_client.aclose()
+            self._redis_client = None
+
+    async def _ensure_group(self):
+        import redis
+
+        try:
+            # A new node starts at the tail, it has no sockets for older messages
+            await self.redis_client.xgroup_create(
+                self.stream_key, self.group, id="$", mkstream=True
+            )
+            logger.info(f"Created consumer group {self.group} on {self.stream_key}")
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _consume(self):
+        import redis
+
+        # "0" re-reads entries delivered to this node before a restart but
+        # never acknowledged; ">" reads new entries once those are done
+        last_id = "0"
+        trimmed_at = 0.0
+        group_ready = False
+        while True:
+            try:
+                if not group_ready:
+                    await self._ensure_group()
+                    group_ready = True
+
+                response = await self.redis_client.xreadgroup(
+                    self.group,
+                    self.node_id,
+                    {self.stream_key: last_id},
+                    count=self.batch_size,
+                    block=self.block_ms,
+                )
+                entries: List[Entry] = response[0][1] if response else []
+
+                if entries:
+                    await self._deliver(entries)
+                    await self.redis_client.xack(
+                        self.stream_key, self.group, *[entry_id for entry_id, _ in entries]
+                    )
+                    self.batches += 1
+                    if last_id != ">":
+                        self.redelivered += len(entries)
+                if last_id != ">":
+                    last_id = entries[-1][0] if entries else ">"
+
+                if time.monotonic() - trimmed_at > self.trim_interval:
+                    await self._trim()
+                    await self._destroy_stale_groups()
+                    trimmed_at = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except redis.ResponseError as e:
+                self.errors += 1
+                if "NOGROUP" in str(e):
+                    # Stream or group was deleted, recreate it
+                    group_ready = False
+                logger.error(f"Error reading stream {self.stream_key}: {e}")
+                await asyncio.sleep(settings.WS_RETRY_AFTER_SECONDS)
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"Error reading stream {self.stream_key}: {e}")
+                await asyncio.sleep(settings.WS_RETRY_AFTER_SECONDS)
+
+    async def _deliver(self, entries: List[Entry]):
+        deliveries = []
+        for entry_id, fields in entries:
+            if not fields:
+                # Trimmed while pending, nothing left to deliver
+                continue
+            route = Route(*json.loads(fields["route"])) if fields.get("route") else None
+            if fields["recipients"] == "*":
+                recipients = connection_manager.connected_users()
+            else:
+                recipients = json.loads(fields["recipients"])
+            deliveries.append(
+                fanout_scheduler.deliver(
+                    subscription_index.recipients(route, recipients),
+                    fields["message"],
+                    fields.get("lane", NORMAL),
+                    fields.get("collapse_key") or None,
+                    fields.get("tenant") or None,
+                    route,
+                )
+            )
+        await asyncio.gather(*deliveries)
+        self.delivered += len(deliveries)
+
+    async def _trim(self):
+        min_id = int((time.time() - self.retention_seconds) * 1000)
+        trimmed = await self.redis_client.xtrim(
+            self.stream_key, minid=f"{min_id}-0", approximate=True
+        )
+        if trimmed:
+            logger.info(f"Trimmed {trimmed} entries from {self.stream_key}")
+
+    async def _destroy_stale_groups(self):
+        """Drop groups of nodes idle for longer than the retention.
+
+        Everything such a node could still read has been trimmed, only its
+        pending list would be left. Groups without consumers are kept, their
+        node has not read yet.
+        """
+        idle_ms = self.retention_seconds * 1000
+        for group in await self.redis_client.xinfo_groups(self.stream_key):
+            name = group["name"]
+            if name == self.group or not name.startswith("node:"):
+                continue
+            consumers = await self.redis_client.xinfo_consumers(self.stream_key, name)
+            if consumers and all(consumer["idle"] > idle_ms for consumer in consumers):
+                await self.redis_client.xgroup_destroy(self.stream_key, name)
+                self.groups_destroyed += 1
+                logger.info(
+                    f"Destroyed idle consumer group {name} "
+                    f"({group['pending']} pending entries)"
+                )
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "node_id": self.node_id,
+            "published": self.published,
+            "batches": self.batches,
+            "delivered": self.delivered,
+            "redelivered": self.redelivered,
+            "groups_destroyed": self.groups_destroyed,
+            "errors": self.errors,
+        }
+
+
+# Create a global instance
+stream_fanout = RedisStreamFanout()
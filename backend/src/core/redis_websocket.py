@@ -1,18 +1,87 @@
-from typing import Dict, Set
+from typing import Dict, List, Optional, Set, TYPE_CHECKING
 from fastapi import WebSocket
+import asyncio
 import logging
-import redis
-import json
+import socket
 import time
-from datetime import datetime
+from src.core.config import settings
+
+if TYPE_CHECKING:
+    import redis.asyncio
 
 logger = logging.getLogger(__name__)
 
+# presence:nodes          zset node_id -> last heartbeat of the node
+# presence:node:<node_id> zset user_id -> last seen on that node
+# presence:user:<user_id> zset node_id -> last seen on that node
+NODES_KEY = "presence:nodes"
+
+
+def node_key(node_id: str) -> str:
+    return f"presence:node:{node_id}"
+
+
+def user_key(user_id: str) -> str:
+    return f"presence:user:{user_id}"
+
 
 class RedisWebSocketManager:
-    def __init__(self, redis_url: str = "redis://localhost:6379"):
-        self.redis_client = redis.Redis.from_url(redis_url, decode_responses=True)
+    """Local sockets plus a cluster-wide presence index in Redis.
+
+    Each node refreshes the users it holds every heartbeat_seconds into
+    sorted sets scored by last-seen time. Entries older than ttl_seconds
+    are dropped with ZREMRANGEBYSCORE and every key carries a TTL, so the
+    index only ever holds users connected right now; a crashed node's
+    entries age out on their own.
+    """
+
+    def __init__(
+        self,
+        redis_url: str = settings.REDIS_URL,
+        max_connections: int = settings.REDIS_MAX_CONNECTIONS,
+        node_id: Optional[str] = settings.NODE_ID,
+        heartbeat_seconds: float = settings.PRESENCE_HEARTBEAT_SECONDS,
+        ttl_seconds: float = settings.PRESENCE_TTL_SECONDS,
+    ):
+        self.redis_url = redis_url
+        self.max_connections = max_connections
+        self.node_id = node_id or socket.gethostname()
+        self.heartbeat_seconds = heartbeat_seconds
+        self.ttl_seconds = ttl_seconds
+        self._redis_client: Optional["redis.asyncio.Redis"] = None
         self.local_connections: Dict[str, Set[WebSocket]] = {}
+        self.heartbeat_task: Optional[asyncio.Task] = None
+        # Serializes presence writes so a heartbeat can't re-add a user whose
+        # removal it raced
+        self._presence_lock = asyncio.Lock()
+
+    @property
+    def redis_client(self) -> "redis.asyncio.Redis":
+        """Pooled client, created on first use so importing this module stays cheap"""
+        if self._redis_client is None:
+            import redis.asyncio
+
+            pool = redis.asyncio.ConnectionPool.from_url(
+                self.redis_url,
+                max_connections=self.max_connections,
+                decode_responses=True,
+            )
+            self._redis_client = redis.asyncio.Redis(connection_pool=pool)
+            logger.info(f"Created Redis connection pool for {self.redis_url}")
+        return self._redis_client
+
+    async def close(self):
+        if self.heartbeat_task is not None and not self.heartbeat_task.done():
+            self.heartbeat_task.cancel()
+            try:
+                await self.heartbeat_task
+            except asyncio.CancelledError:
+                pass
+        self.heartbeat_task = None
+        if self._redis_client is not None:
+            await self._redis_client.aclose()
+            self._redis_client = None
+            logger.info("Closed Redis connection pool")
 
     async def connect(self, websocket: WebSocket, user_id: str):
         try:
@@ -21,63 +90,124 @@ class RedisWebSocketManager:
                 self.local_connections[user_id] = set()
             self.local_connections[user_id].add(websocket)
 
-            # Store in Redis
-            connection_id = f"{user_id}:{int(time.time())}"
-            connection_data = {
-                "user_id": user_id,
-                "timestamp": datetime.now().isoformat(),
-                "status": "active",
-            }
-
-            # Add to user's connections set
-            self.redis_client.sadd(f"user:{user_id}:connections", connection_id)
-            # Store connection metadata
-            self.redis_client.hmset(f"connection:{connection_id}", connection_data)
+            # Visible to other nodes right away, not only after the next heartbeat
+            await self._mark_seen([user_id], time.time())
+            if self.heartbeat_task is None or self.heartbeat_task.done():
+                self.heartbeat_task = asyncio.create_task(self._heartbeat())
 
-            logger.info(f"User {user_id} connected. Connection ID: {connection_id}")
+            logger.info(f"User {user_id} connected to node {self.node_id}")
 
         except Exception as e:
             logger.error(f"Error adding WebSocket connection: {e}")
             raise
 
-    def disconnect(self, websocket: WebSocket, user_id: str):
+    async def disconnect(self, websocket: WebSocket, user_id: str):
         try:
             # Remove from local memory
             if user_id in self.local_connections:
                 self.local_connections[user_id].discard(websocket)
-                if not self.local_connections[user_id]:
-                    del self.local_connections[user_id]
-
-            # Find and remove from Redis
-            connection_ids = self.redis_client.smembers(f"user:{user_id}:connections")
-            for conn_id in connection_ids:
-                if (
-                    self.redis_client.hget(f"connection:{conn_id}", "status")
-                    == "active"
-                ):
-                    self.redis_client.hset(
-                        f"connection:{conn_id}", "status", "disconnected"
-                    )
-                    self.redis_client.hset(
-                        f"connection:{conn_id}",
-                        "disconnected_at",
-                        datetime.now().isoformat(),
-                    )
-
-            logger.info(f"User {user_id} disconnected")
+                if self.local_connections[user_id]:
+                    return
+                del self.local_connections[user_id]
+
+            # Last socket of the user on this node
+            async with self._presence_lock:
+                if user_id in self.local_connections:
+                    # Reconnected while waiting for the lock
+                    return
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.zrem(user_key(user_id), self.node_id)
+                pipe.zrem(node_key(self.node_id), user_id)
+                await pipe.execute()
+
+            logger.info(f"User {user_id} disconnected from node {self.node_id}")
 
         except Exception as e:
             logger.error(f"Error during disconnect: {e}")
 
+    async def _mark_seen(self, user_ids: Optional[List[str]], now: float):
+        """Refresh the given users, or every local one, if still held here
+
+        Runs under the presence lock and filters against local_connections
+        inside it, so a write can't land after the disconnect that removed
+        the user.
+        """
+        async with self._presence_lock:
+            if user_ids is None:
+                user_ids = list(self.local_connections)
+            else:
+                user_ids = [u for u in user_ids if u in self.local_connections]
+            await self._write_seen(user_ids, now)
+
+    async def _write_seen(self, user_ids: List[str], now: float):
+        ttl = int(self.ttl_seconds) + 1
+        cutoff = now - self.ttl_seconds
+        pipe = self.redis_client.pipeline(transaction=False)
+        if user_ids:
+            pipe.zadd(node_key(self.node_id), {user_id: now for user_id in user_ids})
+            for user_id in user_ids:
+                pipe.zadd(user_key(user_id), {self.node_id: now})
+                # Also forget nodes that stopped refreshing this user
+                pipe.zremrangebyscore(user_key(user_id), "-inf", cutoff)
+                pipe.expire(user_key(user_id), ttl)
+        pipe.expire(node_key(self.node_id), ttl)
+        pipe.zadd(NODES_KEY, {self.node_id: now})
+        pipe.expire(NODES_KEY, ttl)
+        await pipe.execute()
+
+    async def _heartbeat(self):
+        while True:
+            try:
+                now = time.time()
+                await self._mark_seen(None, now)
+                await self.cleanup_inactive_connections()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error refreshing presence of node {self.node_id}: {e}")
+            await asyncio.sleep(self.heartbeat_seconds)
+
+    async def cleanup_inactive_connections(self, max_age_seconds: Optional[float] = None):
+        """Drop presence entries not refreshed within max_age_seconds (the TTL by default)"""
+        if max_age_seconds is None:
+            max_age_seconds = self.ttl_seconds
+        cutoff = time.time() - max_age_seconds
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.zremrangebyscore(node_key(self.node_id), "-inf", cutoff)
+        pipe.zremrangebyscore(NODES_KEY, "-inf", cutoff)
+        await pipe.execute()
+
+    async def get_user_nodes(self, user_id: str) -> List[str]:
+        """Nodes currently holding a socket of the user"""
+        cutoff = time.time() - self.ttl_seconds
+        return await self.redis_client.zrangebyscore(user_key(user_id), cutoff, "+inf")
+
+    async def get_nodes_for_users(self, user_ids: List[str]) -> Dict[str, List[str]]:
+        """Nodes per online user, in one round trip, for targeted delivery"""
+        cutoff = time.time() - self.ttl_seconds
+        pipe = self.redis_client.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.zrangebyscore(user_key(user_id), cutoff, "+inf")
+        results = await pipe.execute()
+        return {user_id: nodes for user_id, nodes in zip(user_ids, results) if nodes}
+
+    async def is_online(self, user_id: str) -> bool:
+        cutoff = time.time() - self.ttl_seconds
+        return await self.redis_client.zcount(user_key(user_id), cutoff, "+inf") > 0
+
+    async def get_live_nodes(self) -> List[str]:
+        cutoff = time.time() - self.ttl_seconds
+        return await self.redis_client.zrangebyscore(NODES_KEY, cutoff, "+inf")
+
     async def send_personal_message(self, message: str, user_id: str):
         try:
             if user_id in self.local_connections:
-                for connection in self.local_connections[user_id]:
+                for connection in list(self.local_connections[user_id]):
                     try:
                         await connection.send_text(message)
                     except Exception as e:
                         logger.error(f"Error sending message to user {user_id}: {e}")
-                        self.disconnect(connection, user_id)
+                        await self.disconnect(connection, user_id)
         except Exception as e:
             logger.error(f"Error in send_personal_message: {e}")
 
@@ -85,41 +215,13 @@ class RedisWebSocketManager:
         try:
             logger.info("Broadcasting message to all connected clients")
 
-            # Get all active user IDs from Redis
-            user_ids = set()
-            for key in self.redis_client.scan_iter("user:*:connections"):
-                user_id = key.decode("utf-8").split(":")[1]
-                user_ids.add(user_id)
-
-            # Send to all local connections
-            for user_id in user_ids:
-                if user_id in self.local_connections:
-                    for connection in self.local_connections[user_id]:
-                        try:
-                            await connection.send_text(message)
-                        except Exception as e:
-                            logger.error(f"Error broadcasting to user {user_id}: {e}")
-                            self.disconnect(connection, user_id)
+            # Every node delivers to its own sockets
+            for user_id in list(self.local_connections):
+                await self.send_personal_message(message, user_id)
 
         except Exception as e:
             logger.error(f"Error in broadcast: {e}")
 
-    def cleanup_inactive_connections(self, max_age_seconds: int = 3600):
-        """Clean up connections that have been inactive for too long"""
-        try:
-            current_time = time.time()
-            for key in self.redis_client.scan_iter("connection:*"):
-                conn_data = self.redis_client.hgetall(key)
-                if conn_data:
-                    timestamp = datetime.fromisoformat(conn_data.get("timestamp", ""))
-                    if (current_time - timestamp.timestamp()) > max_age_seconds:
-                        self.redis_client.delete(key)
-                        user_id = conn_data.get("user_id")
-                        if user_id:
-                            self.redis_client.srem(f"user:{user_id}:connections", key)
-        except Exception as e:
-            logger.error(f"Error in cleanup_inactive_connections: {e}")
-
 
 # Create a global instance
 redis_websocket_manager = RedisWebSocketManager()
@@ -0,0 +1,181 @@
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple, Union
+import asyncio
+import logging
+import time
+from src.core.config import settings
+from src.core.ids import id_generator
+
+logger = logging.getLogger(__name__)
+
+# (event id, encoded id:/data: frame)
+SSEEvent = Tuple[int, bytes]
+
+
+class SSEConnection:
+    """Server-Sent Events subscriber registered with the WebSocket manager.
+
+    It offers the send_text/close interface the manager, drain and eviction
+    use for sockets; frames are handed to the streaming response through a
+    single-slot outbox, so buffering, lanes and collapse keys stay in the
+    manager's connection queue. The queue carries the event the hub
+    recorded for the user, so the frame written is the one a resume
+    replays; plain text such as the drain hint gets a fresh event.
+    """
+
+    def __init__(self, hub: "SSEHub", user_id: str):
+        self.hub = hub
+        self.user_id = user_id
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self.closed = asyncio.Event()
+
+    async def send_text(self, message: Union[str, SSEEvent]):
+        if self.closed.is_set():
+            raise ConnectionError("SSE stream closed")
+        if isinstance(message, str):
+            message = self.hub.encode(message)
+        await self.outbox.put(message[1])
+
+    async def close(self, code: Optional[int] = None, reason: Optional[str] = None):
+        self.closed.set()
+
+    async def stream(self, backlog: List[bytes]):
+        for frame in backlog:
+            yield frame
+        while not self.closed.is_set():
+            get_frame = asyncio.ensure_future(self.outbox.get())
+            wait_closed = asyncio.ensure_future(self.closed.wait())
+            try:
+                done, _ = await asyncio.wait(
+                    {get_frame, wait_closed},
+                    timeout=self.hub.keepalive_seconds,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+            finally:
+                wait_closed.cancel()
+                if not get_frame.done():
+                    get_frame.cancel()
+            if get_frame.done() and not get_frame.cancelled():
+                yield get_frame.result()
+            elif not done:
+                # Comment line, keeps proxies from timing out an idle stream
+                yield b": keepalive\n\n"
+        # Flush what was handed over before close, e.g. the drain reconnect hint
+        while not self.outbox.empty():
+            yield self.outbox.get_nowait()
+
+
+class SSEHub:
+    """Shared encoding and resume state for Server-Sent Events subscribers.
+
+    A message is encoded into its `id:`/`data:` frame once and the bytes are
+    shared by every subscriber it is fanned out to. Users with an open
+    stream, or one closed within resume_ttl, keep a short replay buffer of
+    references to those frames so a reconnect with Last-Event-ID can catch
+    up. The encode cache is keyed by message object, not content, and a
+    user never records an id lower than their last one, so ids strictly
+    increase in each user's delivery order.
+    """
+
+    def __init__(
+        self,
+        cache_size: int = settings.SSE_ENCODE_CACHE_SIZE,
+        replay_size: int = settings.SSE_REPLAY_BUFFER_SIZE,
+        resume_ttl: float = settings.SSE_RESUME_TTL_SECONDS,
+        keepalive_seconds: float = settings.SSE_KEEPALIVE_SECONDS,
+    ):
+        self.cache_size = cache_size
+        self.replay_size = replay_size
+        self.resume_ttl = resume_ttl
+        self.keepalive_seconds = keepalive_seconds
+
+        # id(message) -> (message, event); holding the message keeps its id unique
+        self._frames: "OrderedDict[int, Tuple[str, SSEEvent]]" = OrderedDict()
+        # user_id -> recent events addressed to the user, in delivery order
+        self.replay: Dict[str, Deque[SSEEvent]] = {}
+        # user_id -> open SSE streams, and when the last stream of a user closed
+        self.subscribers: Dict[str, int] = {}
+        self.released_at: Dict[str, float] = {}
+        self.encoded = 0
+
+    def encode(self, message: str) -> SSEEvent:
+        """A new event with the next id"""
+        # k-sortable: increasing across restarts, comparable between nodes
+        event_id = id_generator.next_int()
+        data = "".join(f"data: {line}\n" for line in message.split("\n"))
+        self.encoded += 1
+        return event_id, f"id: {event_id}\n{data}\n".encode()
+
+    def shared_event(self, message: str) -> SSEEvent:
+        """The event of this message object, encoded on first use"""
+        cached = self._frames.get(id(message))
+        if cached is not None and cached[0] is message:
+            return cached[1]
+        event = self.encode(message)
+        self._frames[id(message)] = (message, event)
+        if len(self._frames) > self.cache_size:
+            self._frames.popitem(last=False)
+        return event
+
+    def is_tracked(self, user_id: str) -> bool:
+        return user_id in self.replay
+
+    def record(self, user_id: str, message: str) -> Optional[SSEEvent]:
+        """Remember a message addressed to a user for Last-Event-ID resume.
+
+        Returns the event to write to the user's SSE streams, None once the
+        user's resume window has expired.
+        """
+        released_at = self.released_at.get(user_id)
+        if released_at is not None and time.monotonic() - released_at > self.resume_ttl:
+            self._forget(user_id)
+            return None
+        replay = self.replay[user_id]
+        event = self.shared_event(message)
+        if replay and event[0] <= replay[-1][0]:
+            # Encoded before the user's last event, e.g. the tail of an
+            # earlier fan-out, a lower id would be skipped on resume
+            event = self.encode(message)
+        replay.append(event)
+        return event
+
+    def record_all(self, message: str) -> Dict[str, SSEEvent]:
+        events = {}
+        for user_id in list(self.replay):
+            event = self.record(user_id, message)
+            if event is not None:
+                events[user_id] = event
+        return events
+
+    def subscribe(self, user_id: str, last_event_id: Optional[int]) -> List[bytes]:
+        """Start tracking a user and return the frames missed since last_event_id"""
+        self.subscribers[user_id] = self.subscribers.get(user_id, 0) + 1
+        self.released_at.pop(user_id, None)
+        replay = self.replay.setdefault(user_id, deque(maxlen=self.replay_size))
+        if last_event_id is None:
+            return []
+        return [frame for event_id, frame in replay if event_id > last_event_id]
+
+    def unsubscribe(self, user_id: str):
+        remaining = self.subscribers.get(user_id, 1) - 1
+        if remaining > 0:
+            self.subscribers[user_id] = remaining
+            return
+        self.subscribers.pop(user_id, None)
+        # Keep the replay buffer for a while so the client can resume
+        self.released_at[user_id] = time.monotonic()
+
+    def _forget(self, user_id: str):
+        self.replay.pop(user_id, None)
+        self.released_at.pop(user_id, None)
+
+    def get_stats(self) -> dict:
+        return {
+            "subscribers": sum(self.subscribers.values()),
+            "tracked_users": len(self.replay),
+            "frames_encoded": self.encoded,
+        }
+
+
+# Create a global instance
+sse_hub = SSEHub()
@@ -0,0 +1,211 @@
+from typing import Any, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set
+import logging
+from src.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Route(NamedTuple):
+    """What subscription filters match a message on"""
+
+    topic: Optional[str] = None
+    type: Optional[str] = None
+    priority: Optional[str] = None
+
+
+class Filter(NamedTuple):
+    """One subscription of a socket, None matching any value"""
+
+    topic: Optional[str] = None
+    types: Optional[FrozenSet[str]] = None
+    priorities: Optional[FrozenSet[str]] = None
+
+    def matches(self, route: Route) -> bool:
+        return (
+            (self.topic is None or self.topic == route.topic)
+            and (self.types is None or route.type in self.types)
+            and (self.priorities is None or route.priority in self.priorities)
+        )
+
+    def describe(self) -> dict:
+        return {
+            "topic": self.topic,
+            "types": sorted(self.types) if self.types is not None else None,
+            "priorities": sorted(self.priorities) if self.priorities is not None else None,
+        }
+
+
+class SubscriptionError(ValueError):
+    pass
+
+
+def _values(payload: dict, key: str) -> Optional[FrozenSet[str]]:
+    values = payload.get(key)
+    if values is None:
+        return None
+    if isinstance(values, str):
+        values = [values]
+    if (
+        not isinstance(values, list)
+        or not values
+        or len(values) > settings.WS_SUBSCRIPTION_MAX_VALUES
+        or not all(isinstance(value, str) for value in values)
+    ):
+        raise SubscriptionError(
+            f"'{key}' must be a string or a list of 1 to "
+            f"{settings.WS_SUBSCRIPTION_MAX_VALUES} strings"
+        )
+    return frozenset(values)
+
+
+def parse_filter(payload: Any) -> Filter:
+    """{"topic"?: str, "types"?: [str], "priorities"?: [str]} -> Filter"""
+    if not isinstance(payload, dict):
+        raise SubscriptionError("payload must be an object")
+    topic = payload.get("topic")
+    if topic is not None and (
+        not isinstance(topic, str)
+        or not 0 < len(topic) <= settings.WS_SUBSCRIPTION_MAX_TOPIC
+    ):
+        raise SubscriptionError(
+            f"'topic' must be a string of 1 to {settings.WS_SUBSCRIPTION_MAX_TOPIC} characters"
+        )
+    return Filter(topic, _values(payload, "types"), _values(payload, "priorities"))
+
+
+class SubscriptionIndex:
+    """Per-socket filters, compiled into an index keyed by topic.
+
+    A socket without subscriptions receives every message. Once it has
+    subscribed it receives routed messages only when one of its filters
+    matches; messages without a route are always delivered. The fan-out
+    asks recipients() which users to visit and accepts() which of their
+    sockets to write to.
+    """
+
+    def __init__(self):
+        # user_id -> registered sockets, and socket -> user_id
+        self.sockets: Dict[str, Set[Any]] = {}
+        self.owners: Dict[Any, str] = {}
+        # socket -> its filters, only for sockets that have subscribed
+        self.filters: Dict[Any, Set[Filter]] = {}
+        # topic (None for filters on any topic) -> sockets with such a filter
+        self.by_topic: Dict[Optional[str], Set[Any]] = {}
+        # user_id -> how many of the user's sockets have subscribed
+        self.filtered_users: Dict[str, int] = {}
+        self.skipped = 0
+
+    def add(self, websocket: Any, user_id: str):
+        self.sockets.setdefault(user_id, set()).add(websocket)
+        self.owners[websocket] = user_id
+
+    def remove(self, websocket: Any):
+        if websocket not in self.owners:
+            return
+        self.clear(websocket)
+        user_id = self.owners.pop(websocket)
+        sockets = self.sockets[user_id]
+        sockets.discard(websocket)
+        if not sockets:
+            del self.sockets[user_id]
+
+    def subscribe(self, websocket: Any, subscription: Filter) -> bool:
+        """Add a filter to a registered socket, False if it already had it"""
+        user_id = self.owners[websocket]
+        filters = self.filters.get(websocket)
+        if filters is None:
+            filters = self.filters[websocket] = set()
+            self.filtered_users[user_id] = self.filtered_users.get(user_id, 0) + 1
+        if subscription in filters:
+            return False
+        if len(filters) >= settings.WS_MAX_SUBSCRIPTIONS:
+            raise SubscriptionError(
+                f"at most {settings.WS_MAX_SUBSCRIPTIONS} subscriptions per connection"
+            )
+        filters.add(subscription)
+        self.by_topic.setdefault(subscription.topic, set()).add(websocket)
+        return True
+
+    def unsubscribe(self, websocket: Any, subscription: Filter) -> bool:
+        """Remove one filter; the socket stays filtered even without any left"""
+        filters = self.filters.get(websocket)
+        if filters is None or subscription not in filters:
+            return False
+        filters.discard(subscription)
+        if not any(other.topic == subscription.topic for other in filters):
+            self._unindex(websocket, subscription.topic)
+        return True
+
+    def clear(self, websocket: Any):
+        """Drop every filter, the socket receives everything again"""
+        filters = self.filters.pop(websocket, None)
+        if filters is None:
+            return
+        for topic in {subscription.topic for subscription in filters}:
+            self._unindex(websocket, topic)
+        user_id = self.owners[websocket]
+        remaining = self.filtered_users[user_id] - 1
+        if remaining:
+            self.filtered_users[user_id] = remaining
+        else:
+            del self.filtered_users[user_id]
+
+    def _unindex(self, websocket: Any, topic: Optional[str]):
+        sockets = self.by_topic.get(topic)
+        if sockets is not None:
+            sockets.discard(websocket)
+            if not sockets:
+                del self.by_topic[topic]
+
+    def describe(self, websocket: Any) -> Optional[List[dict]]:
+        filters = self.filters.get(websocket)
+        if filters is None:
+            return None
+        return [subscription.describe() for subscription in filters]
+
+    def accepts(self, websocket: Any, route: Route) -> bool:
+        filters = self.filters.get(websocket)
+        if filters is None or any(subscription.matches(route) for subscription in filters):
+            return True
+        self.skipped += 1
+        return False
+
+    def has_filters(self, user_id: str) -> bool:
+        return user_id in self.filtered_users
+
+    def matching_users(self, route: Route) -> Set[str]:
+        """Owners of subscribed sockets with a filter matching the route"""
+        users = set()
+        for topic in {route.topic, None}:
+            for websocket in self.by_topic.get(topic, ()):
+                if any(
+                    subscription.matches(route)
+                    for subscription in self.filters[websocket]
+                ):
+                    users.add(self.owners[websocket])
+        return users
+
+    def recipients(self, route: Optional[Route], user_ids: Iterable[str]) -> List[str]:
+        """The users with a socket that a routed message should reach"""
+        if route is None or not self.filtered_users:
+            return list(user_ids)
+        matched = self.matching_users(route)
+        return [
+            user_id
+            for user_id in user_ids
+            if user_id in matched
+            or self.filtered_users.get(user_id, 0) < len(self.sockets.get(user_id, ()))
+            or user_id not in self.sockets
+        ]
+
+    def get_stats(self) -> dict:
+        return {
+            "subscribed_sockets": len(self.filters),
+            "topics": len(self.by_topic),
+            "filtered_users": len(self.filtered_users),
+            "skipped_writes": self.skipped,
+        }
+
+
+# Create a global instance
+subscription_index = SubscriptionIndex()
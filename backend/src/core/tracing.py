@@ -0,0 +1,349 @@
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Deque, Dict, List, Optional, Tuple
+import json
+import logging
+import os
+import random
+import time
+from src.core.config import settings
+from src.core.metrics import LatencyStats
+
+logger = logging.getLogger(__name__)
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar(
+    "current_trace", default=None
+)
+
+
+def current_trace() -> Optional["Trace"]:
+    return _current_trace.get()
+
+
+def current_trace_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+class Trace:
+    """One delivery, from ingress to the last socket write.
+
+    Stage spans are recorded as they end. Socket writes are aggregated
+    rather than kept one span each. The trace finishes once its request
+    has ended and no queued message of it is waiting for a socket write;
+    pending counts those queued messages.
+    """
+
+    __slots__ = (
+        "tracer",
+        "trace_id",
+        "name",
+        "attributes",
+        "start_ns",
+        "end_ns",
+        "spans",
+        "open",
+        "pending",
+        "writes",
+        "write_errors",
+        "first_write_ns",
+        "last_write_ns",
+        "max_write_ns",
+    )
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: dict):
+        self.tracer = tracer
+        self.trace_id = os.urandom(16).hex()
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        # (name, start_ns, end_ns, attributes)
+        self.spans: List[Tuple[str, int, int, dict]] = []
+        self.open = True
+        self.pending = 0
+        self.writes = 0
+        self.write_errors = 0
+        self.first_write_ns = 0
+        self.last_write_ns = 0
+        self.max_write_ns = 0
+
+    def add_span(self, name: str, start_ns: int, end_ns: int, **attributes):
+        self.spans.append((name, start_ns, end_ns, attributes))
+        self.tracer.stage_stats(name).record((end_ns - start_ns) / 1e9)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        start_ns = time.time_ns()
+        try:
+            yield
+        finally:
+            self.add_span(name, start_ns, time.time_ns(), **attributes)
+
+    def acquire(self):
+        self.pending += 1
+
+    def release(self):
+        self.pending -= 1
+        if not self.pending and not self.open:
+            self._finish()
+
+    def record_write(self, start_ns: int, end_ns: int, ok: bool = True):
+        if not self.first_write_ns:
+            self.first_write_ns = start_ns
+        self.last_write_ns = end_ns
+        self.writes += 1
+        if not ok:
+            self.write_errors += 1
+        duration = end_ns - start_ns
+        if duration > self.max_write_ns:
+            self.max_write_ns = duration
+        self.tracer.stage_stats("socket_write").record(duration / 1e9)
+
+    def end(self):
+        """The ingress side is done, finish once queued writes are done too"""
+        self.open = False
+        if not self.pending:
+            self._finish()
+
+    def _finish(self):
+        if self.end_ns:
+            return
+        self.end_ns = max(time.time_ns(), self.last_write_ns)
+        if self.writes:
+            self.spans.append(
+                (
+                    "socket_write",
+                    self.first_write_ns,
+                    self.last_write_ns,
+                    {
+                        "writes": self.writes,
+                        "errors": self.write_errors,
+                        "max_ms": round(self.max_write_ns / 1e6, 3),
+                    },
+                )
+            )
+        self.tracer.stage_stats("total").record((self.end_ns - self.start_ns) / 1e9)
+        self.tracer.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "attributes": self.attributes,
+            "duration_ms": round(((self.end_ns or time.time_ns()) - self.start_ns) / 1e6, 3),
+            "finished": bool(self.end_ns),
+            "pending_writes": self.pending,
+            "spans": [
+                {
+                    "name": name,
+                    "offset_ms": round((start_ns - self.start_ns) / 1e6, 3),
+                    "duration_ms": round((end_ns - start_ns) / 1e6, 3),
+                    **({"attributes": attributes} if attributes else {}),
+                }
+                for name, start_ns, end_ns, attributes in self.spans
+            ],
+        }
+
+
+class RingBufferExporter:
+    """Keeps the most recent finished traces in memory for /debug/traces"""
+
+    def __init__(self, size: int = settings.TRACE_BUFFER_SIZE):
+        self.traces: Deque[Trace] = deque(maxlen=size)
+
+    def export(self, trace: Trace):
+        self.traces.append(trace)
+
+    def recent(self, limit: int) -> List[Trace]:
+        return list(self.traces)[-limit:][::-1]
+
+    def find(self, trace_id: str) -> Optional[Trace]:
+        return next((t for t in self.traces if t.trace_id == trace_id), None)
+
+    def shutdown(self):
+        pass
+
+
+def _otlp_attributes(attributes: dict) -> List[dict]:
+    converted = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            converted.append({"key": key, "value": {"boolValue": value}})
+        elif isinstance(value, int):
+            converted.append({"key": key, "value": {"intValue": str(value)}})
+        elif isinstance(value, float):
+            converted.append({"key": key, "value": {"doubleValue": value}})
+        else:
+            converted.append({"key": key, "value": {"stringValue": str(value)}})
+    return converted
+
+
+class OTLPFileExporter:
+    """Appends each finished trace as one OTLP/JSON ExportTraceServiceRequest line"""
+
+    def __init__(self, path: str, service_name: str = "realtime-ws-notification"):
+        self.path = path
+        self.service_name = service_name
+        self.file = None
+
+    def export(self, trace: Trace):
+        root_span_id = trace.trace_id[:16]
+        spans = [
+            {
+                "traceId": trace.trace_id,
+                "spanId": root_span_id,
+                "name": trace.name,
+                "kind": 2,  # SPAN_KIND_SERVER
+                "startTimeUnixNano": str(trace.start_ns),
+                "endTimeUnixNano": str(trace.end_ns),
+                "attributes": _otlp_attributes(trace.attributes),
+            }
+        ]
+        for name, start_ns, end_ns, attributes in trace.spans:
+            spans.append(
+                {
+                    "traceId": trace.trace_id,
+                    "spanId": os.urandom(8).hex(),
+                    "parentSpanId": root_span_id,
+                    "name": name,
+                    "kind": 1,  # SPAN_KIND_INTERNAL
+                    "startTimeUnixNano": str(start_ns),
+                    "endTimeUnixNano": str(end_ns),
+                    "attributes": _otlp_attributes(attributes),
+                }
+            )
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": _otlp_attributes(
+                            {"service.name": self.service_name}
+                        )
+                    },
+                    "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+                }
+            ]
+        }
+        try:
+            if self.file is None:
+                self.file = open(self.path, "a")
+            self.file.write(json.dumps(request, separators=(",", ":")) + "\n")
+        except Exception as e:
+            logger.error(f"Error exporting trace to {self.path}: {e}")
+
+    def shutdown(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class Tracer:
+    def __init__(
+        self,
+        enabled: bool = settings.TRACING_ENABLED,
+        sample_rate: float = settings.TRACE_SAMPLE_RATE,
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.exporters: list = []
+        self.stages: Dict[str, LatencyStats] = {}
+
+    def add_exporter(self, exporter):
+        """Exporters need export(trace) and shutdown()"""
+        self.exporters.append(exporter)
+
+    def stage_stats(self, name: str) -> LatencyStats:
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = LatencyStats()
+        return stats
+
+    def start(self, name: str, **attributes) -> Optional[Trace]:
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        return Trace(self, name, attributes)
+
+    @contextmanager
+    def trace(self, name: str, **attributes):
+        """Make a new trace current for the enclosed block"""
+        trace = self.start(name, **attributes)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_trace.reset(token)
+            if trace is not None:
+                trace.end()
+
+    def span(self, name: str, **attributes):
+        """Time a stage of the current trace, a no-op when there is none"""
+        trace = _current_trace.get()
+        if trace is None:
+            return nullcontext()
+        return trace.span(name, **attributes)
+
+    def export(self, trace: Trace):
+        for exporter in self.exporters:
+            try:
+                exporter.export(trace)
+            except Exception as e:
+                logger.error(f"Error exporting trace {trace.trace_id}: {e}")
+
+    def shutdown(self):
+        for exporter in self.exporters:
+            exporter.shutdown()
+
+    def get_stats(self) -> dict:
+        return {name: stats.to_dict() for name, stats in self.stages.items()}
+
+
+class TracingMiddleware:
+    """Starts a trace for POST requests under the traced path prefixes.
+
+    The "validation" stage covers body parsing and pydantic validation, from
+    the request arriving to the endpoint calling mark_handler_start().
+    """
+
+    def __init__(self, app, prefixes: Optional[List[str]] = None):
+        self.app = app
+        self.prefixes = tuple(prefixes or settings.TRACE_PATH_PREFIXES)
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not scope["path"].startswith(self.prefixes)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        with tracer.trace(f"POST {scope['path']}") as trace:
+            if trace is None:
+                await self.app(scope, receive, send)
+                return
+
+            async def send_with_trace_id(message):
+                if message["type"] == "http.response.start":
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-trace-id", trace.trace_id.encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace_id)
+
+
+def mark_handler_start():
+    """Close the validation stage, call first thing in a traced endpoint"""
+    trace = _current_trace.get()
+    if trace is not None and not trace.spans:
+        trace.add_span("validation", trace.start_ns, time.time_ns())
+
+
+# Create a global instance
+tracer = Tracer()
+ring_buffer_exporter = RingBufferExporter()
+tracer.add_exporter(ring_buffer_exporter)
+if settings.TRACE_EXPORT_PATH:
+    tracer.add_exporter(OTLPFileExporter(settings.TRACE_EXPORT_PATH))
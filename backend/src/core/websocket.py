@@ -1,21 +1,315 @@
-from typing import Dict, Set
+from collections import deque
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Union
 from fastapi import WebSocket
+import asyncio
 import logging
+import time
+from src.core.config import settings
+from src.core.metrics import LatencyStats, RateStats, TopK
+from src.core.priority import LANES, NORMAL
+from src.core.recorder import traffic_recorder
+from src.core.sse import SSEConnection, SSEEvent, sse_hub
+from src.core.subscriptions import Route, subscription_index
+from src.core.tracing import Trace, current_trace
 
 logger = logging.getLogger(__name__)
 
 
+class ConnectionStats:
+    """Counters of one connection, updated in place by its writer and reader"""
+
+    __slots__ = (
+        "user_id",
+        "connected_at",
+        "connected_since",
+        "messages_sent",
+        "bytes_sent",
+        "messages_received",
+        "bytes_received",
+        "receive_rate",
+        "send_latency",
+        "send_errors",
+    )
+
+    def __init__(self, user_id: str):
+        self.user_id = user_id
+        self.connected_at = time.time()
+        self.connected_since = time.monotonic()
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.messages_received = 0
+        self.bytes_received = 0
+        self.receive_rate = RateStats(settings.WS_RECEIVE_RATE_HALF_LIFE_SECONDS)
+        self.send_latency = LatencyStats(alpha=0.2)
+        self.send_errors = 0
+
+
+def describe_stats(websocket: Any, stats: ConnectionStats, queue_depth: int) -> dict:
+    client = getattr(websocket, "client", None)
+    return {
+        "connection_id": f"{id(websocket):x}",
+        "user_id": stats.user_id,
+        "transport": "websocket" if isinstance(websocket, WebSocket) else "sse",
+        "client": f"{client.host}:{client.port}" if client else None,
+        "connected_at": datetime.fromtimestamp(stats.connected_at).isoformat(),
+        "age_seconds": round(time.monotonic() - stats.connected_since, 3),
+        "messages_sent": stats.messages_sent,
+        "bytes_sent": stats.bytes_sent,
+        "messages_received": stats.messages_received,
+        "bytes_received": stats.bytes_received,
+        "received_per_second": round(stats.receive_rate.rate(time.monotonic()), 3),
+        "send_latency": stats.send_latency.to_dict(),
+        "send_errors": stats.send_errors,
+        "queue_depth": queue_depth,
+    }
+
+
+def record_received(stats: ConnectionStats, size: int, noisiest: TopK, websocket: Any):
+    """Count an inbound frame and rank the socket by its receive rate"""
+    stats.messages_received += 1
+    stats.bytes_received += size
+    stats.receive_rate.record(time.monotonic())
+    noisiest.update(websocket, stats.receive_rate.score())
+
+
+class RecentFailures:
+    """Connections dropped after a failed write, kept for ttl_seconds.
+
+    Their stats are gone with the connection, so the report would never
+    show a send error without this record.
+    """
+
+    def __init__(
+        self,
+        size: int = settings.WS_STATS_TOP_K,
+        ttl_seconds: float = settings.WS_FAILED_CONNECTIONS_TTL_SECONDS,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.entries: Deque[tuple] = deque(maxlen=size)
+
+    def add(self, description: dict, error: Optional[BaseException] = None):
+        description["failed_at"] = datetime.now().isoformat()
+        description["error"] = repr(error) if error is not None else None
+        self.entries.append((time.monotonic(), description))
+
+    def recent(self, limit: int) -> List[dict]:
+        """The latest failures, newest first"""
+        expired_before = time.monotonic() - self.ttl_seconds
+        while self.entries and self.entries[0][0] < expired_before:
+            self.entries.popleft()
+        return [description for _, description in reversed(self.entries)][:limit]
+
+
+def connection_report(
+    ranking: TopK,
+    total: int,
+    sort: str,
+    limit: int,
+    describe: Callable,
+    failures: RecentFailures,
+) -> dict:
+    """The top connections of a ranking, for GET /api/admin/connections"""
+    connections = (describe(websocket) for websocket, _ in ranking.top(limit))
+    return {
+        "total_connections": total,
+        "sort": sort,
+        "connections": [
+            connection for connection in connections if connection is not None
+        ],
+        "recently_failed": failures.recent(limit),
+    }
+
+
+class ConnectionQueue:
+    """Outbound messages waiting to be written to one socket.
+
+    Messages sit in one lane per priority. The highest non-empty lane is
+    written first, unless the head of a lower lane has waited longer than
+    max_wait, so low priority traffic is delayed but never starved.
+
+    Entries are [collapse_key, message, enqueued_at, lane, trace] lists so a
+    newer message with the same collapse key can replace an undelivered one
+    in place. For SSE streams the message is the event the hub recorded.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        max_size: int,
+        max_wait: float,
+        latency: Dict[str, LatencyStats],
+        stats: "ConnectionStats",
+        slowest: TopK,
+    ):
+        self.websocket = websocket
+        self.max_size = max_size
+        self.max_wait = max_wait
+        self.latency = latency
+        self.stats = stats
+        self.slowest = slowest
+        self.lanes: Dict[str, Deque[list]] = {lane: deque() for lane in LANES}
+        self.size = 0
+        self.collapsible: Dict[str, list] = {}
+        self.ready = asyncio.Event()
+        self.collapsed = 0
+        self.dropped = 0
+
+    def put(
+        self,
+        message: Union[str, SSEEvent],
+        collapse_key: Optional[str] = None,
+        lane: str = NORMAL,
+        trace: Optional[Trace] = None,
+    ):
+        if trace is not None:
+            trace.acquire()
+        if collapse_key is not None:
+            entry = self.collapsible.get(collapse_key)
+            if entry is not None:
+                entry[1] = message
+                if entry[4] is not None:
+                    entry[4].release()
+                entry[4] = trace
+                if entry[3] != lane:
+                    # Sent at the priority of the newest version
+                    self.lanes[entry[3]].remove(entry)
+                    entry[2] = time.monotonic()
+                    entry[3] = lane
+                    self.lanes[lane].append(entry)
+                self.collapsed += 1
+                return
+
+        if self.size >= self.max_size:
+            self._drop_lowest()
+
+        entry = [collapse_key, message, time.monotonic(), lane, trace]
+        self.lanes[lane].append(entry)
+        self.size += 1
+        if collapse_key is not None:
+            self.collapsible[collapse_key] = entry
+        self.ready.set()
+
+    def _take(self, pending: Deque[list]) -> list:
+        entry = pending.popleft()
+        self.size -= 1
+        if entry[0] is not None and self.collapsible.get(entry[0]) is entry:
+            del self.collapsible[entry[0]]
+        return entry
+
+    def _drop_lowest(self):
+        """Make room by dropping the oldest message of the lowest non-empty lane"""
+        for lane in reversed(LANES):
+            if self.lanes[lane]:
+                entry = self._take(self.lanes[lane])
+                if entry[4] is not None:
+                    entry[4].release()
+                self.dropped += 1
+                return
+
+    def _next(self, now: float) -> list:
+        chosen = None
+        for lane in LANES:
+            pending = self.lanes[lane]
+            if not pending:
+                continue
+            if chosen is None:
+                chosen = pending
+            elif (
+                now - pending[0][2] > self.max_wait
+                and pending[0][2] < chosen[0][2]
+            ):
+                # Starvation protection: an aged lower lane goes first
+                chosen = pending
+        return self._take(chosen)
+
+    async def run(self):
+        stats = self.stats
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            while self.size:
+                entry = self._next(time.monotonic())
+                trace = entry[4]
+                start_ns = time.time_ns() if trace is not None else 0
+                started_at = time.monotonic()
+                try:
+                    await self.websocket.send_text(entry[1])
+                except BaseException as e:
+                    # Including cancellation, the trace must not stay pending
+                    if not isinstance(e, asyncio.CancelledError):
+                        stats.send_errors += 1
+                    if trace is not None:
+                        trace.record_write(start_ns, time.time_ns(), ok=False)
+                        trace.release()
+                    raise
+                now = time.monotonic()
+                stats.messages_sent += 1
+                payload = entry[1]
+                # An SSE event is (event_id, frame)
+                stats.bytes_sent += len(
+                    payload if isinstance(payload, str) else payload[1]
+                )
+                stats.send_latency.record(now - started_at)
+                self.slowest.update(self.websocket, stats.send_latency.ewma)
+                if trace is not None:
+                    trace.record_write(start_ns, time.time_ns())
+                    trace.release()
+                self.latency[entry[3]].record(now - entry[2])
+
+    def discard(self):
+        """Release traces of messages that will never be written"""
+        for pending in self.lanes.values():
+            while pending:
+                entry = self._take(pending)
+                if entry[4] is not None:
+                    entry[4].release()
+
+
 class WebSocketManager:
     def __init__(self):
         # use redis to store active connections
         self.active_connections: Dict[str, Set[WebSocket]] = {}
+        self.stats: Dict[WebSocket, ConnectionStats] = {}
+        # Candidates for the slow-consumer report, kept current on every
+        # write and read so a report never sorts all connections
+        self.slowest = TopK(settings.WS_STATS_TOP_K)
+        self.noisiest = TopK(settings.WS_STATS_TOP_K)
+        self.failures = RecentFailures()
+        self.queues: Dict[WebSocket, ConnectionQueue] = {}
+        self.writers: Dict[WebSocket, asyncio.Task] = {}
+        # Bumped whenever a user gets their first or loses their last connection
+        self.version = 0
+        # Enqueue-to-write latency per delivery lane, across all connections
+        self.lane_latency: Dict[str, LatencyStats] = {
+            lane: LatencyStats() for lane in LANES
+        }
+        # Disconnects a socket after a failed write instead of disconnect(),
+        # set by the connection manager wrapping this one so what it keeps
+        # per socket (subscriptions, presence) is released as well
+        self.on_write_error: Optional[Callable[[WebSocket, str], Awaitable[None]]] = None
 
     async def connect(self, websocket: WebSocket, user_id: str):
         try:
             # Don't accept the connection here as it's already accepted in the endpoint
             if user_id not in self.active_connections:
                 self.active_connections[user_id] = set()
+                self.version += 1
             self.active_connections[user_id].add(websocket)
+            stats = self.stats[websocket] = ConnectionStats(user_id)
+            queue = self.queues[websocket] = ConnectionQueue(
+                websocket,
+                settings.WS_SEND_QUEUE_SIZE,
+                settings.WS_LANE_MAX_WAIT_SECONDS,
+                self.lane_latency,
+                stats,
+                self.slowest,
+            )
+            self.writers[websocket] = asyncio.create_task(
+                self._write(queue, user_id)
+            )
+            if traffic_recorder.enabled:
+                traffic_recorder.record_connect(websocket, user_id)
             logger.info(
                 f"User {user_id} connected. Active connections: {len(self.active_connections[user_id])}"
             )
@@ -23,44 +317,161 @@ class WebSocketManager:
             logger.error(f"Error adding WebSocket connection: {e}")
             raise
 
+    async def _write(self, queue: ConnectionQueue, user_id: str):
+        try:
+            await queue.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending message to user {user_id}: {e}")
+            stats = self.stats.get(queue.websocket)
+            if stats is not None:
+                self.failures.add(describe_stats(queue.websocket, stats, queue.size), e)
+            if self.on_write_error is not None:
+                await self.on_write_error(queue.websocket, user_id)
+            else:
+                self.disconnect(queue.websocket, user_id)
+
     def disconnect(self, websocket: WebSocket, user_id: str):
+        self.stats.pop(websocket, None)
+        self.slowest.discard(websocket)
+        self.noisiest.discard(websocket)
+        queue = self.queues.pop(websocket, None)
+        writer = self.writers.pop(websocket, None)
+        if writer is not None and writer is not asyncio.current_task():
+            writer.cancel()
+        if queue is not None:
+            queue.discard()
+            if traffic_recorder.enabled:
+                traffic_recorder.record_disconnect(websocket, user_id)
         if user_id in self.active_connections:
             self.active_connections[user_id].discard(websocket)
             if not self.active_connections[user_id]:
                 del self.active_connections[user_id]
+                self.version += 1
             logger.info(
                 f"User {user_id} disconnected. Remaining connections: {len(self.active_connections.get(user_id, set()))}"
             )
 
-    async def send_personal_message(self, message: str, user_id: str):
-        if user_id in self.active_connections:
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_text(message)
-                except Exception as e:
-                    logger.error(f"Error sending message to user {user_id}: {e}")
-                    self.disconnect(connection, user_id)
+    def evict_oldest(self, user_id: str, max_sockets: int) -> List[WebSocket]:
+        """Unregister the oldest sockets of a user above max_sockets and return them"""
+        connections = self.active_connections.get(user_id)
+        if not connections or len(connections) <= max_sockets:
+            return []
+
+        by_age = sorted(
+            connections,
+            key=lambda ws: self.stats[ws].connected_since if ws in self.stats else 0.0,
+        )
+        evicted = by_age[: len(connections) - max_sockets]
+        for websocket in evicted:
+            self.disconnect(websocket, user_id)
+        return evicted
+
+    def record_received(self, websocket: WebSocket, size: int):
+        stats = self.stats.get(websocket)
+        if stats is not None:
+            record_received(stats, size, self.noisiest, websocket)
+
+    def enqueue(
+        self,
+        user_id: str,
+        message: str,
+        collapse_key: Optional[str] = None,
+        lane: str = NORMAL,
+        trace: Optional[Trace] = None,
+        route: Optional[Route] = None,
+    ):
+        """Queue a message on every socket of a user without waiting for the write.
+
+        A routed message skips sockets whose subscriptions don't match it.
+        """
+        event = None
+        if sse_hub.is_tracked(user_id):
+            event = sse_hub.record(user_id, message)
+        connections = self.active_connections.get(user_id, ())
+        if route is not None and subscription_index.has_filters(user_id):
+            connections = [
+                connection
+                for connection in connections
+                if subscription_index.accepts(connection, route)
+            ]
+        for connection in connections:
+            queue = self.queues.get(connection)
+            if queue is not None:
+                queue.put(
+                    self._payload(connection, message, event),
+                    collapse_key,
+                    lane,
+                    trace,
+                )
 
-    async def broadcast(self, message: str):
+    @staticmethod
+    def _payload(connection, message: str, event: Optional[SSEEvent]):
+        """What a connection's queue writes: SSE streams get the recorded event"""
+        if event is not None and isinstance(connection, SSEConnection):
+            return event
+        return message
+
+    async def send_personal_message(
+        self,
+        message: str,
+        user_id: str,
+        collapse_key: Optional[str] = None,
+        lane: str = NORMAL,
+    ):
+        self.enqueue(user_id, message, collapse_key, lane, current_trace())
+
+    async def broadcast(
+        self, message: str, collapse_key: Optional[str] = None, lane: str = NORMAL
+    ):
         logger.info(f"Broadcasting message to all connected clients")
-        logger.debug(f"Message to broadcast: {message}")
-        logger.debug(f"Active connections: {self.active_connections}")
+        events = sse_hub.record_all(message)
 
         if not self.active_connections:
             logger.warning("No active connections to broadcast to")
             return
 
-        for user_connections in self.active_connections.values():
-            for connection in user_connections:
-                try:
-                    logger.debug(f"Sending message to connection: {connection}")
-                    await connection.send_text(message)
-                    logger.debug(
-                        f"Message sent successfully to connection: {connection}"
+        trace = current_trace()
+        for user_id, connections in self.active_connections.items():
+            event = events.get(user_id)
+            for connection in connections:
+                queue = self.queues.get(connection)
+                if queue is not None:
+                    queue.put(
+                        self._payload(connection, message, event),
+                        collapse_key,
+                        lane,
+                        trace,
                     )
-                except Exception as e:
-                    logger.error(f"Error broadcasting message: {e}")
-                    # Note: We don't disconnect here as we don't have the user_id
+
+    def describe_connection(self, websocket: WebSocket) -> Optional[dict]:
+        stats = self.stats.get(websocket)
+        if stats is None:
+            return None
+        queue = self.queues.get(websocket)
+        return describe_stats(websocket, stats, queue.size if queue is not None else 0)
+
+    def get_connection_report(self, sort: str, limit: int) -> dict:
+        ranking = self.slowest if sort == "slowest" else self.noisiest
+        return connection_report(
+            ranking,
+            len(self.stats),
+            sort,
+            limit,
+            self.describe_connection,
+            self.failures,
+        )
+
+    def get_queue_stats(self) -> dict:
+        return {
+            "queued": sum(queue.size for queue in self.queues.values()),
+            "collapsed": sum(queue.collapsed for queue in self.queues.values()),
+            "dropped": sum(queue.dropped for queue in self.queues.values()),
+            "lane_latency": {
+                lane: stats.to_dict() for lane, stats in self.lane_latency.items()
+            },
+        }
 
 
 # Create a global instance
@@ -0,0 +1,143 @@
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from pydantic import BaseModel
+import hashlib
+import json
+import logging
+from src.config import users
+from src.core.config import settings
+from src.core.redis_stream import stream_fanout
+from src.core.sse import sse_hub
+from src.core.connection_manager import connection_manager
+
+logger = logging.getLogger(__name__)
+
+
+class AudienceSelector(BaseModel):
+    """Users matching any of the companies and any of the roles, minus exclusions.
+
+    An empty companies or roles list matches every company or role.
+    """
+
+    companies: List[str] = []
+    roles: List[str] = []
+    exclude: List[str] = []
+
+    def canonical(self) -> "AudienceSelector":
+        return AudienceSelector(
+            companies=sorted(set(self.companies)),
+            roles=sorted(set(self.roles)),
+            exclude=sorted(set(self.exclude)),
+        )
+
+    def audience_id(self) -> str:
+        key = json.dumps(self.canonical().dict(), separators=(",", ":"))
+        return f"aud_{hashlib.sha1(key.encode()).hexdigest()[:16]}"
+
+    def tenant(self) -> Optional[str]:
+        """The company sends are accounted to, None when it spans companies"""
+        companies = set(self.companies)
+        return companies.pop() if len(companies) == 1 else None
+
+
+class Audience:
+    __slots__ = (
+        "id",
+        "selector",
+        "members",
+        "directory_version",
+        "reachable",
+        "connections_version",
+    )
+
+    def __init__(self, selector: AudienceSelector):
+        self.id = selector.audience_id()
+        self.selector = selector.canonical()
+        self.members: Tuple[str, ...] = ()
+        self.directory_version = -1
+        self.reachable: List[str] = []
+        self.connections_version = -1
+
+
+class AudienceResolver:
+    """Caches the recipients of a selector, keyed by a reusable audience id.
+
+    Members are recomputed when the user directory changes. The subset that
+    has a connection on this node is cached separately and recomputed when
+    a user comes online or goes offline.
+    """
+
+    def __init__(self, max_audiences: int = settings.AUDIENCE_CACHE_SIZE):
+        self.max_audiences = max_audiences
+        self.audiences: "OrderedDict[str, Audience]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, selector: AudienceSelector) -> Audience:
+        audience_id = selector.audience_id()
+        audience = self.audiences.get(audience_id)
+        if audience is None:
+            audience = self.audiences[audience_id] = Audience(selector)
+            if len(self.audiences) > self.max_audiences:
+                self.audiences.popitem(last=False)
+        else:
+            self.audiences.move_to_end(audience_id)
+        return audience
+
+    def get(self, audience_id: str) -> Optional[Audience]:
+        return self.audiences.get(audience_id)
+
+    def _materialize(self, audience: Audience):
+        version = users.get_directory_version()
+        if audience.directory_version == version:
+            self.hits += 1
+            return
+        self.misses += 1
+        selector = audience.selector
+        companies = set(selector.companies)
+        roles = set(selector.roles)
+        excluded = set(selector.exclude)
+        audience.members = tuple(
+            user.username
+            for user in users.USERS
+            if (not companies or user.company in companies)
+            and (not roles or user.role in roles)
+            and user.username not in excluded
+        )
+        audience.directory_version = version
+        audience.connections_version = -1
+
+    def members(self, audience: Audience) -> Tuple[str, ...]:
+        self._materialize(audience)
+        return audience.members
+
+    def recipients(self, audience: Audience) -> List[str]:
+        """Members to fan out to from this node.
+
+        With the Redis stream enabled every member is published, other nodes
+        hold their sockets. Otherwise only members connected here, or with
+        an SSE stream that can still resume, are kept.
+        """
+        self._materialize(audience)
+        if stream_fanout.enabled:
+            return list(audience.members)
+        if audience.connections_version != connection_manager.version:
+            audience.reachable = [
+                username
+                for username in audience.members
+                if connection_manager.is_connected(username)
+                or sse_hub.is_tracked(username)
+            ]
+            audience.connections_version = connection_manager.version
+        return audience.reachable
+
+    def get_stats(self) -> dict:
+        return {
+            "audiences": len(self.audiences),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+# Create a global instance
+audience_resolver = AudienceResolver()
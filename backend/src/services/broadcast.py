@@ -1,24 +1,69 @@
 import json
 import logging
-from src.core.websocket import websocket_manager
-from src.config.users import get_users_by_company, get_users_by_role
+from src.core.redis_stream import stream_fanout
+from src.core.priority import lane_for
+from src.core.subscriptions import Route
+from src.core.tracing import current_trace_id, tracer
+from src.services.audience import AudienceSelector, audience_resolver
 
 logger = logging.getLogger(__name__)
 
 
-class BroadcastService:
-    async def broadcast_to_company(self, company: str, message: dict):
-        """Broadcast message to all users in a specific company"""
-        try:
-            users = get_users_by_company(company)
+def _delivery_options(message: dict) -> dict:
+    payload = message.get("payload", {})
+    priority = payload.get("priority") or payload.get("type")
+    topic = (payload.get("data") or {}).get("topic")
+    return {
+        "lane": lane_for(priority),
+        "collapse_key": payload.get("collapse_key"),
+        # Matched against the subscription filters of the recipients' sockets
+        "route": Route(
+            topic if isinstance(topic, str) else None, payload.get("type"), priority
+        ),
+    }
 
+
+class BroadcastService:
+    async def _send(self, selector: AudienceSelector, message: dict):
+        with tracer.span("audience"):
+            audience = audience_resolver.register(selector)
+            recipients = audience_resolver.recipients(audience)
+
+        with tracer.span("serialize"):
+            trace_id = current_trace_id()
+            if trace_id is not None:
+                message = {**message, "trace_id": trace_id}
             # Convert message to JSON string
             message_str = json.dumps(message)
 
-            for user in users:
-                await websocket_manager.send_personal_message(
-                    message_str, user.username
-                )
+        with tracer.span("dispatch", recipients=len(recipients)):
+            await stream_fanout.dispatch(
+                recipients,
+                message_str,
+                tenant=selector.tenant(),
+                **_delivery_options(message),
+            )
+
+    async def broadcast_to_audience(
+        self, audience_id: str, selector: dict, message: dict
+    ):
+        """Broadcast message to a previously resolved audience"""
+        try:
+            audience_selector = AudienceSelector(**selector)
+            if audience_selector.audience_id() != audience_id:
+                raise ValueError(f"Selector does not match audience {audience_id}")
+            await self._send(audience_selector, message)
+
+            logger.info(f"Broadcasted message to audience {audience_id}: {message}")
+            return True
+        except Exception as e:
+            logger.error(f"Error broadcasting to audience {audience_id}: {str(e)}")
+            return False
+
+    async def broadcast_to_company(self, company: str, message: dict):
+        """Broadcast message to all users in a specific company"""
+        try:
+            await self._send(AudienceSelector(companies=[company]), message)
 
             logger.info(f"Broadcasted message to company {company}: {message}")
             return True
@@ -29,15 +74,7 @@ class BroadcastService:
     async def broadcast_to_role(self, role: str, message: dict):
         """Broadcast message to all users with a specific role"""
         try:
-            users = get_users_by_role(role)
-
-            # Convert message to JSON string
-            message_str = json.dumps(message)
-
-            for user in users:
-                await websocket_manager.send_personal_message(
-                    message_str, user.username
-                )
+            await self._send(AudienceSelector(roles=[role]), message)
 
             logger.info(f"Broadcasted message to role {role}: {message}")
             return True
@@ -48,16 +85,9 @@ class BroadcastService:
     async def broadcast_to_company_role(self, company: str, role: str, message: dict):
         """Broadcast message to all users in a specific company with a specific role"""
         try:
-            company_users = get_users_by_company(company)
-
-            # Convert message to JSON string
-            message_str = json.dumps(message)
-
-            for user in company_users:
-                if user.role == role:
-                    await websocket_manager.send_personal_message(
-                        message_str, user.username
-                    )
+            await self._send(
+                AudienceSelector(companies=[company], roles=[role]), message
+            )
 
             logger.info(
                 f"Broadcasted message to company {company} role {role}: {message}"
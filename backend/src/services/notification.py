@@ -1,10 +1,22 @@
+from collections import deque
 from datetime import datetime
-from typing import Optional, Dict, Any
+from itertools import islice
+from typing import Optional, Dict, Any, Deque, Iterable, List, Tuple
 from pydantic import BaseModel, Field
+import bisect
+import heapq
 import logging
+import time
+from src.config.users import get_user_by_username
+from src.core.bitmap import Bitmap
+from src.core.config import settings
+from src.core.ids import id_at, id_generator
 
 logger = logging.getLogger(__name__)
 
+# Owner of notifications sent to every user
+BROADCAST_USER = "all"
+
 
 class Notification(BaseModel):
     id: str
@@ -15,14 +27,125 @@ class Notification(BaseModel):
     created_at: str = Field(default_factory=lambda: datetime.now().isoformat())
     read: bool = False
     data: Optional[Dict[str, Any]] = None
+    collapse_key: Optional[str] = None
 
     class Config:
         json_encoders = {datetime: lambda dt: dt.isoformat()}
 
 
+class FeedDelta(BaseModel):
+    version: int
+    full: bool = False
+    upserted: List[Notification] = []
+    deleted: List[str] = []
+
+
 class NotificationService:
-    def __init__(self):
+    def __init__(self, changelog_size: int = settings.FEED_CHANGELOG_SIZE):
         self.notifications: Dict[str, Notification] = {}
+        # user_id -> notification ids in creation order (dict used as an ordered set)
+        self.user_index: Dict[str, Dict[str, None]] = {}
+        # user_id -> the same ids sorted; ids sort by creation time, so id and
+        # time ranges are bisected. A collapsed notification gets a new id,
+        # so it moves to the time of its latest version.
+        self.id_index: Dict[str, List[str]] = {}
+        # user_id -> number of unread notifications, kept up to date incrementally
+        self.unread_counts: Dict[str, int] = {}
+        # (user_id, collapse_key) -> id of the stored notification for that key
+        self.collapse_index: Dict[Tuple[str, str], str] = {}
+
+        # Feed versions come from one counter seeded from the clock, so they
+        # keep increasing across restarts and never repeat an old ETag
+        self.boot_version = int(time.time() * 1000)
+        self._version = self.boot_version
+        self.changelog_size = changelog_size
+        # user_id -> version of the last change to that user's feed
+        self.feed_versions: Dict[str, int] = {}
+        # user_id -> recent changes as (version, notification_id, deleted)
+        self.changelogs: Dict[str, Deque[Tuple[int, str, bool]]] = {}
+        # user_id -> newest version no longer covered by the changelog
+        self.changelog_floor: Dict[str, int] = {}
+
+        # Broadcasts are stored once. Per-recipient state lives in bitmaps
+        # over dense user numbers: one bit per user instead of one copy.
+        self.broadcasts: Dict[str, Notification] = {}
+        self.broadcast_read: Dict[str, Bitmap] = {}
+        self.broadcast_deleted: Dict[str, Bitmap] = {}
+        self.broadcast_ids: List[str] = []  # sorted
+        # user_id -> dense number and back, assigned on a known user's first
+        # change; numbers are never freed, so unknown ids don't get one
+        self.user_numbers: Dict[str, int] = {}
+        self.numbered_users: List[str] = []
+        # user_id -> stored broadcasts the user has read or deleted
+        self.broadcasts_done: Dict[str, int] = {}
+        # Creating or removing a broadcast changes every feed at once
+        self.broadcast_version = self.boot_version
+        self.broadcast_changelog: Deque[Tuple[int, str, bool]] = deque()
+        self.broadcast_changelog_floor = self.boot_version
+
+    def _record_change(self, user_id: str, notification_id: str, deleted: bool):
+        self._version += 1
+        self.feed_versions[user_id] = self._version
+        changelog = self.changelogs.setdefault(user_id, deque())
+        changelog.append((self._version, notification_id, deleted))
+        if len(changelog) > self.changelog_size:
+            self.changelog_floor[user_id] = changelog.popleft()[0]
+
+    def _record_broadcast_change(self, notification_id: str, deleted: bool):
+        self._version += 1
+        self.broadcast_version = self._version
+        self.broadcast_changelog.append((self._version, notification_id, deleted))
+        if len(self.broadcast_changelog) > self.changelog_size:
+            self.broadcast_changelog_floor = self.broadcast_changelog.popleft()[0]
+
+    def get_feed_version(self, user_id: str) -> int:
+        return max(
+            self.feed_versions.get(user_id, self.boot_version), self.broadcast_version
+        )
+
+    def get_feed_changes(self, user_id: str, since_version: int) -> FeedDelta:
+        """Notifications created, read or deleted after since_version"""
+        version = self.get_feed_version(user_id)
+        floor = max(
+            self.changelog_floor.get(user_id, self.boot_version),
+            self.broadcast_changelog_floor,
+        )
+        if since_version < floor or since_version > version:
+            # The changelog can't answer this, the client has to resync
+            return FeedDelta(
+                version=version,
+                full=True,
+                upserted=self.get_user_notifications(user_id),
+            )
+
+        changes: Dict[str, bool] = {}
+        # Newest first across the user's own and the broadcast changelog
+        for change_version, notification_id, deleted in heapq.merge(
+            reversed(self.changelogs.get(user_id, ())),
+            reversed(self.broadcast_changelog),
+            reverse=True,
+        ):
+            if change_version <= since_version:
+                break
+            changes.setdefault(notification_id, deleted)
+
+        upserted = []
+        deleted_ids = []
+        number = self.user_numbers.get(user_id)
+        for notification_id, deleted in changes.items():
+            broadcast = self.broadcasts.get(notification_id)
+            if broadcast is not None and not deleted:
+                if number is not None and number in self.broadcast_deleted[broadcast.id]:
+                    deleted_ids.append(notification_id)
+                else:
+                    upserted.append(self._broadcast_view(broadcast, user_id, number))
+                continue
+            notification = self.notifications.get(notification_id)
+            if deleted or notification is None:
+                deleted_ids.append(notification_id)
+            else:
+                upserted.append(notification)
+        return FeedDelta(version=version, upserted=upserted, deleted=deleted_ids)
 
     def create_notification(
         self,
@@ -31,41 +154,370 @@ class NotificationService:
         message: str,
         type: str = "info",
         data: Optional[Dict[str, Any]] = None,
+        collapse_key: Optional[str] = None,
     ) -> Notification:
         notification = Notification(
-            id=f"notif_{datetime.now().timestamp()}",
+            id=id_generator.next_id("notif_"),
             user_id=user_id,
             title=title,
             message=message,
             type=type,
             data=data,
+            collapse_key=collapse_key,
         )
+        if collapse_key is not None:
+            # A newer notification with the same collapse key supersedes the
+            # stored one. It takes a new id so id and time range queries see
+            # the update; delta sync reports the old id as deleted.
+            existing_id = self.collapse_index.get((user_id, collapse_key))
+            if existing_id is not None:
+                self._remove(self.notifications[existing_id])
+                self._record_change(user_id, existing_id, deleted=True)
         self.notifications[notification.id] = notification
+        self.user_index.setdefault(user_id, {})[notification.id] = None
+        bisect.insort(self.id_index.setdefault(user_id, []), notification.id)
+        self.unread_counts[user_id] = self.unread_counts.get(user_id, 0) + 1
+        if collapse_key is not None:
+            self.collapse_index[(user_id, collapse_key)] = notification.id
+        self._record_change(user_id, notification.id, deleted=False)
         logger.info(f"Created notification {notification.id} for user {user_id}")
         return notification
 
-    def get_user_notifications(self, user_id: str) -> list[Notification]:
+    def create_broadcast(
+        self,
+        title: str,
+        message: str,
+        type: str = "info",
+        data: Optional[Dict[str, Any]] = None,
+        collapse_key: Optional[str] = None,
+    ) -> Notification:
+        """Store a notification for every user once, unread for all of them"""
+        notification = Notification(
+            id=id_generator.next_id("notif_"),
+            user_id=BROADCAST_USER,
+            title=title,
+            message=message,
+            type=type,
+            data=data,
+            collapse_key=collapse_key,
+        )
+        if collapse_key is not None:
+            existing_id = self.collapse_index.get((BROADCAST_USER, collapse_key))
+            if existing_id is not None:
+                self._remove_broadcast(self.broadcasts[existing_id])
+                self._record_broadcast_change(existing_id, deleted=True)
+        self.broadcasts[notification.id] = notification
+        self.broadcast_read[notification.id] = Bitmap()
+        self.broadcast_deleted[notification.id] = Bitmap()
+        bisect.insort(self.broadcast_ids, notification.id)
+        if collapse_key is not None:
+            self.collapse_index[(BROADCAST_USER, collapse_key)] = notification.id
+        self._record_broadcast_change(notification.id, deleted=False)
+        logger.info(f"Created broadcast notification {notification.id}")
+        return notification
+
+    def _user_number(self, user_id: str) -> Optional[int]:
+        """The user's number, None for users not in the directory"""
+        number = self.user_numbers.get(user_id)
+        if number is None:
+            if get_user_by_username(user_id) is None:
+                return None
+            number = self._assign_number(user_id)
+        return number
+
+    def _assign_number(self, user_id: str) -> int:
+        number = self.user_numbers[user_id] = len(self.numbered_users)
+        self.numbered_users.append(user_id)
+        return number
+
+    def _broadcast_view(
+        self, broadcast: Notification, user_id: str, number: Optional[int]
+    ) -> Notification:
+        """A broadcast as seen by one user, with that user's read flag"""
+        return broadcast.model_copy(
+            update={
+                "user_id": user_id,
+                "read": number is not None
+                and number in self.broadcast_read[broadcast.id],
+            }
+        )
+
+    def _user_broadcasts(self, user_id: str) -> List[Notification]:
+        number = self.user_numbers.get(user_id)
         return [
-            notification
-            for notification in self.notifications.values()
-            if notification.user_id == user_id
+            self._broadcast_view(broadcast, user_id, number)
+            for broadcast in self.broadcasts.values()
+            if number is None or number not in self.broadcast_deleted[broadcast.id]
+        ]
+
+    def has_read(self, notification_id: str, user_id: str) -> bool:
+        broadcast = self.broadcasts.get(notification_id)
+        if broadcast is not None:
+            number = self.user_numbers.get(user_id)
+            return number is not None and number in self.broadcast_read[broadcast.id]
+        notification = self.notifications.get(notification_id)
+        return (
+            notification is not None
+            and notification.user_id == user_id
+            and notification.read
+        )
+
+    def get_user_notifications(self, user_id: str) -> list[Notification]:
+        if user_id == BROADCAST_USER:
+            return list(self.broadcasts.values())
+        own = [
+            self.notifications[notification_id]
+            for notification_id in self.user_index.get(user_id, ())
         ]
+        broadcasts = self._user_broadcasts(user_id)
+        if not broadcasts:
+            return own
+        # Both are in creation order
+        return list(heapq.merge(own, broadcasts, key=lambda n: n.created_at))
+
+    def find_notifications(
+        self,
+        user_id: str,
+        after_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: Optional[int] = None,
+    ) -> List[Notification]:
+        """Notifications with an id after after_id, created within [since, until],
+        oldest first. Bounds are bisected in the sorted id indexes.
+        """
+        low = []
+        if after_id is not None:
+            # Nothing sorts between an id and the id followed by a space
+            low.append(after_id + " ")
+        if since is not None:
+            low.append(id_at(since, "notif_"))
+        low = max(low) if low else None
+        # The first id of the next millisecond
+        high = id_at(until.timestamp() + 0.001, "notif_") if until is not None else None
+
+        broadcasts = (
+            self.broadcasts[notification_id]
+            for notification_id in sorted_range(self.broadcast_ids, low, high)
+        )
+        if user_id == BROADCAST_USER:
+            return list(islice(broadcasts, limit))
+
+        number = self.user_numbers.get(user_id)
+        visible = (
+            self._broadcast_view(broadcast, user_id, number)
+            for broadcast in broadcasts
+            if number is None or number not in self.broadcast_deleted[broadcast.id]
+        )
+        own = (
+            self.notifications[notification_id]
+            for notification_id in sorted_range(self.id_index.get(user_id, []), low, high)
+        )
+        return list(islice(heapq.merge(own, visible, key=lambda n: n.id), limit))
+
+    def get_broadcast_stats(self) -> dict:
+        return {
+            "broadcasts": len(self.broadcasts),
+            "numbered_users": len(self.numbered_users),
+            "state_bytes": sum(
+                bitmap.nbytes()
+                for bitmaps in (self.broadcast_read, self.broadcast_deleted)
+                for bitmap in bitmaps.values()
+            ),
+        }
+
+    def get_unread_count(self, user_id: str) -> int:
+        unread_broadcasts = len(self.broadcasts) - self.broadcasts_done.get(user_id, 0)
+        return self.unread_counts.get(user_id, 0) + unread_broadcasts
+
+    def _mark_broadcast_read(self, notification_id: str, user_id: str) -> bool:
+        number = self._user_number(user_id)
+        if number is None or number in self.broadcast_deleted[notification_id]:
+            return False
+        if not self.broadcast_read[notification_id].add(number):
+            return False
+        self.broadcasts_done[user_id] = self.broadcasts_done.get(user_id, 0) + 1
+        self._record_change(user_id, notification_id, deleted=False)
+        return True
+
+    def _delete_broadcast_for(self, notification_id: str, user_id: str) -> bool:
+        """Hide a broadcast from one user"""
+        number = self._user_number(user_id)
+        if number is None or not self.broadcast_deleted[notification_id].add(number):
+            return False
+        if number not in self.broadcast_read[notification_id]:
+            self.broadcasts_done[user_id] = self.broadcasts_done.get(user_id, 0) + 1
+        self._record_change(user_id, notification_id, deleted=True)
+        return True
+
+    def _remove_broadcast(self, broadcast: Notification):
+        """Drop a broadcast for everyone"""
+        del self.broadcasts[broadcast.id]
+        remove_sorted(self.broadcast_ids, broadcast.id)
+        read = self.broadcast_read.pop(broadcast.id)
+        deleted = self.broadcast_deleted.pop(broadcast.id)
+        done = set(read)
+        done.update(deleted)
+        for number in done:
+            user_id = self.numbered_users[number]
+            self.broadcasts_done[user_id] -= 1
+            if not self.broadcasts_done[user_id]:
+                del self.broadcasts_done[user_id]
+        if broadcast.collapse_key is not None:
+            self.collapse_index.pop((BROADCAST_USER, broadcast.collapse_key), None)
 
-    def mark_as_read(self, notification_id: str) -> Optional[Notification]:
+    def _mark_read(self, notification: Notification) -> bool:
+        if notification.id in self.broadcasts:
+            # The shared record itself is never read, only per-user views
+            if notification.user_id == BROADCAST_USER:
+                return False
+            return self._mark_broadcast_read(notification.id, notification.user_id)
+        if notification.read:
+            return False
+        notification.read = True
+        self.unread_counts[notification.user_id] -= 1
+        self._record_change(notification.user_id, notification.id, deleted=False)
+        return True
+
+    def _remove(self, notification: Notification):
+        del self.notifications[notification.id]
+        user_ids = self.user_index.get(notification.user_id)
+        if user_ids is not None:
+            user_ids.pop(notification.id, None)
+            if not user_ids:
+                del self.user_index[notification.user_id]
+        sorted_ids = self.id_index.get(notification.user_id)
+        if sorted_ids is not None:
+            remove_sorted(sorted_ids, notification.id)
+            if not sorted_ids:
+                del self.id_index[notification.user_id]
+        if not notification.read:
+            self.unread_counts[notification.user_id] -= 1
+        if not self.unread_counts.get(notification.user_id):
+            self.unread_counts.pop(notification.user_id, None)
+        if notification.collapse_key is not None:
+            self.collapse_index.pop(
+                (notification.user_id, notification.collapse_key), None
+            )
+
+    def _user_notifications(self, user_id: str, notification_ids: Iterable[str]):
+        user_ids = self.user_index.get(user_id, {})
+        number = self.user_numbers.get(user_id)
+        for notification_id in set(notification_ids):
+            if notification_id in user_ids:
+                yield self.notifications[notification_id]
+            elif notification_id in self.broadcasts:
+                if number is None or number not in self.broadcast_deleted[notification_id]:
+                    yield self._broadcast_view(
+                        self.broadcasts[notification_id], user_id, number
+                    )
+
+    def mark_as_read(
+        self, notification_id: str, user_id: Optional[str] = None
+    ) -> Optional[Notification]:
+        """Mark a notification as read; broadcasts are read per user"""
+        broadcast = self.broadcasts.get(notification_id)
+        if broadcast is not None:
+            if user_id is None:
+                raise ValueError("user_id is required to mark a broadcast as read")
+            number = self._user_number(user_id)
+            if number is None:
+                return None
+            self._mark_broadcast_read(notification_id, user_id)
+            logger.info(f"Marked broadcast {notification_id} as read for {user_id}")
+            return self._broadcast_view(broadcast, user_id, number)
         if notification_id in self.notifications:
             notification = self.notifications[notification_id]
-            notification.read = True
+            self._mark_read(notification)
             logger.info(f"Marked notification {notification_id} as read")
             return notification
         return None
 
-    def delete_notification(self, notification_id: str) -> bool:
+    def mark_all_as_read(self, user_id: str) -> int:
+        check_reader(user_id)
+        if not self.get_unread_count(user_id):
+            return 0
+        updated = sum(
+            self._mark_read(notification)
+            for notification in self.get_user_notifications(user_id)
+        )
+        logger.info(f"Marked {updated} notifications as read for user {user_id}")
+        return updated
+
+    def mark_many_as_read(self, user_id: str, notification_ids: Iterable[str]) -> int:
+        check_reader(user_id)
+        updated = sum(
+            self._mark_read(notification)
+            for notification in self._user_notifications(user_id, notification_ids)
+        )
+        logger.info(f"Marked {updated} notifications as read for user {user_id}")
+        return updated
+
+    def mark_read_until(self, user_id: str, until: datetime) -> int:
+        """Mark notifications created at or before `until` as read"""
+        check_reader(user_id)
+        if until.tzinfo is not None:
+            # created_at is stored as naive local time
+            until = until.astimezone().replace(tzinfo=None)
+        updated = 0
+        # The index is in creation order, so stop at the first newer notification
+        for notification in self.get_user_notifications(user_id):
+            if datetime.fromisoformat(notification.created_at) > until:
+                break
+            updated += self._mark_read(notification)
+        logger.info(f"Marked {updated} notifications as read for user {user_id}")
+        return updated
+
+    def delete_notification(
+        self, notification_id: str, user_id: Optional[str] = None
+    ) -> bool:
+        """Delete a notification; a broadcast only for user_id when given"""
+        broadcast = self.broadcasts.get(notification_id)
+        if broadcast is not None:
+            if user_id is not None:
+                return self._delete_broadcast_for(notification_id, user_id)
+            self._remove_broadcast(broadcast)
+            self._record_broadcast_change(notification_id, deleted=True)
+            logger.info(f"Deleted broadcast {notification_id}")
+            return True
         if notification_id in self.notifications:
-            del self.notifications[notification_id]
+            notification = self.notifications[notification_id]
+            self._remove(notification)
+            self._record_change(notification.user_id, notification_id, deleted=True)
             logger.info(f"Deleted notification {notification_id}")
             return True
         return False
 
+    def delete_many(self, user_id: str, notification_ids: Iterable[str]) -> int:
+        deleted = 0
+        for notification in list(self._user_notifications(user_id, notification_ids)):
+            if notification.id in self.broadcasts:
+                deleted += self._delete_broadcast_for(notification.id, user_id)
+                continue
+            self._remove(notification)
+            self._record_change(user_id, notification.id, deleted=True)
+            deleted += 1
+        logger.info(f"Deleted {deleted} notifications for user {user_id}")
+        return deleted
+
+
+def check_reader(user_id: str):
+    if user_id == BROADCAST_USER:
+        raise ValueError("Broadcasts are read per user, not for all users at once")
+
+
+def remove_sorted(ids: List[str], notification_id: str):
+    index = bisect.bisect_left(ids, notification_id)
+    if index < len(ids) and ids[index] == notification_id:
+        del ids[index]
+
+
+def sorted_range(ids: List[str], low: Optional[str], high: Optional[str]) -> List[str]:
+    """Ids in [low, high), None meaning unbounded"""
+    start = bisect.bisect_left(ids, low) if low is not None else 0
+    end = bisect.bisect_left(ids, high) if high is not None else len(ids)
+    return ids[start:end]
+
 
 # Create a global instance
 notification_service = NotificationService()
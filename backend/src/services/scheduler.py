@@ -0,0 +1,248 @@
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from pydantic import BaseModel, Field
+import asyncio
+import heapq
+import json
+import logging
+import os
+import time
+import uuid
+from src.core.admission import TokenBucket
+from src.core.config import settings
+from src.core.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class ScheduledItem(BaseModel):
+    id: str = Field(default_factory=lambda: f"sched_{uuid.uuid4().hex}")
+    kind: str
+    payload: Dict[str, Any]
+    send_at: float  # unix timestamp
+    created_at: str = Field(default_factory=lambda: datetime.now().isoformat())
+
+
+def resolve_send_at(
+    send_at: Optional[datetime] = None, delay_seconds: Optional[float] = None
+) -> Optional[float]:
+    """Return the unix timestamp to deliver at, or None to deliver now"""
+    if send_at is not None and delay_seconds is not None:
+        raise ValueError("Provide either send_at or delay_seconds, not both")
+    if delay_seconds is not None:
+        if delay_seconds < 0:
+            raise ValueError("delay_seconds must not be negative")
+        due = time.time() + delay_seconds
+    elif send_at is not None:
+        if send_at.tzinfo is None:
+            send_at = send_at.astimezone()
+        due = send_at.timestamp()
+    else:
+        return None
+    return due if due > time.time() else None
+
+
+class ScheduleService:
+    """Deadline heap of delayed deliveries, released at a smoothed rate.
+
+    Handlers are registered per kind by the API modules; an item's payload
+    is passed to its handler when it becomes due. Cancelled items are
+    removed from the index and skipped lazily when they reach the top of
+    the heap.
+
+    With a store path, changes mark the store dirty and a flusher rewrites
+    it in a thread at most once per persist_delay, so a burst of schedules,
+    cancels and releases costs one write and never blocks the event loop.
+    Changes within persist_delay of a crash are lost.
+    """
+
+    def __init__(
+        self,
+        release_rate: float = settings.SCHEDULER_RELEASE_RATE,
+        release_burst: int = settings.SCHEDULER_RELEASE_BURST,
+        store_path: Optional[str] = settings.SCHEDULER_STORE_PATH,
+        persist_delay: float = settings.SCHEDULER_PERSIST_DELAY_SECONDS,
+    ):
+        self.release_rate = release_rate
+        self.release_burst = release_burst
+        self.store_path = store_path
+        self.persist_delay = persist_delay
+
+        self.handlers: Dict[str, Handler] = {}
+        self.items: Dict[str, ScheduledItem] = {}
+        self.heap: List[tuple] = []
+        self.wakeup = asyncio.Event()
+        self.worker: Optional[asyncio.Task] = None
+        self.released = 0
+
+        self.dirty = asyncio.Event()
+        self.flusher: Optional[asyncio.Task] = None
+        self.write: Optional[asyncio.Future] = None
+        self.writes = 0
+
+    def register(self, kind: str, handler: Handler):
+        self.handlers[kind] = handler
+
+    def schedule(
+        self, kind: str, payload: Dict[str, Any], send_at: float
+    ) -> ScheduledItem:
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for {kind}")
+        item = ScheduledItem(kind=kind, payload=payload, send_at=send_at)
+        self._push(item)
+        self._mark_dirty()
+        logger.info(
+            f"Scheduled {kind} {item.id} for "
+            f"{datetime.fromtimestamp(send_at, timezone.utc).isoformat()}"
+        )
+        return item
+
+    def _push(self, item: ScheduledItem):
+        self.items[item.id] = item
+        heapq.heappush(self.heap, (item.send_at, item.id))
+        # Wake the worker in case this item is due before the current head
+        self.wakeup.set()
+
+    def cancel(self, item_id: str) -> bool:
+        if self.items.pop(item_id, None) is None:
+            return False
+        self._mark_dirty()
+        logger.info(f"Cancelled scheduled item {item_id}")
+        return True
+
+    def get(self, item_id: str) -> Optional[ScheduledItem]:
+        return self.items.get(item_id)
+
+    def list_items(self) -> List[ScheduledItem]:
+        return sorted(self.items.values(), key=lambda item: item.send_at)
+
+    def start(self):
+        self._load()
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for task in (self.worker, self.flusher):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self.worker = None
+        self.flusher = None
+        if self.write is not None and not self.write.done():
+            try:
+                await self.write
+            except Exception:
+                pass
+        if self.dirty.is_set():
+            await self._flush()
+
+    async def _run(self):
+        bucket = TokenBucket(self.release_rate, self.release_burst, time.monotonic())
+        while True:
+            # Drop cancelled entries sitting on top of the heap
+            while self.heap and self.heap[0][1] not in self.items:
+                heapq.heappop(self.heap)
+
+            self.wakeup.clear()
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+
+            delay = self.heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Pace releases so items due at the same instant don't spike fan-out
+            wait = bucket.consume(time.monotonic())
+            if wait:
+                await asyncio.sleep(wait)
+                continue
+
+            _, item_id = heapq.heappop(self.heap)
+            item = self.items.pop(item_id, None)
+            if item is None:
+                continue
+            self._mark_dirty()
+            await self._release(item)
+
+    async def _release(self, item: ScheduledItem):
+        try:
+            with tracer.trace(f"scheduled {item.kind}", schedule_id=item.id):
+                await self.handlers[item.kind](item.payload)
+            self.released += 1
+            lateness = time.time() - item.send_at
+            logger.info(
+                f"Released scheduled {item.kind} {item.id} ({lateness:.3f}s late)"
+            )
+        except Exception as e:
+            logger.error(f"Error releasing scheduled item {item.id}: {e}")
+
+    def _mark_dirty(self):
+        if not self.store_path:
+            return
+        self.dirty.set()
+        if self.flusher is None or self.flusher.done():
+            self.flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await self.dirty.wait()
+            # Let the changes of a burst pile up into one write
+            await asyncio.sleep(self.persist_delay)
+            await self._flush()
+
+    async def _flush(self):
+        self.dirty.clear()
+        # Items are never modified, a shallow copy is a consistent snapshot
+        items = list(self.items.values())
+        loop = asyncio.get_running_loop()
+        self.write = loop.run_in_executor(None, self._write, items)
+        try:
+            # Shielded so a cancelled flusher leaves the write for stop() to await
+            await asyncio.shield(self.write)
+            self.writes += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error persisting scheduled items: {e}")
+
+    def _write(self, items: List[ScheduledItem]):
+        tmp_path = f"{self.store_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump([item.dict() for item in items], f)
+        os.replace(tmp_path, self.store_path)
+
+    def _load(self):
+        if not self.store_path or not os.path.exists(self.store_path):
+            return
+        try:
+            with open(self.store_path) as f:
+                items = [ScheduledItem(**data) for data in json.load(f)]
+            for item in items:
+                if item.id not in self.items:
+                    self._push(item)
+            logger.info(f"Loaded {len(items)} scheduled items from {self.store_path}")
+        except Exception as e:
+            logger.error(f"Error loading scheduled items: {e}")
+
+    def get_stats(self) -> dict:
+        next_due = min((item.send_at for item in self.items.values()), default=None)
+        return {
+            "scheduled": len(self.items),
+            "released": self.released,
+            "store_writes": self.writes,
+            "next_due_in": round(next_due - time.time(), 3) if next_due else None,
+        }
+
+
+# Create a global instance
+schedule_service = ScheduleService()